@@ -0,0 +1,293 @@
+import os
+import socket
+import threading
+import time
+import uuid
+import psycopg2
+
+from auth.database import Database
+from auth.ratelimit import rate_limiter
+
+# Deletions this process has started a thread for, keyed by user ID. Progress itself lives
+# in the account_deletions table, so every worker process can report it.
+deletion_jobs = {}
+jobs_lock = threading.Lock()
+
+# Seconds without a heartbeat after which a running job is taken to have died, and another
+# process may claim the account
+CLAIM_LEASE = float(os.getenv("account_deletion_lease_seconds", "300"))
+
+PROGRESS_COLUMNS = (
+    "user_id, status, total_snippets, deleted_snippets, "
+    "EXTRACT(EPOCH FROM started_at)::float, EXTRACT(EPOCH FROM finished_at)::float, error"
+)
+
+
+class ActiveUsers:
+    """
+    Remembers for ttl seconds which users were found to exist and not be disabled, so
+    authenticated requests only look the account up once in a while. A disabled account's
+    tokens stop working at once in the process that disabled it, and within ttl elsewhere.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.checked = {}  # User ID to when the account was last found active
+        self.lock = threading.Lock()
+
+    def cached(self, user_id):
+        checked = self.checked.get(user_id)
+        return checked is not None and time.monotonic() - checked < self.ttl
+
+    def remember(self, user_id):
+        now = time.monotonic()
+        with self.lock:
+            if len(self.checked) > 10000:
+                self.checked = {
+                    user: checked
+                    for user, checked in self.checked.items()
+                    if now - checked < self.ttl
+                }
+            self.checked[user_id] = now
+
+    def forget(self, user_id):
+        with self.lock:
+            self.checked.pop(user_id, None)
+
+
+active_users = ActiveUsers(float(os.getenv("active_user_cache_seconds", "10")))
+
+
+class ClaimLost(Exception):
+    """Another process took over an account deletion whose heartbeat had expired."""
+
+
+class AccountDeletion(Database):
+    """
+    Purges a disabled account in the background on its own connection.
+
+    Snippets are deleted in small id-ordered chunks, each in its own short transaction, so
+    no long-lived locks are held and other database users are never blocked for long.
+    The users row goes last, so a job interrupted by a restart can simply be started again.
+
+    A job first claims the account's account_deletions row in a single statement, so when
+    every worker process resumes deletions at startup only one of them purges each account,
+    even behind a transaction pooler. Progress and a heartbeat are written to the row after
+    every chunk; a job that finds its claim taken over stops.
+    """
+
+    def __init__(self, user_id, chunk_size=500, pause=0.05):
+        super().__init__()
+        self.user_id = user_id
+        self.chunk_size = chunk_size
+        self.pause = pause  # Seconds to yield to other queries between chunks
+        self.claim_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.progress = {
+            "user_id": user_id,
+            "status": "pending",
+            "total_snippets": None,
+            "deleted_snippets": 0,
+            "started_at": time.time(),
+            "finished_at": None,
+            "error": None,
+        }
+
+    def delete_chunk(self, table, key_column):
+        """
+        Delete up to chunk_size of the user's rows from a table and commit.
+
+        Returns:
+            int: Number of rows deleted.
+        """
+        self.cursor.execute(
+            f"DELETE FROM {table} WHERE {key_column} IN ("
+            f"SELECT {key_column} FROM {table} WHERE user_id = %s "
+            f"ORDER BY {key_column} LIMIT %s)",
+            (self.user_id, self.chunk_size),
+        )
+        deleted = self.cursor.rowcount
+        self.connection.commit()
+        return deleted
+
+    def claim(self):
+        """
+        Mark the account's job as running under this job's claim_id. The row is created if
+        the account was disabled before account_deletions existed.
+
+        Returns:
+            bool: Whether this job claimed the account. False if it is already purged, or
+            another process is purging it and its heartbeat is within the lease.
+        """
+        self.cursor.execute(
+            "INSERT INTO account_deletions AS d (user_id, status, claimed_by, "
+            "heartbeat_at) VALUES (%s, 'running', %s, now()) "
+            "ON CONFLICT (user_id) DO UPDATE SET status = 'running', "
+            "claimed_by = EXCLUDED.claimed_by, heartbeat_at = now(), "
+            "started_at = now(), finished_at = NULL, error = NULL "
+            "WHERE d.status IN ('pending', 'failed') OR (d.status = 'running' "
+            "AND d.heartbeat_at < now() - make_interval(secs => %s)) "
+            "RETURNING 1",
+            (self.user_id, self.claim_id, CLAIM_LEASE),
+        )
+        claimed = self.cursor.fetchone() is not None
+        self.connection.commit()
+        return claimed
+
+    def save_progress(self):
+        """
+        Write progress and refresh the heartbeat, as long as this job still holds the claim.
+
+        Raises:
+            ClaimLost: Another process claimed the account after this job's lease ran out.
+        """
+        self.cursor.execute(
+            "UPDATE account_deletions SET status = %s, total_snippets = %s, "
+            "deleted_snippets = %s, error = %s, heartbeat_at = now(), "
+            "finished_at = CASE WHEN %s THEN now() END "
+            "WHERE user_id = %s AND claimed_by = %s",
+            (
+                self.progress["status"],
+                self.progress["total_snippets"],
+                self.progress["deleted_snippets"],
+                self.progress["error"],
+                self.progress["status"] in ("done", "failed"),
+                self.user_id,
+                self.claim_id,
+            ),
+        )
+        claimed = self.cursor.rowcount > 0
+        self.connection.commit()
+        if not claimed:
+            raise ClaimLost(f"Deletion of user {self.user_id} was claimed elsewhere")
+
+    def purge_caches(self):
+        """Drop in-memory state held for the user."""
+        rate_limiter.forget_user(self.user_id)
+
+    def purge(self):
+        """Delete the account's snippets, tombstones, bodies and finally the user row."""
+        self.cursor.execute(
+            "SELECT COUNT(*) FROM code_snippets WHERE user_id = %s",
+            (self.user_id,),
+        )
+        self.progress["total_snippets"] = self.cursor.fetchone()[0]
+        self.connection.commit()
+
+        while deleted := self.delete_chunk("code_snippets", "id"):
+            self.progress["deleted_snippets"] += deleted
+            self.save_progress()
+            time.sleep(self.pause)
+
+        while self.delete_chunk("snippet_tombstones", "snippet_id"):
+            time.sleep(self.pause)
+
+        # Catch snippets created while the purge ran, then remove the account itself
+        self.cursor.execute(
+            "DELETE FROM code_snippets WHERE user_id = %s", (self.user_id,)
+        )
+        self.progress["deleted_snippets"] += self.cursor.rowcount
+        # Deduplicated bodies, now that no snippet points at them
+        self.cursor.execute(
+            "DELETE FROM snippet_contents WHERE user_id = %s", (self.user_id,)
+        )
+        self.cursor.execute("DELETE FROM users WHERE id = %s", (self.user_id,))
+        self.connection.commit()
+
+    def run(self):
+        """
+        Run the deletion to completion, updating self.progress as it goes. Returns at once
+        if another process holds the claim on the account.
+        """
+        if self.connection is None:  # connect() already logged why
+            self.progress["status"] = "failed"
+            self.progress["error"] = "No database connection"
+            return
+        try:
+            if not self.claim():
+                self.progress["status"] = "claimed elsewhere"
+                self.close()
+                return
+        except psycopg2.Error as error:
+            self.connection.rollback()
+            self.close()
+            print(f"Account deletion for user {self.user_id} not started: {error}")
+            return
+
+        self.progress["status"] = "running"
+        try:
+            self.purge()
+            self.purge_caches()
+            self.progress["status"] = "done"
+        except ClaimLost as error:
+            self.progress["status"] = "claimed elsewhere"
+            print(error)
+        except psycopg2.Error as error:
+            self.connection.rollback()
+            self.progress["status"] = "failed"
+            self.progress["error"] = str(error)
+            print(f"Account deletion for user {self.user_id} failed: {error}")
+        finally:
+            self.progress["finished_at"] = time.time()
+            try:
+                if self.progress["status"] != "claimed elsewhere":
+                    self.save_progress()
+            except (psycopg2.Error, ClaimLost) as error:
+                self.connection.rollback()
+                print(f"Could not record deletion of user {self.user_id}: {error}")
+            self.close()
+
+
+def start_account_deletion(user_id):
+    """
+    Start purging a disabled account in a background thread, unless one is already running.
+
+    Requires:
+        user_id (int): The ID of a user whose account has been disabled.
+
+    Returns:
+        dict: The job's progress record.
+    """
+    with jobs_lock:
+        job = deletion_jobs.get(user_id)
+        if job and job["status"] in ("pending", "running"):
+            return job
+        active_users.forget(user_id)
+
+        deletion = AccountDeletion(user_id)
+        deletion_jobs[user_id] = deletion.progress
+
+    threading.Thread(
+        target=deletion.run, name=f"delete-user-{user_id}", daemon=True
+    ).start()
+    return deletion.progress
+
+
+def get_deletion_progress(user_id):
+    """
+    Read the progress of the user's deletion job, whichever process runs it. Blocking.
+
+    Returns:
+        dict: The job's progress, or None if none was started.
+    """
+    database = Database()
+    try:
+        database.cursor.execute(
+            f"SELECT {PROGRESS_COLUMNS} FROM account_deletions WHERE user_id = %s",
+            (user_id,),
+        )
+        row = database.cursor.fetchone()
+        database.connection.commit()
+    finally:
+        database.close()
+    if row is None:
+        return None
+    keys = (
+        "user_id",
+        "status",
+        "total_snippets",
+        "deleted_snippets",
+        "started_at",
+        "finished_at",
+        "error",
+    )
+    return dict(zip(keys, row))
@@ -1,41 +1,212 @@
 import psycopg2
+from psycopg2 import extensions, pool
 
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from offload import blocking
+from queries import PreparingConnection, registry
+from tracing import span
+
+# One pool per (host, port), shared by every Database in the process
+pools = {}
+pools_lock = threading.Lock()
+
+
+class ConnectionPool(pool.ThreadedConnectionPool):
+    """
+    A ThreadedConnectionPool that opens nothing up front and keeps every returned
+    connection (up to maxconn) instead of closing all but minconn of them, so statements
+    prepared on a connection stay prepared.
+
+    When every pooled connection is in use, up to `overflow` dedicated connections may be
+    opened on top, so the process never holds more than maxconn + overflow connections.
+    """
+
+    def __init__(self, maxconn, *args, overflow=0, **kwargs):
+        super().__init__(0, maxconn, *args, **kwargs)
+        self.minconn = maxconn  # psycopg2 closes returned connections beyond minconn
+        self.overflow = threading.BoundedSemaphore(overflow) if overflow else None
+
+    def acquire(self, timeout):
+        """
+        Check out a pooled connection, or a slot for a dedicated one, waiting up to
+        timeout seconds for either to free up.
+
+        Returns:
+            The pooled connection, or None if the caller may open a dedicated one (and
+            must call release_overflow() once it is closed).
+
+        Raises:
+            PoolError: Nothing freed up within timeout.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self.getconn()
+            except pool.PoolError:
+                if self.overflow is not None and self.overflow.acquire(blocking=False):
+                    return None
+                if time.monotonic() >= deadline:
+                    raise pool.PoolError(
+                        f"No database connection free within {timeout:g}s"
+                    )
+                time.sleep(0.01)
+
+    def release_overflow(self):
+        if self.overflow is not None:
+            self.overflow.release()
+
+    def open_idle(self):
+        connection = psycopg2.connect(*self._args, **self._kwargs)
+        with self._lock:
+            if len(self._pool) + len(self._used) < self.maxconn:
+                self._pool.append(connection)
+                return
+        connection.close()
+
+    def warm(self, count):
+        """
+        Open up to count idle connections in parallel, so the first requests after startup
+        do not each wait for a connection handshake.
+        """
+        count = min(count, self.maxconn) - len(self._pool)
+        if count > 0:
+            with ThreadPoolExecutor(max_workers=count) as executor:
+                for future in [executor.submit(self.open_idle) for _ in range(count)]:
+                    future.result()
 
 
 class Database:
-    def __init__(self, host="aws-0-eu-west-2.pooler.supabase.com", port="5432"):
+    def __init__(self, host=None, port=None, connect=True):
         """
-        Sets up database connection parameters and calls the connect() method.
+        Sets up database connection parameters and, unless connect is False, calls the
+        connect() method. The database_host/port/name/user environment variables point
+        the app at another Postgres, e.g. a local one for load tests.
         """
-        self.db_name = "postgres"
-        self.db_user = "postgres.rgxatektsqhjpjgmfncu"
+        self.db_name = os.getenv("database_name", "postgres")
+        self.db_user = os.getenv("database_user", "postgres.rgxatektsqhjpjgmfncu")
         self.db_password = os.getenv("database_password")
-        self.db_host = host
-        self.db_port = port
-        self.connect()
+        self.db_host = host or os.getenv(
+            "database_host", "aws-0-eu-west-2.pooler.supabase.com"
+        )
+        self.db_port = port or os.getenv("database_port", "5432")
+        self.connection = None
+        self.pooled = False
+        if connect:
+            self.connect()
+
+    def get_pool(self):
+        """
+        Returns the process-wide connection pool for this host, creating it on first use.
+        Holds at most db_pool_max connections, plus db_pool_overflow dedicated ones.
+        """
+        key = (self.db_host, self.db_port)
+        with pools_lock:
+            if key not in pools:
+                pools[key] = ConnectionPool(
+                    int(os.getenv("db_pool_max", "10")),
+                    overflow=int(os.getenv("db_pool_overflow", "5")),
+                    dbname=self.db_name,
+                    user=self.db_user,
+                    password=self.db_password,
+                    host=self.db_host,
+                    port=self.db_port,
+                    connection_factory=PreparingConnection,
+                )
+                print("Database connection pool created.")
+            return pools[key]
 
+    def warm_pool(self):
+        """
+        Pre-open db_pool_min pooled connections in parallel. Called once at app startup.
+        """
+        try:
+            self.get_pool().warm(int(os.getenv("db_pool_min", "1")))
+        except Exception as error:
+            print(f"Error warming up database pool: {error}")
+
+    @blocking("db")
     def connect(self):
         """
-        Establish a connection to the PostgreSQL database using the provided parameters.
+        Check out a connection to the PostgreSQL database from the pool. When every pooled
+        connection is in use, a dedicated connection is opened instead, up to
+        db_pool_overflow of them; beyond that, waits up to db_pool_timeout seconds
+        (default 5) for either to free up.
         """
         try:
-            self.connection = psycopg2.connect(
-                dbname=self.db_name,
-                user=self.db_user,
-                password=self.db_password,
-                host=self.db_host,
-                port=self.db_port,
-            )
-            self.cursor = self.connection.cursor()
-            print("Database connection established.")
+            with span("db_connect"):
+                connection_pool = self.get_pool()
+                connection = connection_pool.acquire(
+                    float(os.getenv("db_pool_timeout", "5"))
+                )
+                if connection is not None:
+                    self.connection = connection
+                    self.pooled = True
+                else:
+                    try:
+                        self.connection = psycopg2.connect(
+                            dbname=self.db_name,
+                            user=self.db_user,
+                            password=self.db_password,
+                            host=self.db_host,
+                            port=self.db_port,
+                            connection_factory=PreparingConnection,
+                        )
+                    except Exception:
+                        connection_pool.release_overflow()
+                        raise
+                    self.pooled = False
+                self.cursor = self.connection.cursor()
         except Exception as error:
             print(f"Error connecting to database: {error}")
 
+    def execute(self, name, params=()):
+        """
+        Run one of the fixed queries registered in queries.py on this connection's cursor.
+
+        Requires:
+            name (str): The query's name in QUERIES.
+            params (tuple): The query's parameters.
+        """
+        registry.execute(self.cursor, name, params)
+
+    def ping(self):
+        """
+        Returns:
+            bool: Whether the connection can run a query.
+        """
+        try:
+            self.cursor.execute("SELECT 1")
+            self.cursor.fetchone()
+            return True
+        except Exception:
+            return False
+
     def close(self):
         """
-        Close the database connection if it is open.
+        Return the connection to the pool, or close it if it was not pooled.
+        Any uncommitted transaction is rolled back first.
         """
-        if self.connection:
-            self.connection.close()
-            print("Database connection closed.")
+        connection, self.connection = self.connection, None
+        if not connection:
+            return
+
+        if not self.pooled:
+            connection.close()
+            pools[(self.db_host, self.db_port)].release_overflow()
+            return
+
+        broken = connection.closed
+        if not broken:
+            try:
+                if (
+                    connection.info.transaction_status
+                    != extensions.TRANSACTION_STATUS_IDLE
+                ):
+                    connection.rollback()
+            except psycopg2.Error:
+                broken = True
+        pools[(self.db_host, self.db_port)].putconn(connection, close=broken)
@@ -1,20 +1,236 @@
-from cryptography.fernet import Fernet
+from cryptography.exceptions import InvalidSignature
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from cryptography.hazmat.primitives import hashes, hmac, padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+import base64
 import os
+import zlib
+
+from offload import blocking
+from tracing import span
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, zlib is always available
+    zstandard = None
+
+# Values are stored in bytea columns as the raw (not base64) Fernet token, behind a single
+# codec byte when the payload was compressed. A raw token always starts with Fernet's
+# version byte 0x80, so the first byte tells the formats apart.
+FERNET_VERSION = 0x80
+ZLIB_CODEC = "zl"
+ZSTD_CODEC = "zs"
+CODEC_BYTES = {ZLIB_CODEC: 0x01, ZSTD_CODEC: 0x02}
+CODECS = {byte: codec for codec, byte in CODEC_BYTES.items()}
+
+# Older rows hold base64 text tokens, "<codec>:<token>" when compressed. Plain text tokens
+# always start with the base64 of the version byte.
+FERNET_PREFIX = "gAAAAA"
+
+# Raw token layout: version (1) | timestamp (8) | IV (16) | ciphertext | HMAC-SHA256 (32)
+HEADER_SIZE = 25
+HMAC_SIZE = 32
 
 
 class Encryption:
     def __init__(self):
-        self.fernet = Fernet(os.getenv("fernet_key"))
+        # New values are encrypted with fernet_key; values written under any key listed in
+        # fernet_old_keys (comma separated) stay readable until they have been rotated.
+        keys = [os.getenv("fernet_key")]
+        keys += [key for key in os.getenv("fernet_old_keys", "").split(",") if key]
+        self.primary = Fernet(keys[0])
+        self.fernet = MultiFernet([Fernet(key) for key in keys])
+        # (signing key, encryption key) pairs for decrypting raw tokens without base64
+        self.raw_keys = [
+            (raw[:16], raw[16:])
+            for raw in (base64.urlsafe_b64decode(key) for key in keys)
+        ]
+        # Payloads smaller than this (in bytes) are encrypted without compression
+        self.compress_threshold = int(os.getenv("compress_threshold", "1024"))
+        self.codec = os.getenv("compress_codec") or (
+            ZSTD_CODEC if zstandard else ZLIB_CODEC
+        )
+        if self.codec not in CODEC_BYTES:
+            raise ValueError(
+                f"Unknown compress_codec {self.codec!r}, expected "
+                f"{ZSTD_CODEC!r} or {ZLIB_CODEC!r}"
+            )
+        if self.codec == ZSTD_CODEC and zstandard is None:
+            self.codec = ZLIB_CODEC
+        # Keys content_digest(). Derived from fernet_key unless content_hash_key is set, which
+        # keeps digests (and so deduplication of existing bodies) stable across key rotations.
+        hash_key = os.getenv("content_hash_key")
+        if hash_key:
+            self.hash_key = hash_key.encode()
+        else:
+            derive = hmac.HMAC(self.raw_keys[0][0], hashes.SHA256())
+            derive.update(b"snippet content digest")
+            self.hash_key = derive.finalize()
+
+    def compress(self, data: bytes):
+        """
+        Compress a payload with the configured codec.
+
+        Returns:
+            tuple: (codec, compressed bytes), or (None, data) when compression does not help.
+        """
+        if len(data) < self.compress_threshold:
+            return None, data
 
+        if self.codec == ZSTD_CODEC:
+            compressed = zstandard.ZstdCompressor(level=3).compress(data)
+        else:
+            compressed = zlib.compress(data, 6)
+
+        if len(compressed) >= len(data):
+            return None, data
+        return self.codec, compressed
+
+    def decompress(self, codec, data: bytes):
+        if codec == ZLIB_CODEC:
+            return zlib.decompress(data)
+        if codec == ZSTD_CODEC:
+            if zstandard is None:
+                raise RuntimeError("zstandard is required to decrypt this value")
+            return zstandard.ZstdDecompressor().decompress(data)
+        raise ValueError(f"Unknown compression codec: {codec}")
+
+    @blocking("crypto")
     def encrypt(self, data):
-        if data is not None:
-            return self.fernet.encrypt(data.encode()).decode()
+        """
+        Encrypt a string for storage.
+
+        Returns:
+            bytes: The raw Fernet token, prefixed with a codec byte if it was compressed.
+        """
+        with span("crypto"):
+            if data is not None:
+                codec, payload = self.compress(data.encode())
+                token = base64.urlsafe_b64decode(self.primary.encrypt(payload))
+                return bytes([CODEC_BYTES[codec]]) + token if codec else token
+            return None
+
+    def content_digest(self, user_id, content):
+        """
+        A keyed hash of a snippet body, scoped to its owner: equal for identical bodies of the
+        same user, and unrelated across users, so stored digests reveal nothing about who else
+        has the same content.
+
+        Returns:
+            bytes: The 32-byte HMAC-SHA256 of the user id and content.
+        """
+        digest = hmac.HMAC(self.hash_key, hashes.SHA256())
+        digest.update(f"{user_id}:".encode())
+        digest.update(content.encode())
+        return digest.finalize()
+
+    def key_for(self, token, keys):
+        """
+        Returns:
+            bytes: The encryption key whose signing key authenticates the raw token, or None.
+        """
+        if len(token) < HEADER_SIZE + HMAC_SIZE or token[0] != FERNET_VERSION:
+            return None
+        for signing_key, encryption_key in keys:
+            signature = hmac.HMAC(signing_key, hashes.SHA256())
+            signature.update(token[:-HMAC_SIZE])
+            try:
+                signature.verify(bytes(token[-HMAC_SIZE:]))
+                return encryption_key
+            except InvalidSignature:
+                continue
         return None
 
-    def decrypt(self, token):
-        if token is not None:
+    def decrypt_raw(self, token):
+        """
+        Verify and decrypt a raw Fernet token straight from its buffer, without the
+        base64 and str copies the text format needs.
+
+        Requires:
+            token (memoryview): The raw token, without a codec byte.
+
+        Returns:
+            bytes: The payload.
+        """
+        encryption_key = self.key_for(token, self.raw_keys)
+        if encryption_key is None:
+            raise InvalidToken
+        decryptor = Cipher(
+            algorithms.AES(encryption_key), modes.CBC(token[9:HEADER_SIZE])
+        ).decryptor()
+        padded = decryptor.update(token[HEADER_SIZE:-HMAC_SIZE]) + decryptor.finalize()
+        unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+        return unpadder.update(padded) + unpadder.finalize()
+
+    def split(self, token):
+        """
+        Returns:
+            tuple: (codec or None, raw token as a memoryview) of a stored binary value.
+        """
+        view = memoryview(token)
+        if view and view[0] in CODECS:
+            return CODECS[view[0]], view[1:]
+        return None, view
+
+    def decrypt_text(self, token):
+        """Decrypt a legacy base64 text token."""
+        if token.startswith(FERNET_PREFIX):
             return self.fernet.decrypt(token.encode()).decode()
-        return None
+        codec, _, token = token.partition(":")
+        payload = self.fernet.decrypt(token.encode())
+        return self.decompress(codec, payload).decode()
+
+    @blocking("crypto")
+    def decrypt(self, token):
+        """
+        Decrypt a stored value: bytea (psycopg2 returns a memoryview), bytes, or a legacy
+        text token.
+        """
+        with span("crypto"):
+            if token is None:
+                return None
+            if isinstance(token, str):
+                return self.decrypt_text(token)
+
+            codec, raw = self.split(token)
+            if raw and raw[0] != FERNET_VERSION:
+                # A text token written into the bytea column by an older release
+                return self.decrypt_text(bytes(raw).decode("ascii"))
+            payload = self.decrypt_raw(raw)
+            if codec:
+                payload = self.decompress(codec, payload)
+            return payload.decode()
+
+    def rotate(self, token):
+        """
+        Re-encrypt a stored value under the primary key, keeping its compression codec.
+
+        Requires:
+            token: A value previously returned by encrypt(), or a legacy text token.
+
+        Returns:
+            bytes: The rotated value, or the original token if it is already binary and
+            uses the primary key.
+        """
+        if token is None:
+            return None
+
+        if not isinstance(token, str):
+            codec, raw = self.split(token)
+            if raw and raw[0] == FERNET_VERSION:
+                if self.key_for(raw, self.raw_keys[:1]):
+                    return token
+                payload = self.decrypt_raw(raw)
+                token = base64.urlsafe_b64decode(self.primary.encrypt(payload))
+                return bytes([CODEC_BYTES[codec]]) + token if codec else token
+            token = bytes(raw).decode("ascii")
+
+        if token.startswith(FERNET_PREFIX):
+            codec, body = None, token
+        else:
+            codec, _, body = token.partition(":")
+        token = base64.urlsafe_b64decode(self.fernet.rotate(body.encode()))
+        return bytes([CODEC_BYTES[codec]]) + token if codec else token
 
     # def encrypt_boolean(self, boolean_value):
     #     if boolean_value is not None:
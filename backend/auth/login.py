@@ -1,31 +1,59 @@
 import psycopg2
-import hashlib
 
 from auth.database import Database
 from auth.jwtAuth import jwtAuth
+from auth.passwords import PasswordHasher
+from auth.account_deletion import start_account_deletion
+from offload import blocking, run_io
 
 
 class LoginSystem(Database):
-    def __init__(self):
+    def __init__(self, connect=True):
         """
         Sets up the database connection and initializes JWT authentication.
+
+        The async methods (create_user, authenticate, change_password) check out a
+        connection for each database step with run_step, so construct the instance with
+        connect=False for them.
         """
-        super().__init__()
+        super().__init__(connect=connect)
         self.jwtAuth = jwtAuth()
+        self.hasher = PasswordHasher()
+
+    @blocking("db")
+    def run_step(self, step, *args, **kwargs):
+        """
+        Check out a connection, call step(*args, **kwargs), commit and return the connection
+        to the pool (rolled back if step raised). The async methods run every database step
+        this way, so no connection is held, or left idle in a transaction, while a password
+        is hashed. Blocking, so it is awaited with run_io.
+        """
+        self.connect()
+        try:
+            result = step(*args, **kwargs)
+            self.connection.commit()
+            return result
+        finally:
+            self.close()
+
+    def fetch_one(self, name, params):
+        self.execute(name, params)
+        return self.cursor.fetchone()
 
     def hash_password(self, password):
         """
-        Hash a password using SHA-256.
+        Hash a password with scrypt. Blocks for the duration of the KDF, so async callers
+        should use hasher.hash_async instead.
 
         Requires:
             password (str): The plain text password to hash.
 
         Returns:
-            str: The hashed password as a hexadecimal string.
+            str: The self-describing scrypt hash.
         """
-        return hashlib.sha256(password.encode()).hexdigest()
+        return self.hasher.hash(password)
 
-    def create_user(self, username, password):
+    async def create_user(self, username, password):
         """
         Create a new user in the database.
 
@@ -36,15 +64,13 @@ class LoginSystem(Database):
         Returns:
             dict: Success status and message or error.
         """
+        password_hash = await self.hasher.hash_async(password)
         try:
-            self.cursor.execute(
-                "INSERT INTO users (username, password) VALUES (%s, %s)",
-                (username, self.hash_password(password)),
+            await run_io(
+                self.run_step, self.execute, "create_user", (username, password_hash)
             )
-            self.connection.commit()
             return {"success": True, "message": "User created successfully!"}
         except psycopg2.IntegrityError as error:
-            self.connection.rollback()
             if "users_username_key" in str(error):
                 return {"success": False, "error": "Username already exists"}
             return {"success": False, "error": str(error)}
@@ -53,28 +79,79 @@ class LoginSystem(Database):
         """
         Delete a user from the database.
 
+        The account is disabled immediately; its snippets and the user row are then purged
+        by a background job in short chunked transactions (see auth/account_deletion.py).
+
         Requires:
             user_id (int): The user's ID.
 
         Returns:
-            dict: Success status and message or error.
+            dict: Success status, message and the deletion job's progress, or error.
         """
         try:
-            # First, delete all code snippets belonging to the user
-            self.cursor.execute("DELETE FROM code_snippets WHERE user_id = %s", (user_id,))
-            
-            # Then delete the user
-            self.cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
-            if self.cursor.rowcount > 0:
-                self.connection.commit()
-                return {"success": True, "message": "User deleted successfully!"}
-            else:
+            self.cursor.execute(
+                "UPDATE users SET disabled_at = COALESCE(disabled_at, now()) "
+                "WHERE id = %s",
+                (user_id,),
+            )
+            if self.cursor.rowcount == 0:
                 self.connection.rollback()
                 return {"success": False, "error": "User not found"}
+            self.cursor.execute(
+                "INSERT INTO account_deletions (user_id, status) VALUES (%s, 'pending') "
+                "ON CONFLICT (user_id) DO NOTHING",
+                (user_id,),
+            )
+            self.connection.commit()
         except psycopg2.Error as error:
             self.connection.rollback()
             return {"success": False, "error": str(error)}
 
+        return {
+            "success": True,
+            "message": "User scheduled for deletion",
+            "job": start_account_deletion(user_id),
+        }
+
+    def is_active(self, user_id):
+        """
+        Check that a user still exists and has not been disabled for deletion.
+
+        Requires:
+            user_id (int): The user's ID, taken from a valid token.
+
+        Returns:
+            bool: Whether the user's tokens should still be accepted.
+        """
+        self.execute("get_user_active", (user_id,))
+        row = self.cursor.fetchone()
+        self.connection.commit()
+        return bool(row and row[0])
+
+    def resume_account_deletions(self):
+        """
+        Restart deletion jobs for accounts that were disabled but never fully purged,
+        e.g. because the server restarted mid-deletion.
+
+        Returns:
+            int: Number of jobs started.
+        """
+        if self.connection is None:  # connect() already logged why
+            print("Could not resume account deletions: no database connection")
+            return 0
+        try:
+            self.cursor.execute("SELECT id FROM users WHERE disabled_at IS NOT NULL")
+            user_ids = [row[0] for row in self.cursor.fetchall()]
+            self.connection.commit()
+        except psycopg2.Error as error:
+            self.connection.rollback()
+            print("Could not resume account deletions:", error)
+            return 0
+
+        for user_id in user_ids:
+            start_account_deletion(user_id)
+        return len(user_ids)
+
     def get_dark_mode(self, user_id):
         """
         Get the dark mode preference for a user.
@@ -86,7 +163,7 @@ class LoginSystem(Database):
             dict: Success status and dark mode preference if found; otherwise, error.
         """
         try:
-            self.cursor.execute("SELECT dark_mode FROM users WHERE id = %s", (user_id,))
+            self.execute("get_dark_mode", (user_id,))
             result = self.cursor.fetchone()
             if result is not None:
                 return {"success": True, "dark_mode": result[0]}
@@ -106,7 +183,7 @@ class LoginSystem(Database):
             bool: Success status and AI usage status if found; otherwise, error.
         """
         try:
-            self.cursor.execute("SELECT use_ai FROM users WHERE id = %s", (user_id,))
+            self.execute("get_ai_use", (user_id,))
             result = self.cursor.fetchone()
             if result is not None:
                 return {"success": True, "ai_use": result[0]}
@@ -115,9 +192,10 @@ class LoginSystem(Database):
         except psycopg2.Error as error:
             return {"success": False, "error": f"Database error: {str(error)}"}
 
-    def authenticate(self, username, password):
+    async def authenticate(self, username, password):
         """
         Authenticate a user by username and password.
+        Legacy SHA-256 hashes are upgraded to scrypt after a successful login.
 
         Requires:
             username (str): The user's username.
@@ -127,13 +205,17 @@ class LoginSystem(Database):
             dict: Success status, message, JWT token, and user ID if successful; otherwise, error.
         """
         try:
-            self.cursor.execute(
-                "SELECT id, password FROM users WHERE username = %s", (username,)
+            result = await run_io(
+                self.run_step, self.fetch_one, "authenticate", (username,)
             )
-            result = self.cursor.fetchone()
             if result:
                 user_id, hashed_pw = result
-                if hashed_pw == self.hash_password(password):
+                matches, needs_rehash = await self.hasher.verify_async(
+                    password, hashed_pw
+                )
+                if matches:
+                    if needs_rehash:
+                        await self.rehash_password(user_id, hashed_pw, password)
                     token = self.jwtAuth.generate_token(user_id)
                     return {
                         "success": True,
@@ -145,16 +227,35 @@ class LoginSystem(Database):
                     # Incorrect password
                     return {"success": False}
             else:
-                # User not found
+                # User not found: pay for the KDF anyway so timing does not tell
+                await self.hasher.verify_async(password, self.hasher.dummy_hash())
                 return {"success": False}
         except psycopg2.Error as error:
             return {"success": False, "error": f"Database error: {error}"}
-        except psycopg2.IntegrityError as error:
-            self.connection.rollback()
-            return {"success": False, "error": str(error)}
+
+    async def rehash_password(self, user_id, old_hash, password):
+        """
+        Replace a user's stored hash with one made at the current cost.
+
+        Requires:
+            user_id (int): The user's ID.
+            old_hash (str): The hash that was just verified; the update is skipped if the
+                password changed in the meantime.
+            password (str): The verified plain text password.
+        """
+        new_hash = await self.hasher.hash_async(password)
+        try:
+            await run_io(
+                self.run_step, self.replace_password_hash, user_id, old_hash, new_hash
+            )
         except psycopg2.Error as error:
-            self.connection.rollback()
-            return {"success": False, "error": str(error)}
+            print("Password rehash failed:", error)
+
+    def replace_password_hash(self, user_id, old_hash, new_hash):
+        self.cursor.execute(
+            "UPDATE users SET password = %s WHERE id = %s AND password = %s",
+            (new_hash, user_id, old_hash),
+        )
 
     def get_user_from_token(self, token):
         """
@@ -169,10 +270,7 @@ class LoginSystem(Database):
         token_result = self.jwtAuth.verify_token(token)
         if token_result["success"]:
             try:
-                self.cursor.execute(
-                    "SELECT id, username FROM users WHERE id = %s",
-                    (token_result["user_id"],),
-                )
+                self.execute("get_user", (token_result["user_id"],))
                 user_data = self.cursor.fetchone()
                 if user_data:
                     return {
@@ -187,7 +285,13 @@ class LoginSystem(Database):
             return token_result
 
     def update_user(
-        self, user_id, username=None, password=None, dark_mode=None, use_ai=None
+        self,
+        user_id,
+        username=None,
+        password=None,
+        dark_mode=None,
+        use_ai=None,
+        password_hash=None,
     ):
         """
         Update user information in the database using a single SQL statement.
@@ -196,6 +300,7 @@ class LoginSystem(Database):
             user_id (int): The user's ID.
             username (str, optional): The new username.
             password (str, optional): The new plain text password (will be hashed).
+            password_hash (str, optional): An already hashed new password.
             dark_mode (bool, optional): The dark mode preference.
             use_ai (bool, optional): The AI usage status.
 
@@ -210,8 +315,10 @@ class LoginSystem(Database):
                 updates.append("username = %s")
                 values.append(username)
             if password is not None:
+                password_hash = self.hash_password(password)
+            if password_hash is not None:
                 updates.append("password = %s")
-                values.append(self.hash_password(password))
+                values.append(password_hash)
             if dark_mode is not None:
                 updates.append("dark_mode = %s")
                 values.append(dark_mode)
@@ -243,7 +350,7 @@ class LoginSystem(Database):
             self.connection.rollback()
             return {"success": False, "error": f"Database error: {str(error)}"}
 
-    def change_password(self, user_id, current_password, new_password):
+    async def change_password(self, user_id, current_password, new_password):
         """
         Change user password after verifying the current password.
 
@@ -257,10 +364,9 @@ class LoginSystem(Database):
         """
         try:
             # First get the user's username to verify current password
-            self.cursor.execute(
-                "SELECT username, password FROM users WHERE id = %s", (user_id,)
+            result = await run_io(
+                self.run_step, self.fetch_one, "get_credentials", (user_id,)
             )
-            result = self.cursor.fetchone()
 
             if not result:
                 return {"success": False, "error": "User not found"}
@@ -268,11 +374,17 @@ class LoginSystem(Database):
             user_username, stored_password = result
 
             # Verify current password
-            if stored_password != self.hash_password(current_password):
+            matches, _ = await self.hasher.verify_async(
+                current_password, stored_password
+            )
+            if not matches:
                 return {"success": False, "error": "Current password is incorrect"}
 
             # Update to new password using the update_user method
-            return self.update_user(user_id, password=new_password)
+            new_hash = await self.hasher.hash_async(new_password)
+            return await run_io(
+                self.run_step, self.update_user, user_id, password_hash=new_hash
+            )
 
         except psycopg2.Error as error:
             return {"success": False, "error": f"Database error: {str(error)}"}
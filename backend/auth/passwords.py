@@ -0,0 +1,155 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from offload import blocking
+from tracing import span
+
+# Legacy hashes are a bare, unsalted SHA-256 hex digest
+LEGACY_SHA256 = re.compile(r"[0-9a-f]{64}")
+
+_executor = None
+
+
+def _encode(value):
+    return base64.b64encode(value).decode().rstrip("=")
+
+
+def _decode(value):
+    return base64.b64decode(value + "=" * (-len(value) % 4))
+
+
+def get_executor():
+    """
+    The bounded pool every KDF call runs on, so logins never hash on the event loop.
+    Sized by password_hash_workers (default 4).
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("password_hash_workers", "4")),
+            thread_name_prefix="password-hash",
+        )
+    return _executor
+
+
+class PasswordHasher:
+    """
+    Hashes passwords with scrypt and stores self-describing hashes of the form
+    scrypt$ln=<log2 n>,r=<r>,p=<p>$<salt>$<hash>, so the cost can be raised later without
+    invalidating existing hashes.
+    """
+
+    def __init__(self, log_n=None, r=8, p=1):
+        """
+        Requires:
+            log_n (int, optional): log2 of the scrypt CPU/memory cost. Defaults to the
+                password_hash_cost setting, or 14 (16 MiB and roughly 50 ms per hash).
+            r (int): scrypt block size.
+            p (int): scrypt parallelism.
+        """
+        self.log_n = log_n or int(os.getenv("password_hash_cost", "14"))
+        self.r = r
+        self.p = p
+
+    def derive(self, password, salt, log_n, r, p):
+        n = 1 << log_n
+        return hashlib.scrypt(
+            password.encode(),
+            salt=salt,
+            n=n,
+            r=r,
+            p=p,
+            maxmem=256 * n * r * p,
+            dklen=32,
+        )
+
+    @blocking("hash")
+    def hash(self, password):
+        """
+        Hash a password with a fresh salt. Blocking, use hash_async from async code.
+
+        Returns:
+            str: The self-describing hash to store.
+        """
+        salt = os.urandom(16)
+        digest = self.derive(password, salt, self.log_n, self.r, self.p)
+        return (
+            f"scrypt$ln={self.log_n},r={self.r},p={self.p}"
+            f"${_encode(salt)}${_encode(digest)}"
+        )
+
+    def dummy_hash(self):
+        """
+        A well-formed hash at the configured cost that no password matches. Verifying
+        against it when a username does not exist makes a failed login take as long as one
+        with a wrong password, so response times do not reveal which usernames exist.
+        """
+        return (
+            f"scrypt$ln={self.log_n},r={self.r},p={self.p}"
+            f"${_encode(bytes(16))}${_encode(bytes(32))}"
+        )
+
+    def dummy_derive(self, password):
+        """
+        Run the KDF at the configured cost and discard the result, so a rejection that
+        needs no KDF (a legacy hash, or no usable hash) takes as long as any other.
+        """
+        self.derive(password, bytes(16), self.log_n, self.r, self.p)
+
+    @blocking("hash")
+    def verify(self, password, stored):
+        """
+        Check a password against a stored hash. Blocking, use verify_async from async code.
+
+        Requires:
+            password (str): The plain text password to check.
+            stored (str): A scrypt hash or a legacy SHA-256 hex digest.
+
+        Returns:
+            tuple: (matches: bool, needs_rehash: bool). needs_rehash is True for legacy
+            hashes and for scrypt hashes made with a different cost than configured.
+        """
+        if stored is None:
+            self.dummy_derive(password)
+            return False, False
+
+        if LEGACY_SHA256.fullmatch(stored):
+            digest = hashlib.sha256(password.encode()).hexdigest()
+            matches = hmac.compare_digest(digest, stored)
+            if not matches:
+                # A match pays for the KDF when it is rehashed; a mismatch must as well,
+                # or fast failures would tell which accounts still have a legacy hash
+                self.dummy_derive(password)
+            return matches, True
+
+        try:
+            scheme, params, salt, digest = stored.split("$")
+            settings = dict(item.split("=") for item in params.split(","))
+            log_n, r, p = int(settings["ln"]), int(settings["r"]), int(settings["p"])
+            salt, digest = _decode(salt), _decode(digest)
+        except (ValueError, KeyError):
+            self.dummy_derive(password)
+            return False, False
+        if scheme != "scrypt":
+            self.dummy_derive(password)
+            return False, False
+
+        matches = hmac.compare_digest(self.derive(password, salt, log_n, r, p), digest)
+        return matches, (log_n, r, p) != (self.log_n, self.r, self.p)
+
+    async def hash_async(self, password):
+        loop = asyncio.get_running_loop()
+        with span("password"):
+            return await loop.run_in_executor(get_executor(), self.hash, password)
+
+    async def verify_async(self, password, stored):
+        loop = asyncio.get_running_loop()
+        with span("password"):
+            return await loop.run_in_executor(
+                get_executor(), self.verify, password, stored
+            )
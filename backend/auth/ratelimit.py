@@ -5,6 +5,8 @@ from fastapi import HTTPException, Request
 from functools import wraps
 import threading
 
+from tracing import span
+
 
 class UserRateLimiter:
     """
@@ -17,7 +19,7 @@ class UserRateLimiter:
         self.lock = threading.RLock()
 
     def is_allowed(
-        self, user_id: int, endpoint: str, limit: int, window: int
+        self, user_id: int, endpoint: str, limit: int, window: int, cost: int = 1
     ) -> tuple[bool, dict]:
         """
         Check if a user is allowed to make a request to a specific endpoint.
@@ -27,13 +29,14 @@ class UserRateLimiter:
             endpoint (str): The endpoint being accessed
             limit (int): Maximum number of requests allowed in the time window
             window (int): Time window in seconds
+            cost (int): How many requests this call counts as (default 1)
 
         Returns:
             tuple: (is_allowed: bool, info: dict with remaining requests and reset time)
         """
         current_time = time.time()
 
-        with self.lock:
+        with span("ratelimit"), self.lock:
             # Initialize user tracking if not exists
             if user_id not in self.user_requests:
                 self.user_requests[user_id] = {}
@@ -54,15 +57,15 @@ class UserRateLimiter:
             requests = self.user_requests[user_id][endpoint]
 
             # Check if limit is exceeded
-            if len(requests) >= limit:
+            if len(requests) + cost > limit:
                 # Find the oldest request to determine reset time
                 oldest_request = min(requests) if requests else current_time
                 reset_time = oldest_request + window
                 remaining = 0
                 allowed = False
             else:
-                # Add current request timestamp
-                requests.append(current_time)
+                # Add current request timestamp, once per unit of cost
+                requests.extend([current_time] * cost)
                 remaining = limit - len(requests)
                 reset_time = current_time + window
                 allowed = True
@@ -115,6 +118,16 @@ class UserRateLimiter:
             for user_id in users_to_remove:
                 del self.user_requests[user_id]
 
+    def forget_user(self, user_id: int):
+        """
+        Drop all tracking for a user, e.g. once their account has been deleted.
+
+        Args:
+            user_id (int): The user's ID
+        """
+        with self.lock:
+            self.user_requests.pop(user_id, None)
+
 
 class IPRateLimiter:
     """
@@ -127,7 +140,7 @@ class IPRateLimiter:
         self.lock = threading.RLock()
 
     def is_allowed(
-        self, ip_address: str, endpoint: str, limit: int, window: int
+        self, ip_address: str, endpoint: str, limit: int, window: int, cost: int = 1
     ) -> tuple[bool, dict]:
         """
         Check if an IP is allowed to make a request to a specific endpoint.
@@ -137,13 +150,14 @@ class IPRateLimiter:
             endpoint (str): The endpoint being accessed
             limit (int): Maximum number of requests allowed in the time window
             window (int): Time window in seconds
+            cost (int): How many requests this call counts as (default 1)
 
         Returns:
             tuple: (is_allowed: bool, info: dict with remaining requests and reset time)
         """
         current_time = time.time()
 
-        with self.lock:
+        with span("ratelimit"), self.lock:
             # Initialize IP tracking if not exists
             if ip_address not in self.ip_requests:
                 self.ip_requests[ip_address] = {}
@@ -164,15 +178,15 @@ class IPRateLimiter:
             requests = self.ip_requests[ip_address][endpoint]
 
             # Check if limit is exceeded
-            if len(requests) >= limit:
+            if len(requests) + cost > limit:
                 # Find the oldest request to determine reset time
                 oldest_request = min(requests) if requests else current_time
                 reset_time = oldest_request + window
                 remaining = 0
                 allowed = False
             else:
-                # Add current request timestamp
-                requests.append(current_time)
+                # Add current request timestamp, once per unit of cost
+                requests.extend([current_time] * cost)
                 remaining = limit - len(requests)
                 reset_time = current_time + window
                 allowed = True
@@ -231,6 +245,35 @@ rate_limiter = UserRateLimiter()
 ip_rate_limiter = IPRateLimiter()
 
 
+def rate_limit_exceeded(info: dict) -> HTTPException:
+    """
+    Build the 429 response for a request a rate limiter has refused.
+
+    Args:
+        info (dict): The info returned by is_allowed
+
+    Returns:
+        HTTPException: The exception to raise, with Retry-After and X-RateLimit headers
+    """
+    # Calculate retry after seconds
+    retry_after = int(info["reset_time"] - time.time())
+    return HTTPException(
+        status_code=429,
+        detail={
+            "message": f"Rate limit exceeded. Try again in {retry_after} seconds.",
+            "retry_after": retry_after,
+            "limit": info["limit"],
+            "window": info["window"],
+        },
+        headers={
+            "Retry-After": str(retry_after),
+            "X-RateLimit-Limit": str(info["limit"]),
+            "X-RateLimit-Remaining": str(info["remaining"]),
+            "X-RateLimit-Reset": str(int(info["reset_time"])),
+        },
+    )
+
+
 def rate_limit(requests_per_minute: int = 60, endpoint_name: Optional[str] = None):
     """
     Decorator for rate limiting FastAPI endpoints by user ID.
@@ -273,23 +316,7 @@ def rate_limit(requests_per_minute: int = 60, endpoint_name: Optional[str] = Non
             )
 
             if not allowed:
-                # Calculate retry after seconds
-                retry_after = int(info["reset_time"] - time.time())
-                raise HTTPException(
-                    status_code=429,
-                    detail={
-                        "message": f"Rate limit exceeded. Try again in {retry_after} seconds.",
-                        "retry_after": retry_after,
-                        "limit": info["limit"],
-                        "window": info["window"],
-                    },
-                    headers={
-                        "Retry-After": str(retry_after),
-                        "X-RateLimit-Limit": str(info["limit"]),
-                        "X-RateLimit-Remaining": str(info["remaining"]),
-                        "X-RateLimit-Reset": str(int(info["reset_time"])),
-                    },
-                )
+                raise rate_limit_exceeded(info)
 
             # Call the original function
             return await func(*args, **kwargs)
@@ -348,23 +375,63 @@ def ip_rate_limit(requests_per_minute: int = 10, endpoint_name: Optional[str] =
             )
 
             if not allowed:
-                # Calculate retry after seconds
-                retry_after = int(info["reset_time"] - time.time())
-                raise HTTPException(
-                    status_code=429,
-                    detail={
-                        "message": f"Rate limit exceeded. Try again in {retry_after} seconds.",
-                        "retry_after": retry_after,
-                        "limit": info["limit"],
-                        "window": info["window"],
-                    },
-                    headers={
-                        "Retry-After": str(retry_after),
-                        "X-RateLimit-Limit": str(info["limit"]),
-                        "X-RateLimit-Remaining": str(info["remaining"]),
-                        "X-RateLimit-Reset": str(int(info["reset_time"])),
-                    },
+                raise rate_limit_exceeded(info)
+
+            # Call the original function
+            return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def user_or_ip_rate_limit(
+    user_requests_per_minute: int = 60,
+    ip_requests_per_minute: int = 10,
+    endpoint_name: Optional[str] = None,
+):
+    """
+    Decorator for endpoints where authentication is optional. Authenticated callers are
+    limited by user ID, anonymous callers by IP address.
+
+    Args:
+        user_requests_per_minute (int): Maximum requests per minute per user
+        ip_requests_per_minute (int): Maximum requests per minute per IP
+        endpoint_name (str): Custom endpoint name for rate limiting (optional)
+
+    Usage:
+        @user_or_ip_rate_limit(user_requests_per_minute=50, ip_requests_per_minute=30)
+        async def my_endpoint(request: Request, user_id: Optional[int] = Depends(...)):
+            ...
+    """
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            endpoint = endpoint_name or func.__name__
+            user_id = kwargs.get("user_id")
+            request = kwargs.get("request")
+
+            if user_id is not None:
+                allowed, info = rate_limiter.is_allowed(
+                    user_id=user_id,
+                    endpoint=endpoint,
+                    limit=user_requests_per_minute,
+                    window=60,
+                )
+            elif request is not None:
+                client_ip = request.client.host if request.client else "unknown"
+                allowed, info = ip_rate_limiter.is_allowed(
+                    ip_address=client_ip,
+                    endpoint=endpoint,
+                    limit=ip_requests_per_minute,
+                    window=60,
                 )
+            else:
+                allowed, info = True, None
+
+            if not allowed:
+                raise rate_limit_exceeded(info)
 
             # Call the original function
             return await func(*args, **kwargs)
@@ -0,0 +1,72 @@
+"""
+Measures bytes saved against CPU spent when Encryption compresses payloads before encrypting.
+Source code from the standard library stands in for snippet content. Runs without a database.
+
+Run from the backend folder:
+    python -m benchmarks.compression [--repeat 200]
+"""
+
+import argparse
+import inspect
+import os
+import time
+import asyncio
+import json
+from cryptography.fernet import Fernet
+
+os.environ.setdefault("fernet_key", Fernet.generate_key().decode())
+
+from auth.encryption import Encryption, ZLIB_CODEC, ZSTD_CODEC, zstandard
+
+SIZES = [256, 1024, 4096, 16384, 65536]
+
+
+def sample_source(size):
+    source = "".join(inspect.getsource(module) for module in (asyncio, json, inspect))
+    return source[:size]
+
+
+def measure(encryptor, payload, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        token = encryptor.encrypt(payload)
+    encrypt_seconds = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        encryptor.decrypt(token)
+    decrypt_seconds = (time.perf_counter() - start) / repeat
+
+    return len(token), encrypt_seconds * 1e6, decrypt_seconds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    codecs = [None, ZLIB_CODEC] + ([ZSTD_CODEC] if zstandard else [])
+    print(
+        f"{'size':>7} {'codec':>6} {'stored':>8} {'saved':>7} "
+        f"{'encrypt us':>11} {'decrypt us':>11}"
+    )
+
+    for size in SIZES:
+        payload = sample_source(size)
+        plain_bytes = None
+        for codec in codecs:
+            encryptor = Encryption()
+            encryptor.codec = codec or ZLIB_CODEC
+            encryptor.compress_threshold = 0 if codec else len(payload) + 1
+
+            stored, encrypt_us, decrypt_us = measure(encryptor, payload, args.repeat)
+            plain_bytes = plain_bytes or stored
+            saved = (plain_bytes - stored) / plain_bytes * 100
+            print(
+                f"{size:>7} {codec or 'none':>6} {stored:>8} {saved:>6.1f}% "
+                f"{encrypt_us:>11.1f} {decrypt_us:>11.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
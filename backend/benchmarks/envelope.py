@@ -0,0 +1,116 @@
+"""
+Compares the storage size and decryption cost of the legacy per-field row layout with the
+compact `meta` envelope layout. Runs without a database.
+
+Run from the backend folder:
+    python -m benchmarks.envelope [--rows 2000] [--content-size 300]
+"""
+
+import argparse
+import os
+import random
+import string
+import time
+from cryptography.fernet import Fernet
+
+os.environ.setdefault("fernet_key", Fernet.generate_key().decode())
+
+from auth.encryption import Encryption
+from snippets import Snippets
+
+LANGUAGES = ["python", "javascript", "html", "css", "java", "c++", "c", "c#"]
+
+
+def make_snippet(rng, content_size):
+    words = ["".join(rng.choices(string.ascii_lowercase, k=6)) for _ in range(4)]
+    return {
+        "title": " ".join(words[:3]).title(),
+        "content": "".join(rng.choices(string.printable, k=content_size)),
+        "language": rng.choice(LANGUAGES),
+        "favourite": rng.random() < 0.2,
+        "tags": words[: rng.randint(0, 3)],
+    }
+
+
+def offline_snippets(compact):
+    """A Snippets instance that only uses the row helpers, without a connection."""
+    snippets = Snippets.__new__(Snippets)
+    snippets.connection = None
+    snippets.encryptor = Encryption()
+    snippets.compact_rows = compact
+    return snippets
+
+
+def run_layout(data, compact):
+    snippets = offline_snippets(compact)
+
+    start = time.perf_counter()
+    rows = []
+    for index, item in enumerate(data):
+        columns = snippets.write_meta(
+            item["title"], item["language"], item["favourite"], item["tags"]
+        )
+        content = snippets.encryptor.encrypt(item["content"])
+        rows.append(
+            (
+                index,
+                columns["title"],
+                content,
+                columns["language"],
+                columns["favourite"],
+                None,
+                columns["tags"],
+                False,
+                columns["meta"],
+                0,
+            )
+        )
+    encrypt_seconds = time.perf_counter() - start
+
+    stored_bytes = sum(
+        len(value) for row in rows for value in row if isinstance(value, bytes)
+    )
+    metadata_bytes = stored_bytes - sum(len(row[2]) for row in rows)
+
+    start = time.perf_counter()
+    for row in rows:
+        snippets.row_to_snippet(row, include_content=False)
+    list_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for row in rows:
+        snippets.row_to_snippet(row)
+    full_seconds = time.perf_counter() - start
+
+    return {
+        "bytes/row": stored_bytes / len(rows),
+        "meta bytes/row": metadata_bytes / len(rows),
+        "encrypt us/row": encrypt_seconds / len(rows) * 1e6,
+        "list decode us/row": list_seconds / len(rows) * 1e6,
+        "full decode us/row": full_seconds / len(rows) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--content-size", type=int, default=300)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    data = [make_snippet(rng, args.content_size) for _ in range(args.rows)]
+
+    legacy = run_layout(data, compact=False)
+    compact = run_layout(data, compact=True)
+
+    print(f"{args.rows} rows, {args.content_size} byte content")
+    print(f"{'metric':<22}{'legacy':>12}{'compact':>12}{'change':>10}")
+    for metric in legacy:
+        change = (compact[metric] - legacy[metric]) / legacy[metric] * 100
+        print(
+            f"{metric:<22}{legacy[metric]:>12.1f}{compact[metric]:>12.1f}{change:>9.1f}%"
+        )
+
+
+if __name__ == "__main__":
+    main()
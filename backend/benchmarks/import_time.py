@@ -0,0 +1,67 @@
+"""
+Checks that importing the API stays within an import-time budget, using python -X importtime
+in a fresh interpreter. Exits with status 1 when the budget is exceeded, so it can gate CI.
+
+Run from the backend folder:
+    python -m benchmarks.import_time [--budget-ms 1000] [--module routes] [--top 10]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+
+def import_times(module):
+    """
+    Import a module in a fresh interpreter.
+
+    Returns:
+        list: (cumulative microseconds, self microseconds, nesting depth, module name) for
+        every module imported, in import order.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        times.append((int(cumulative), int(own), depth, name.strip()))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="routes")
+    parser.add_argument("--budget-ms", type=float, default=1000)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    times = import_times(args.module)
+    total_ms = next(c for c, _, _, name in times if name == args.module) / 1000
+
+    print(f"Heaviest direct imports of {args.module}:")
+    direct = [entry for entry in times if entry[2] == 1]
+    for cumulative, _, _, name in sorted(direct, reverse=True)[: args.top]:
+        print(f"{cumulative / 1000:>9.1f} ms  {name}")
+
+    print(
+        f"Importing {args.module} took {total_ms:.1f} ms (budget {args.budget_ms} ms)"
+    )
+    if total_ms > args.budget_ms:
+        print("FAIL  import time budget exceeded")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+"""
+Load test: runs the API in a uvicorn subprocess against a real Postgres with the AI stubbed
+out, seeds one user per account size and drives a realistic request mix at each size.
+Reports throughput, p50/p95/p99 latency and server memory, and compares them with a stored
+baseline, exiting with status 1 on a regression so it can gate CI.
+
+Point database_host/port/name/user/password at a disposable Postgres (it is migrated and
+seeded), then run from the backend folder:
+    python -m benchmarks.load [--sizes 10 1000 10000] [--duration 30] [--concurrency 32]
+    python -m benchmarks.load --save-baseline   # Record this machine's numbers
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import httpx
+
+from benchmarks.load.seed import PASSWORD, seed
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Share of requests per operation, roughly what the frontend sends
+MIX = {
+    "get_snippets": 50,
+    "public_view": 20,
+    "toggle_favorite": 15,
+    "create_snippet": 10,
+    "login": 5,
+}
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def start_server(port):
+    """
+    Start benchmarks.load.app in uvicorn and wait until it reports ready.
+
+    Returns:
+        subprocess.Popen: The server process.
+    """
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "benchmarks.load.app:app",
+            "--port",
+            str(port),
+            "--no-access-log",
+        ],
+        cwd=os.path.dirname(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ),
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("The API server exited during startup")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/readyz").status_code == 200:
+                return server
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("The API server did not become ready within 60 seconds")
+
+
+def memory_mb(pid):
+    """
+    Returns:
+        dict: The process's current (rss_mb) and peak (peak_rss_mb) resident memory.
+    """
+    fields = {"VmRSS": "rss_mb", "VmHWM": "peak_rss_mb"}
+    memory = {}
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            name, _, value = line.partition(":")
+            if name in fields:
+                memory[fields[name]] = int(value.split()[0]) / 1024
+    return memory
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarise(samples, elapsed):
+    """
+    Requires:
+        samples (list): (latency seconds, ok) per request.
+        elapsed (float): Wall time the requests were sent over.
+
+    Returns:
+        dict: Request and error counts, requests per second and latency percentiles in ms.
+    """
+    latencies = sorted(seconds * 1000 for seconds, _ in samples)
+    return {
+        "requests": len(samples),
+        "errors": sum(not ok for _, ok in samples),
+        "rps": len(samples) / elapsed,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+    }
+
+
+async def run_mix(base_url, user, duration, concurrency, seed_value=0):
+    """
+    Send the request mix as one user from `concurrency` workers for `duration` seconds.
+
+    Returns:
+        dict: summarise()'s result per operation and for all requests together.
+    """
+    operations = list(MIX)
+    weights = list(MIX.values())
+    samples = {operation: [] for operation in operations}
+    created = []
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(
+        base_url=base_url, limits=limits, timeout=60
+    ) as client:
+        login = await client.post(
+            "/login", json={"username": user["username"], "password": PASSWORD}
+        )
+        login.raise_for_status()
+        auth = {"Authorization": f"Bearer {login.json()['token']}"}
+
+        async def request(operation, rng):
+            if operation == "get_snippets":
+                return await client.get("/get_snippets", headers=auth)
+            if operation == "public_view":
+                snippet_id = rng.choice(user["public_ids"] or user["snippet_ids"])
+                return await client.get(f"/get_public_snippet/{snippet_id}")
+            if operation == "toggle_favorite":
+                snippet_id = rng.choice(user["snippet_ids"])
+                return await client.put(f"/toggle_favorite/{snippet_id}", headers=auth)
+            if operation == "create_snippet":
+                return await client.post(
+                    "/create_snippet",
+                    json={"content": "print('load test')\n" * rng.randint(1, 50)},
+                    headers=auth,
+                )
+            return await client.post(
+                "/login", json={"username": user["username"], "password": PASSWORD}
+            )
+
+        async def worker(number, deadline):
+            rng = random.Random(seed_value * 1000 + number)
+            while time.perf_counter() < deadline:
+                operation = rng.choices(operations, weights)[0]
+                start = time.perf_counter()
+                try:
+                    response = await request(operation, rng)
+                    ok = response.status_code < 400
+                except httpx.TransportError:
+                    response, ok = None, False
+                samples[operation].append((time.perf_counter() - start, ok))
+                if ok and operation == "create_snippet":
+                    created.append(response.json()["snippet"]["id"])
+
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(
+            *(worker(number, deadline) for number in range(concurrency))
+        )
+        elapsed = time.perf_counter() - start
+
+        # Keep the account at its seeded size for the next run
+        for snippet_id in created:
+            await client.delete(f"/delete_snippet/{snippet_id}", headers=auth)
+
+    result = {
+        operation: summarise(found, elapsed)
+        for operation, found in samples.items()
+        if found
+    }
+    result["all"] = summarise([s for found in samples.values() for s in found], elapsed)
+    return result
+
+
+def compare(
+    results, baseline, latency_tolerance, throughput_tolerance, memory_tolerance
+):
+    """
+    Returns:
+        list: A message for every operation whose p95 latency or throughput, and every
+        size whose peak server memory, regressed beyond the tolerances (fractions, e.g. 0.2
+        for 20%).
+    """
+    regressions = []
+    for size, operations in results.items():
+        for operation, current in operations.items():
+            previous = baseline.get(size, {}).get(operation)
+            if previous is None:
+                continue
+            if operation == "memory":
+                if current["peak_rss_mb"] > previous["peak_rss_mb"] * (
+                    1 + memory_tolerance
+                ):
+                    regressions.append(
+                        f"{size} snippets: peak memory {current['peak_rss_mb']:.0f} MB "
+                        f"vs baseline {previous['peak_rss_mb']:.0f} MB"
+                    )
+                continue
+            if current["p95_ms"] > previous["p95_ms"] * (1 + latency_tolerance):
+                regressions.append(
+                    f"{size} snippets, {operation}: p95 {current['p95_ms']:.1f} ms "
+                    f"vs baseline {previous['p95_ms']:.1f} ms"
+                )
+            if current["rps"] < previous["rps"] * (1 - throughput_tolerance):
+                regressions.append(
+                    f"{size} snippets, {operation}: {current['rps']:.1f} req/s "
+                    f"vs baseline {previous['rps']:.1f} req/s"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--latency-tolerance", type=float, default=0.2)
+    parser.add_argument("--throughput-tolerance", type=float, default=0.15)
+    parser.add_argument("--memory-tolerance", type=float, default=0.25)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    users = seed(args.sizes)
+    port = free_port()
+    server = start_server(port)
+    results = {}
+    try:
+        for size in args.sizes:
+            print(f"Driving {size} snippets for {args.duration:.0f}s...")
+            results[str(size)] = asyncio.run(
+                run_mix(
+                    f"http://127.0.0.1:{port}",
+                    users[size],
+                    args.duration,
+                    args.concurrency,
+                    seed_value=size,
+                )
+            )
+            results[str(size)]["memory"] = memory_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+    print(
+        f"{'snippets':>8}  {'operation':<16}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}"
+        f"{'p99 ms':>9}{'errors':>8}"
+    )
+    for size, operations in results.items():
+        for operation, stats in operations.items():
+            if operation == "memory":
+                continue
+            print(
+                f"{size:>8}  {operation:<16}{stats['rps']:>9.1f}{stats['p50_ms']:>9.1f}"
+                f"{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['errors']:>8}"
+            )
+        memory = operations["memory"]
+        print(
+            f"{size:>8}  server memory {memory['rss_mb']:.0f} MB "
+            f"(peak {memory['peak_rss_mb']:.0f} MB)"
+        )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline yet; run with --save-baseline to record one")
+        return 0
+
+    with open(args.baseline) as file:
+        regressions = compare(
+            results,
+            json.load(file),
+            args.latency_tolerance,
+            args.throughput_tolerance,
+            args.memory_tolerance,
+        )
+    for message in regressions:
+        print(f"REGRESSION  {message}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""
+routes.app prepared for load testing: Gemini is replaced by a stub with a fixed latency, and
+rate limits are raised out of reach. The limiters still run, so their cost is measured.
+
+Served by the load test with:
+    uvicorn benchmarks.load.app:app
+"""
+
+import os
+import time
+
+import snippets
+from auth.ratelimit import ip_rate_limiter, rate_limiter
+from code_data_ai import CodeDataAI
+from routes import app
+
+AI_LATENCY = float(os.getenv("load_ai_latency", "0.3"))  # Seconds per stubbed prompt
+UNLIMITED = 10**9
+
+
+class StubCodeDataAI(CodeDataAI):
+    """Answers every prompt after AI_LATENCY seconds without calling Gemini."""
+
+    def __init__(self):
+        self.model = "stub"
+
+    def run_prompt(self, prompt: str, user_code: str, retries=3):
+        time.sleep(AI_LATENCY)
+        if "language" in prompt:
+            return "python"
+        if "tags" in prompt:
+            return '["load", "test"]'
+        return "Load test snippet"
+
+
+def unlimited(is_allowed):
+    def check(*args, **kwargs):
+        return is_allowed(*args, **{**kwargs, "limit": UNLIMITED})
+
+    return check
+
+
+snippets.CodeDataAI = StubCodeDataAI
+rate_limiter.is_allowed = unlimited(rate_limiter.is_allowed)
+ip_rate_limiter.is_allowed = unlimited(ip_rate_limiter.is_allowed)
+
+__all__ = ["app"]
@@ -0,0 +1,129 @@
+"""
+Seeds the load-test users, one per account size, into the database the environment points
+at (database_host/port/name/user). Seeding is idempotent: a user whose snippet count already
+matches is left alone, so repeated runs measure the same data.
+"""
+
+import random
+
+import psycopg2.extras
+
+from auth.passwords import PasswordHasher
+from benchmarks.serialization import fake_code
+from migrations import Migrator
+from snippets import Snippets
+
+PASSWORD = "load-test-password"
+PUBLIC_SHARE = 0.2  # Fraction of each user's snippets that are public
+LANGUAGES = ["python", "javascript", "typescript", "go", "rust", "sql"]
+TAGS = ["api", "cli", "db", "ui", "auth", "util", "test", "perf"]
+
+
+def username(size):
+    return f"load_{size}"
+
+
+def snippet_rows(snippets, size, seed):
+    """
+    Returns:
+        list: Column values for `size` encrypted snippets in the configured row layout.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for number in range(size):
+        columns = snippets.write_meta(
+            f"Snippet {number}",
+            rng.choice(LANGUAGES),
+            rng.random() < 0.1,
+            rng.sample(TAGS, rng.randint(0, 3)),
+        )
+        columns.update(
+            {
+                "content": snippets.encryptor.encrypt(
+                    fake_code(rng, rng.randint(200, 4000))
+                ),
+                "user_id": snippets.user_id,
+                "is_public": rng.random() < PUBLIC_SHARE,
+            }
+        )
+        rows.append(columns)
+    return rows
+
+
+def seed_user(size, password_hash):
+    """
+    Create (or reuse) the user for one account size and give it exactly `size` snippets.
+
+    Returns:
+        dict: The user's id and username, the ids of its snippets and of its public ones.
+    """
+    name = username(size)
+    setup = Snippets(user_id=0)  # Only used for its connection
+    try:
+        setup.cursor.execute(
+            "INSERT INTO users (username, password, use_ai) VALUES (%s, %s, TRUE) "
+            "ON CONFLICT (username) DO UPDATE SET password = EXCLUDED.password, "
+            "use_ai = TRUE, disabled_at = NULL RETURNING id",
+            (name, password_hash),
+        )
+        user_id = setup.cursor.fetchone()[0]
+        setup.connection.commit()
+    finally:
+        setup.close()
+
+    snippets = Snippets(user_id)
+    try:
+        snippets.cursor.execute(
+            "SELECT count(*) FROM code_snippets WHERE user_id = %s", (user_id,)
+        )
+        if snippets.cursor.fetchone()[0] != size:
+            snippets.cursor.execute(
+                "DELETE FROM code_snippets WHERE user_id = %s", (user_id,)
+            )
+            rows = snippet_rows(snippets, size, seed=size)
+            names = list(rows[0])
+            psycopg2.extras.execute_values(
+                snippets.cursor,
+                f"INSERT INTO code_snippets ({', '.join(names)}) VALUES %s",
+                [tuple(row[column] for column in names) for row in rows],
+                page_size=500,
+            )
+            snippets.connection.commit()
+            print(f"Seeded {name} with {size} snippets")
+
+        snippets.cursor.execute(
+            "SELECT id, is_public FROM code_snippets WHERE user_id = %s", (user_id,)
+        )
+        found = snippets.cursor.fetchall()
+        snippets.connection.commit()
+    finally:
+        snippets.close()
+
+    return {
+        "user_id": user_id,
+        "username": name,
+        "snippet_ids": [row[0] for row in found],
+        "public_ids": [row[0] for row in found if row[1]],
+    }
+
+
+def seed(sizes):
+    """
+    Bring the schema up to date and seed one user per account size.
+
+    Requires:
+        sizes (list): Snippet counts, e.g. [10, 1000, 10000].
+
+    Returns:
+        dict: seed_user()'s result for each size.
+    """
+    migrator = Migrator()
+    try:
+        result = migrator.migrate()
+    finally:
+        migrator.close()
+    if not result["success"]:
+        raise RuntimeError(f"Migration {result['failed']} failed: {result['error']}")
+
+    password_hash = PasswordHasher().hash(PASSWORD)
+    return {size: seed_user(size, password_hash) for size in sizes}
@@ -0,0 +1,274 @@
+"""
+Micro-benchmarks for the CPU work every request does: Encryption.encrypt/decrypt across
+payload sizes, Snippets.convert_tags, jwtAuth.verify_token, and the user and IP rate limiters
+under contention from many threads. Fixtures are fixed (keys, payloads, tokens), so runs on
+one machine are comparable. Runs without a database.
+
+Results can be written as JSON and compared with an earlier run; the comparison exits with
+status 1 when any benchmark's median slowed down by more than --fail-threshold.
+
+Run from the backend folder:
+    python -m benchmarks.micro [--filter crypto] [--output micro.json]
+    python -m benchmarks.micro --compare micro.json [--fail-threshold 0.1]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import threading
+import time
+
+# Fixed fixtures: the same keys on every run, whatever the local .env holds
+os.environ["fernet_key"] = "bWljcm8tYmVuY2htYXJrLWZpeGVkLWtleS0wMDAwMDA="
+os.environ["fernet_old_keys"] = ""
+os.environ["jwt_secret"] = "micro-benchmark-fixed-jwt-secret-0000"
+
+from auth.encryption import Encryption
+from auth.jwtAuth import jwtAuth
+from auth.ratelimit import IPRateLimiter, UserRateLimiter
+from benchmarks.serialization import fake_code
+from snippets import Snippets
+
+PAYLOAD_SIZES = [64, 1024, 16 * 1024, 256 * 1024]
+THREAD_COUNTS = [1, 8, 32]
+TAG_FIXTURES = {
+    "json": '["api","example","python"]',
+    "double_encoded": '"[\\"api\\", \\"example\\", \\"python\\"]"',
+    "comma_text": "api, example, python",
+    "list": ["api", "example", "python"],
+}
+
+
+def measure(function, rounds, min_round_seconds):
+    """
+    Time a callable pytest-benchmark style: calibrate how many calls fill a round, then time
+    `rounds` rounds of that many calls.
+
+    Returns:
+        dict: Per-call min/max/mean/median/stddev in seconds, rounds, iterations and ops/s.
+    """
+    iterations = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            function()
+        if time.perf_counter() - start >= min_round_seconds or iterations >= 10**6:
+            break
+        iterations *= 2
+
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            function()
+        timings.append((time.perf_counter() - start) / iterations)
+    return stats(timings, iterations)
+
+
+def measure_threads(function, threads, calls, rounds):
+    """
+    Time `threads` threads each making `calls` calls at once, e.g. to a shared lock.
+
+    Returns:
+        dict: stats() of the wall time per call, over all threads.
+    """
+    timings = []
+    for _ in range(rounds):
+        barrier = threading.Barrier(threads + 1)
+
+        def worker(number):
+            barrier.wait()
+            for call in range(calls):
+                function(number, call)
+
+        workers = [
+            threading.Thread(target=worker, args=(number,)) for number in range(threads)
+        ]
+        for thread in workers:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in workers:
+            thread.join()
+        timings.append((time.perf_counter() - start) / (threads * calls))
+    return stats(timings, threads * calls)
+
+
+def stats(timings, iterations):
+    median = statistics.median(timings)
+    return {
+        "min": min(timings),
+        "max": max(timings),
+        "mean": statistics.fmean(timings),
+        "median": median,
+        "stddev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "rounds": len(timings),
+        "iterations": iterations,
+        "ops": 1 / median,
+    }
+
+
+def benchmarks(rounds, min_round_seconds, contention_calls):
+    """
+    Yields:
+        tuple: (name, group, params, a zero-argument callable returning stats()).
+    """
+    encryptor = Encryption()
+    for size in PAYLOAD_SIZES:
+        text = fake_code(random.Random(size), size)
+        token = encryptor.encrypt(text)
+        yield (
+            f"encrypt[{size}]",
+            "crypto",
+            {"bytes": size},
+            lambda text=text: measure(
+                lambda: encryptor.encrypt(text), rounds, min_round_seconds
+            ),
+        )
+        yield (
+            f"decrypt[{size}]",
+            "crypto",
+            {"bytes": size},
+            lambda token=token: measure(
+                lambda: encryptor.decrypt(token), rounds, min_round_seconds
+            ),
+        )
+
+    for kind, tags in TAG_FIXTURES.items():
+        yield (
+            f"convert_tags[{kind}]",
+            "tags",
+            {"format": kind},
+            lambda tags=tags: measure(
+                lambda: Snippets.convert_tags(tags), rounds, min_round_seconds
+            ),
+        )
+
+    auth = jwtAuth()
+    valid = auth.generate_token(42)
+    for kind, token in {"valid": valid, "invalid": valid[:-2] + "xx"}.items():
+        yield (
+            f"verify_token[{kind}]",
+            "jwt",
+            {"token": kind},
+            lambda token=token: measure(
+                lambda: auth.verify_token(token), rounds, min_round_seconds
+            ),
+        )
+
+    # 64 clients sharing the limiter, at get_snippets' limit of 80 requests a minute
+    for threads in THREAD_COUNTS:
+        users = UserRateLimiter()
+        yield (
+            f"user_rate_limiter[{threads} threads]",
+            "ratelimit",
+            {"threads": threads},
+            lambda threads=threads, users=users: measure_threads(
+                lambda number, call: users.is_allowed(
+                    (number * contention_calls + call) % 64, "get_snippets", 80, 60
+                ),
+                threads,
+                contention_calls,
+                rounds,
+            ),
+        )
+        ips = IPRateLimiter()
+        yield (
+            f"ip_rate_limiter[{threads} threads]",
+            "ratelimit",
+            {"threads": threads},
+            lambda threads=threads, ips=ips: measure_threads(
+                lambda number, call: ips.is_allowed(
+                    f"10.0.0.{(number * contention_calls + call) % 64}",
+                    "read_snippet",
+                    80,
+                    60,
+                ),
+                threads,
+                contention_calls,
+                rounds,
+            ),
+        )
+
+
+def compare(results, previous, fail_threshold):
+    """
+    Print each benchmark's median against an earlier run.
+
+    Returns:
+        list: Names of benchmarks whose median grew by more than fail_threshold.
+    """
+    earlier = {entry["name"]: entry["stats"] for entry in previous["benchmarks"]}
+    slower = []
+    print(f"{'benchmark':<34}{'before':>12}{'after':>12}{'change':>9}")
+    for entry in results["benchmarks"]:
+        before = earlier.get(entry["name"])
+        if before is None:
+            continue
+        after = entry["stats"]["median"]
+        change = after / before["median"] - 1
+        print(
+            f"{entry['name']:<34}{before['median'] * 1e6:>10.2f}us"
+            f"{after * 1e6:>10.2f}us{change * 100:>8.1f}%"
+        )
+        if change > fail_threshold:
+            slower.append(entry["name"])
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--rounds", type=int, default=15)
+    parser.add_argument("--min-round-ms", type=float, default=20)
+    parser.add_argument("--contention-calls", type=int, default=2000)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="An earlier --output file to compare with")
+    parser.add_argument("--fail-threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    results = {
+        "machine_info": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "system": platform.system(),
+            "cpu_count": os.cpu_count(),
+        },
+        "benchmarks": [],
+    }
+
+    print(f"{'benchmark':<34}{'median':>12}{'stddev':>12}{'ops/s':>14}")
+    for name, group, params, run in benchmarks(
+        args.rounds, args.min_round_ms / 1000, args.contention_calls
+    ):
+        if args.filter and args.filter not in name and args.filter != group:
+            continue
+        result = run()
+        results["benchmarks"].append(
+            {"name": name, "group": group, "params": params, "stats": result}
+        )
+        print(
+            f"{name:<34}{result['median'] * 1e6:>10.2f}us"
+            f"{result['stddev'] * 1e6:>10.2f}us{result['ops']:>14,.0f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            slower = compare(results, json.load(file), args.fail_threshold)
+        for name in slower:
+            print(f"SLOWER  {name}")
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+Login throughput and event-loop responsiveness for different scrypt costs and pool sizes.
+Compares verifying on the event loop with verifying on the password hashing pool.
+
+Run from the backend folder:
+    python -m benchmarks.password_hashing [--logins 40] [--costs 12 13 14 15]
+"""
+
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from auth import passwords
+from auth.passwords import PasswordHasher
+
+
+async def watch_loop_lag(stop, interval=0.005):
+    """Largest delay (ms) between when a timer should fire and when it does."""
+    worst = 0.0
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - expected)
+    return worst * 1000
+
+
+async def run_logins(hasher, stored, logins, offload):
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(watch_loop_lag(stop))
+    await asyncio.sleep(0)
+
+    async def login():
+        if offload:
+            return await hasher.verify_async("correct horse", stored)
+        return hasher.verify("correct horse", stored)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    return logins / elapsed, await watcher
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--costs", type=int, nargs="+", default=[12, 13, 14, 15])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    print(f"{'cost':>5} {'mode':>10} {'logins/s':>10} {'max loop lag ms':>16}")
+    for cost in args.costs:
+        hasher = PasswordHasher(log_n=cost)
+        stored = hasher.hash("correct horse")
+
+        rate, lag = asyncio.run(run_logins(hasher, stored, args.logins, offload=False))
+        print(f"{cost:>5} {'inline':>10} {rate:>10.1f} {lag:>16.1f}")
+
+        for workers in args.workers:
+            passwords._executor = ThreadPoolExecutor(max_workers=workers)
+            rate, lag = asyncio.run(
+                run_logins(hasher, stored, args.logins, offload=True)
+            )
+            passwords._executor.shutdown()
+            print(f"{cost:>5} {f'pool x{workers}':>10} {rate:>10.1f} {lag:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Estimated time-to-last-byte of a /get_snippets response on a slow connection, for each
+content encoding CompressionMiddleware can negotiate.
+
+Run from the backend folder:
+    python -m benchmarks.response_compression [--sizes 100 1000] [--mbps 5]
+"""
+
+import argparse
+import time
+
+from benchmarks.serialization import fake_payload
+from middleware.compression import STREAMS
+from responses import ORJSONResponse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--content-bytes", type=int, default=1000)
+    parser.add_argument("--mbps", type=float, default=5.0)
+    args = parser.parse_args()
+    bytes_per_second = args.mbps * 1_000_000 / 8
+
+    print(
+        f"{'snippets':>9} {'encoding':>9} {'body KB':>9} {'compress ms':>12} "
+        f"{'TTLB ms':>9}"
+    )
+    for size in args.sizes:
+        body = ORJSONResponse(fake_payload(size, args.content_bytes)).body
+        print(
+            f"{size:>9} {'identity':>9} {len(body) / 1024:>9.0f} {0:>12.1f} "
+            f"{len(body) / bytes_per_second * 1000:>9.0f}"
+        )
+        for encoding, stream in STREAMS.items():
+            start = time.perf_counter()
+            compressed = stream().finish(body)
+            seconds = time.perf_counter() - start
+            ttlb = seconds + len(compressed) / bytes_per_second
+            print(
+                f"{size:>9} {encoding:>9} {len(compressed) / 1024:>9.0f} "
+                f"{seconds * 1000:>12.1f} {ttlb * 1000:>9.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
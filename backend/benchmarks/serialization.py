@@ -0,0 +1,109 @@
+"""
+Serialization time and peak memory of a /get_snippets response, comparing FastAPI's default
+path (jsonable_encoder, then the stdlib json module) with returning an ORJSONResponse.
+
+Run from the backend folder:
+    python -m benchmarks.serialization [--sizes 100 1000 10000] [--content-bytes 1000]
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from responses import ORJSONResponse
+
+CODE_LINES = [
+    "def handler(request):",
+    "    user = request.state.user",
+    "    for item in items:",
+    "        total += item.price * item.quantity",
+    "    return {'status': 'ok', 'total': total}",
+    "const result = await fetch(url, { headers });",
+    "SELECT id, title FROM code_snippets WHERE user_id = $1;",
+    "if (error) { console.error(error); return null; }",
+    "import os",
+    "# TODO: handle the empty case",
+]
+
+
+def fake_code(rng, size):
+    """Source-like text of roughly size characters, drawn from common code lines."""
+    lines = []
+    while sum(map(len, lines)) < size:
+        lines.append(f"{rng.choice(CODE_LINES)}  # {rng.randrange(10**6)}")
+    return "\n".join(lines)[:size]
+
+
+def fake_payload(count, content_bytes):
+    """A get_snippets result with count snippets, shaped like Snippets.row_to_snippet."""
+    rng = random.Random(count)
+    created = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    snippets = []
+    for index in range(count):
+        snippets.append(
+            {
+                "id": index + 1,
+                "title": f"Snippet {index}",
+                "content": fake_code(rng, content_bytes),
+                "language": rng.choice(["python", "javascript", "sql", "go"]),
+                "favourite": index % 7 == 0,
+                "created_at": created + timedelta(minutes=index),
+                "tags": ["api", "example", f"tag{index % 20}"],
+                "is_public": index % 3 == 0,
+                "revision": index + 1,
+            }
+        )
+    return {"success": True, "snippets": snippets, "cursor": count}
+
+
+def default_response(payload):
+    return JSONResponse(jsonable_encoder(payload))
+
+
+def orjson_response(payload):
+    return ORJSONResponse(payload)
+
+
+def measure(render, payload, repeat):
+    """
+    Returns:
+        tuple: (best time in ms, peak traced memory in MB, body size in bytes)
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = render(payload)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    render(payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best * 1000, peak / 1024 / 1024, len(response.body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--content-bytes", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'snippets':>9} {'encoder':>8} {'ms':>9} {'peak MB':>9} {'body KB':>9}")
+    for size in args.sizes:
+        payload = fake_payload(size, args.content_bytes)
+        for name, render in (
+            ("default", default_response),
+            ("orjson", orjson_response),
+        ):
+            ms, peak, body = measure(render, payload, args.repeat)
+            print(f"{size:>9} {name:>8} {ms:>9.2f} {peak:>9.2f} {body / 1024:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,14 @@
-from google import genai
 import asyncio
 import time
 import os
 
+from tracing import span
+
 
 class CodeDataAI:
     def __init__(self):
+        from google import genai  # Slow to import, so only loaded once AI is first used
+
         self.client = genai.Client(api_key=os.getenv("ai_key"))
         self.model = "gemini-2.0-flash"
 
@@ -50,9 +53,10 @@ class CodeDataAI:
     def run_prompt(self, prompt: str, user_code: str, retries=3):
         for attempt in range(1, retries + 1):
             try:
-                response = self.client.models.generate_content(
-                    model=self.model, contents=f"{prompt}, [{user_code}]"
-                )
+                with span("ai"):
+                    response = self.client.models.generate_content(
+                        model=self.model, contents=f"{prompt}, [{user_code}]"
+                    )
                 output = response.text.strip()
 
                 if not output:
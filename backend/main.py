@@ -2,9 +2,6 @@ import routes as routes
 import uvicorn
 import subprocess
 import threading
-from dotenv import load_dotenv
-
-load_dotenv()
 
 
 def run_fastapi():
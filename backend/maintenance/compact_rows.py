@@ -0,0 +1,78 @@
+"""
+Moves snippets still stored with one Fernet token per field into the compact `meta` envelope.
+
+Rows are also migrated lazily whenever they are written with compact_snippet_rows enabled,
+so this only needs to run once to convert rows nobody edits.
+
+Run from the backend folder:
+    python -m maintenance.compact_rows [--batch-size 500]
+"""
+
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from snippets import Snippets
+
+
+def compact_rows(batch_size=500):
+    """
+    Rewrite legacy rows into the compact layout in id order, locking one batch at a time.
+
+    Requires:
+        batch_size (int): Rows fetched and committed per batch.
+
+    Returns:
+        int: Number of rows converted.
+    """
+    snippets = Snippets(user_id=0)  # Only used for its connection and row helpers
+    snippets.compact_rows = True
+    last_id = 0
+    converted = 0
+
+    try:
+        while True:
+            snippets.cursor.execute(
+                "SELECT id, title, language, favourite, tags FROM code_snippets "
+                "WHERE id > %s AND meta IS NULL ORDER BY id LIMIT %s FOR UPDATE",
+                (last_id, batch_size),
+            )
+            rows = snippets.cursor.fetchall()
+            if not rows:
+                break
+
+            updates = []
+            for snippet_id, title, language, favourite, tags in rows:
+                metadata = snippets.read_meta(title, language, favourite, tags, None)
+                columns = snippets.write_meta(
+                    metadata["title"],
+                    metadata["language"],
+                    metadata["favourite"],
+                    metadata["tags"],
+                )
+                updates.append((columns["meta"], snippet_id))
+
+            # Rows stay locked only until this batch commits
+            snippets.cursor.executemany(
+                "UPDATE code_snippets SET meta = %s, title = NULL, language = NULL, "
+                "favourite = NULL, tags = NULL WHERE id = %s AND meta IS NULL",
+                updates,
+            )
+            snippets.connection.commit()
+
+            converted += len(updates)
+            last_id = rows[-1][0]
+            print(f"Converted {converted} snippets (last id {last_id})")
+    finally:
+        snippets.close()
+
+    return converted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"Done: {compact_rows(args.batch_size)} snippets converted.")
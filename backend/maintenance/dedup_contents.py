@@ -0,0 +1,280 @@
+"""
+Reports how much storage content deduplication saves, and moves or cleans up snippet bodies.
+
+Bodies are deduplicated as they are written while dedup_snippet_content is enabled. --migrate
+moves the bodies of older rows into snippet_contents too, reusing their ciphertext, and
+--prune deletes bodies no snippet points at any more (left behind by edits and deletes).
+--estimate decrypts the bodies still stored inline to show what migrating them would save.
+
+Run from the backend folder:
+    python -m maintenance.dedup_contents [--estimate] [--migrate] [--prune] [--batch-size 500]
+"""
+
+import argparse
+from collections import defaultdict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import psycopg2
+
+from snippets import Snippets
+
+# Snippet rows and bodies, and the bytes the deduplicated rows would take stored inline
+REPORT_QUERY = """
+SELECT
+    COUNT(*),
+    COUNT(*) FILTER (WHERE content_digest IS NULL AND content IS NOT NULL),
+    COALESCE(SUM(octet_length(content)), 0),
+    COUNT(*) FILTER (WHERE content_digest IS NOT NULL),
+    COALESCE(SUM(octet_length((
+        SELECT c.content FROM snippet_contents c
+        WHERE c.user_id = code_snippets.user_id
+            AND c.digest = code_snippets.content_digest
+    ))), 0)
+FROM code_snippets
+"""
+
+UNREFERENCED = (
+    "NOT EXISTS (SELECT 1 FROM code_snippets s "
+    "WHERE s.user_id = c.user_id AND s.content_digest = c.digest)"
+)
+
+DIGEST_SIZE = 32  # Bytes of HMAC-SHA256 stored per deduplicated row and per body
+
+
+def megabytes(size):
+    return f"{size / 1024**2:.2f} MB"
+
+
+def report():
+    """
+    Measure the storage used by snippet bodies, without decrypting anything.
+
+    Returns:
+        dict: Row and body counts, bytes stored and bytes saved by deduplication.
+    """
+    snippets = Snippets(user_id=0)  # Only used for its connection
+    try:
+        snippets.cursor.execute(REPORT_QUERY)
+        total, inline, inline_bytes, deduplicated, referenced_bytes = (
+            snippets.cursor.fetchone()
+        )
+        snippets.cursor.execute(
+            "SELECT COUNT(*), COALESCE(SUM(octet_length(content)), 0) "
+            "FROM snippet_contents"
+        )
+        bodies, stored_bytes = snippets.cursor.fetchone()
+        snippets.cursor.execute(
+            "SELECT COUNT(*), COALESCE(SUM(octet_length(content)), 0) "
+            f"FROM snippet_contents c WHERE {UNREFERENCED}"
+        )
+        unreferenced, unreferenced_bytes = snippets.cursor.fetchone()
+        snippets.connection.commit()
+    finally:
+        snippets.close()
+
+    overhead = DIGEST_SIZE * (deduplicated + bodies)
+    return {
+        "snippets": total,
+        "inline_rows": inline,
+        "inline_bytes": inline_bytes,
+        "deduplicated_rows": deduplicated,
+        "bodies": bodies,
+        "stored_bytes": stored_bytes,
+        "unreferenced_bodies": unreferenced,
+        "unreferenced_bytes": unreferenced_bytes,
+        "saved_bytes": referenced_bytes - stored_bytes - overhead,
+        "saved_percent": (
+            (referenced_bytes - stored_bytes - overhead) / referenced_bytes * 100
+            if referenced_bytes
+            else 0.0
+        ),
+    }
+
+
+def estimate(batch_size=500):
+    """
+    Decrypt the bodies still stored inline and find the ones their owner already has, inline
+    or in snippet_contents.
+
+    Requires:
+        batch_size (int): Rows fetched per query.
+
+    Returns:
+        dict: Inline rows scanned, how many duplicate another body of the same user, and
+        the bytes migrating them would save.
+    """
+    snippets = Snippets(user_id=0)
+    seen = defaultdict(set)  # User ID to the digests of their bodies
+    last_id = 0
+    scanned = duplicates = duplicate_bytes = 0
+
+    try:
+        snippets.cursor.execute("SELECT user_id, digest FROM snippet_contents")
+        for user_id, digest in snippets.cursor:
+            seen[user_id].add(bytes(digest))
+
+        while True:
+            snippets.cursor.execute(
+                "SELECT id, user_id, content FROM code_snippets "
+                "WHERE id > %s AND content_digest IS NULL AND content IS NOT NULL "
+                "ORDER BY id LIMIT %s",
+                (last_id, batch_size),
+            )
+            rows = snippets.cursor.fetchall()
+            snippets.connection.commit()
+            if not rows:
+                break
+
+            for _, user_id, token in rows:
+                content = snippets.encryptor.decrypt(token)
+                digest = snippets.encryptor.content_digest(user_id, content)
+                if digest in seen[user_id]:
+                    duplicates += 1
+                    duplicate_bytes += len(token)
+                else:
+                    seen[user_id].add(digest)
+            scanned += len(rows)
+            last_id = rows[-1][0]
+    finally:
+        snippets.close()
+
+    return {
+        "scanned": scanned,
+        "duplicates": duplicates,
+        # Every migrated row gains a digest, and every body that is not a duplicate a key
+        "saved_bytes": duplicate_bytes - DIGEST_SIZE * (2 * scanned - duplicates),
+    }
+
+
+def migrate(batch_size=500):
+    """
+    Move inline bodies into snippet_contents in id order, locking one batch at a time.
+    The existing ciphertext is stored as is, so nothing is re-encrypted.
+
+    Requires:
+        batch_size (int): Rows fetched and committed per batch.
+
+    Returns:
+        int: Number of rows migrated.
+    """
+    snippets = Snippets(user_id=0)
+    last_id = 0
+    migrated = 0
+
+    try:
+        while True:
+            snippets.cursor.execute(
+                "SELECT id, user_id, content FROM code_snippets "
+                "WHERE id > %s AND content_digest IS NULL AND content IS NOT NULL "
+                "ORDER BY id LIMIT %s FOR UPDATE",
+                (last_id, batch_size),
+            )
+            rows = snippets.cursor.fetchall()
+            if not rows:
+                break
+
+            updates = []
+            for snippet_id, user_id, token in rows:
+                content = snippets.encryptor.decrypt(token)
+                digest = snippets.encryptor.content_digest(user_id, content)
+                snippets.execute("store_content", (user_id, digest, bytes(token)))
+                updates.append((digest, snippet_id))
+
+            # Rows stay locked only until this batch commits
+            snippets.cursor.executemany(
+                "UPDATE code_snippets SET content_digest = %s, content = NULL "
+                "WHERE id = %s AND content_digest IS NULL",
+                updates,
+            )
+            snippets.connection.commit()
+
+            migrated += len(updates)
+            last_id = rows[-1][0]
+            print(f"Migrated {migrated} snippets (last id {last_id})")
+    finally:
+        snippets.close()
+
+    return migrated
+
+
+def prune(batch_size=500):
+    """
+    Delete bodies no snippet points at, one committed batch at a time. A snippet written
+    against a body while it is being deleted fails the batch on the foreign key instead of
+    losing its content; run again to continue.
+
+    Requires:
+        batch_size (int): Bodies deleted per batch.
+
+    Returns:
+        int: Number of bodies deleted.
+    """
+    snippets = Snippets(user_id=0)
+    deleted = 0
+
+    try:
+        while True:
+            snippets.cursor.execute(
+                "DELETE FROM snippet_contents WHERE (user_id, digest) IN ("
+                f"SELECT user_id, digest FROM snippet_contents c WHERE {UNREFERENCED} "
+                "LIMIT %s)",
+                (batch_size,),
+            )
+            count = snippets.cursor.rowcount
+            snippets.connection.commit()
+            if not count:
+                break
+            deleted += count
+            print(f"Deleted {deleted} unreferenced bodies")
+    except psycopg2.Error as error:
+        snippets.connection.rollback()
+        print(f"Stopped pruning: {error}")
+    finally:
+        snippets.close()
+
+    return deleted
+
+
+def print_report(result):
+    print(f"Snippets:                {result['snippets']}")
+    print(
+        f"  stored inline:         {result['inline_rows']} "
+        f"({megabytes(result['inline_bytes'])})"
+    )
+    print(f"  deduplicated:          {result['deduplicated_rows']}")
+    print(
+        f"Stored bodies:           {result['bodies']} "
+        f"({megabytes(result['stored_bytes'])})"
+    )
+    print(
+        f"  unreferenced:          {result['unreferenced_bodies']} "
+        f"({megabytes(result['unreferenced_bytes'])}, removed by --prune)"
+    )
+    print(
+        f"Saved by deduplication:  {megabytes(result['saved_bytes'])} "
+        f"({result['saved_percent']:.1f}% of the deduplicated rows' content)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--estimate", action="store_true")
+    parser.add_argument("--migrate", action="store_true")
+    parser.add_argument("--prune", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.estimate:
+        result = estimate(args.batch_size)
+        print(
+            f"{result['duplicates']} of {result['scanned']} inline snippets duplicate "
+            f"another body of their owner; migrating would save "
+            f"{megabytes(result['saved_bytes'])}."
+        )
+    if args.migrate:
+        print(f"Done: {migrate(args.batch_size)} snippets migrated.")
+    if args.prune:
+        print(f"Done: {prune(args.batch_size)} unreferenced bodies deleted.")
+    print_report(report())
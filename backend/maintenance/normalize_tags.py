@@ -0,0 +1,105 @@
+"""
+One-time backfill that rewrites every snippet's tags into the canonical compact JSON format.
+
+Rewritten rows get a new revision, like any other write, so delta-sync clients fetch them.
+A row whose tags were edited after the batch read them is left alone: the edit already
+stored canonical tags.
+
+Run from the backend folder:
+    python -m maintenance.normalize_tags [--batch-size 500] [--dry-run]
+"""
+
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from auth.database import Database
+from auth.encryption import Encryption
+from snippets import Snippets
+
+
+def normalize_tags(batch_size=500, dry_run=False):
+    """
+    Walk code_snippets in id order and re-encrypt any tags that are not already canonical.
+    Each update only applies if the row still holds the tags that were read, and is made
+    under the owner's revision lock (see Snippets.lock_revisions) so revisions keep
+    committing in order.
+
+    Requires:
+        batch_size (int): Rows fetched and committed per batch.
+        dry_run (bool): Count the rows that would change without writing them.
+
+    Returns:
+        dict: Number of rows scanned, rows rewritten and rows skipped because they changed
+        concurrently.
+    """
+    database = Database()
+    encryptor = Encryption()
+    last_id = 0
+    scanned = 0
+    rewritten = 0
+    skipped = 0
+
+    try:
+        while True:
+            database.cursor.execute(
+                "SELECT id, user_id, tags FROM code_snippets "
+                "WHERE id > %s AND tags IS NOT NULL ORDER BY id LIMIT %s",
+                (last_id, batch_size),
+            )
+            rows = database.cursor.fetchall()
+            if not rows:
+                break
+
+            updates = []
+            for snippet_id, user_id, tags in rows:
+                stored = encryptor.decrypt(tags)
+                canonical = Snippets.encode_tags(Snippets.convert_tags(stored))
+                if stored != canonical:
+                    updates.append(
+                        (user_id, encryptor.encrypt(canonical), snippet_id, tags)
+                    )
+
+            if updates and not dry_run:
+                # In user order, so two runs cannot deadlock on each other's locks
+                for user_id in sorted({update[0] for update in updates}):
+                    database.execute("lock_revisions", (user_id,))
+                applied = 0
+                for user_id, token, snippet_id, tags in updates:
+                    database.cursor.execute(
+                        "UPDATE code_snippets SET tags = %s, "
+                        "revision = nextval('code_snippets_revision_seq'), "
+                        "updated_at = now() WHERE id = %s AND tags = %s",
+                        (token, snippet_id, tags),
+                    )
+                    applied += database.cursor.rowcount
+                skipped += len(updates) - applied
+                rewritten += applied
+            else:
+                rewritten += len(updates)
+            database.connection.commit()  # Keep each batch in its own short transaction
+
+            scanned += len(rows)
+            last_id = rows[-1][0]
+            print(
+                f"Scanned {scanned} snippets, normalized {rewritten}, "
+                f"skipped {skipped} (last id {last_id})"
+            )
+    finally:
+        database.close()
+
+    return {"scanned": scanned, "rewritten": rewritten, "skipped": skipped}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    result = normalize_tags(args.batch_size, args.dry_run)
+    print(
+        f"Done: {result['rewritten']} of {result['scanned']} snippets normalized, "
+        f"{result['skipped']} changed concurrently and left as edited."
+    )
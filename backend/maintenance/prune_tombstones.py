@@ -0,0 +1,69 @@
+"""
+Deletes snippet tombstones older than the retention period and raises the sync horizon.
+
+Clients that synced within the retention period still receive every delete. A client whose
+cursor falls below the horizon gets a full resync (reset) from /snippets/changes instead.
+Safe to run at any time, for example daily from cron.
+
+Run from the backend folder:
+    python -m maintenance.prune_tombstones [--retention-days 30] [--batch-size 1000]
+"""
+
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from auth.database import Database
+
+
+def prune_tombstones(retention_days=30, batch_size=1000):
+    """
+    Delete expired tombstones in committed batches, raising the horizon in the same
+    transaction as each delete so no client can slip between the two.
+
+    Requires:
+        retention_days (int): Tombstones younger than this are kept.
+        batch_size (int): Tombstones deleted per batch.
+
+    Returns:
+        int: Number of tombstones deleted.
+    """
+    database = Database()
+    deleted = 0
+
+    try:
+        while True:
+            database.cursor.execute(
+                "WITH pruned AS ("
+                "DELETE FROM snippet_tombstones WHERE snippet_id IN ("
+                "SELECT snippet_id FROM snippet_tombstones "
+                "WHERE deleted_at < now() - make_interval(days => %s) LIMIT %s) "
+                "RETURNING revision) "
+                "UPDATE snippet_sync_horizon SET revision = GREATEST(revision, "
+                "(SELECT MAX(revision) FROM pruned)) "
+                "RETURNING (SELECT COUNT(*) FROM pruned)",
+                (retention_days, batch_size),
+            )
+            count = database.cursor.fetchone()[0]
+            database.connection.commit()
+            if not count:
+                break
+            deleted += count
+            print(f"Deleted {deleted} tombstones")
+    finally:
+        database.close()
+
+    return deleted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--retention-days", type=int, default=30)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(
+        f"Done: {prune_tombstones(args.retention_days, args.batch_size)} "
+        "tombstones deleted."
+    )
@@ -0,0 +1,263 @@
+"""
+Re-encrypts every code_snippets and snippet_contents value under the current fernet_key while
+the app keeps running.
+
+Rotation steps:
+    1. Generate a new key, move the current fernet_key into fernet_old_keys and set the new
+       key as fernet_key. Restart the API: new writes use the new key, reads accept both.
+    2. Run this worker until it reports completion. It can be stopped and resumed at any time.
+    3. Remove the old key from fernet_old_keys.
+
+Run from the backend folder:
+    python -m maintenance.rotate_keys [--batch-size 200] [--rows-per-second 500]
+"""
+
+import argparse
+import json
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from auth.database import Database
+from auth.encryption import Encryption
+
+ENCRYPTED_COLUMNS = ("title", "content", "language", "favourite", "tags", "meta")
+
+
+class KeyRotationWorker(Database):
+    """
+    Walks code_snippets, then snippet_contents, in keyset-paginated batches and rotates
+    each row's tokens.
+
+    Rows are read without locks. Each update only applies if the row still holds the tokens
+    that were read; a row the API wrote in the meantime is read again under a row lock and
+    rotated, since a write may replace some columns and leave others under the old key.
+    """
+
+    def __init__(
+        self, batch_size=200, rows_per_second=500, checkpoint="rotate_keys.json"
+    ):
+        super().__init__()
+        self.encryptor = Encryption()
+        self.batch_size = batch_size
+        self.rows_per_second = rows_per_second
+        self.checkpoint = checkpoint
+        self.progress = {
+            "last_id": 0,
+            "content_key": [0, ""],  # (user_id, hex digest) of the last body rotated
+            "scanned": 0,
+            "rotated": 0,
+            "retried": 0,  # Rows changed concurrently and rotated on a second read
+            "skipped": 0,  # Rows deleted concurrently
+        }
+        self.running = False
+
+    def load_checkpoint(self):
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            with open(self.checkpoint) as file:
+                self.progress.update(json.load(file))
+
+    def save_checkpoint(self):
+        if self.checkpoint:
+            with open(self.checkpoint, "w") as file:
+                json.dump(self.progress, file)
+
+    def clear_checkpoint(self):
+        """Forget a finished run, so the next rotation starts from the first row."""
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+    def remaining_rows(self):
+        self.cursor.execute(
+            "SELECT COUNT(*) FROM code_snippets WHERE id > %s",
+            (self.progress["last_id"],),
+        )
+        count = self.cursor.fetchone()[0]
+        user_id, digest = self.progress["content_key"]
+        self.cursor.execute(
+            "SELECT COUNT(*) FROM snippet_contents WHERE (user_id, digest) > (%s, %s)",
+            (user_id, bytes.fromhex(digest)),
+        )
+        count += self.cursor.fetchone()[0]
+        self.connection.commit()
+        return count
+
+    def rotate_batch(self):
+        """
+        Rotate the next batch of rows after the checkpointed id.
+
+        Returns:
+            int: Number of rows scanned, 0 once the table is exhausted.
+        """
+        columns = ", ".join(ENCRYPTED_COLUMNS)
+        self.cursor.execute(
+            f"SELECT id, {columns} FROM code_snippets WHERE id > %s ORDER BY id LIMIT %s",
+            (self.progress["last_id"], self.batch_size),
+        )
+        rows = self.cursor.fetchall()
+        if not rows:
+            self.connection.commit()
+            return 0
+
+        for snippet_id, *tokens in rows:
+            self.rotate_row(snippet_id, tokens)
+
+        self.connection.commit()
+        self.progress["scanned"] += len(rows)
+        self.progress["last_id"] = rows[-1][0]
+        self.save_checkpoint()
+        return len(rows)
+
+    def rotate_row(self, snippet_id, tokens):
+        """
+        Rotate one code_snippets row. If the guarded update misses because the row changed
+        after it was read, the row is read again with FOR UPDATE (held until the batch
+        commits) and rotated from its current tokens, so no column is passed over.
+        """
+        columns = ", ".join(ENCRYPTED_COLUMNS)
+        assignments = ", ".join(f"{column} = %s" for column in ENCRYPTED_COLUMNS)
+        guards = " AND ".join(
+            f"{column} IS NOT DISTINCT FROM %s" for column in ENCRYPTED_COLUMNS
+        )
+        rotated = [self.encryptor.rotate(token) for token in tokens]
+        if rotated == tokens:
+            return
+        self.cursor.execute(
+            f"UPDATE code_snippets SET {assignments} WHERE id = %s AND {guards}",
+            (*rotated, snippet_id, *tokens),
+        )
+        if self.cursor.rowcount:
+            self.progress["rotated"] += 1
+            return
+
+        self.cursor.execute(
+            f"SELECT {columns} FROM code_snippets WHERE id = %s FOR UPDATE",
+            (snippet_id,),
+        )
+        row = self.cursor.fetchone()
+        if row is None:
+            self.progress["skipped"] += 1
+            return
+        tokens = list(row)
+        rotated = [self.encryptor.rotate(token) for token in tokens]
+        if rotated != tokens:
+            self.cursor.execute(
+                f"UPDATE code_snippets SET {assignments} WHERE id = %s",
+                (*rotated, snippet_id),
+            )
+        self.progress["retried"] += 1
+
+    def rotate_contents_batch(self):
+        """
+        Rotate the next batch of deduplicated bodies after the checkpointed key. A body is
+        never changed once stored, so an update only misses if the body was deleted.
+
+        Returns:
+            int: Number of bodies scanned, 0 once the table is exhausted.
+        """
+        user_id, digest = self.progress["content_key"]
+        self.cursor.execute(
+            "SELECT user_id, digest, content FROM snippet_contents "
+            "WHERE (user_id, digest) > (%s, %s) ORDER BY user_id, digest LIMIT %s",
+            (user_id, bytes.fromhex(digest), self.batch_size),
+        )
+        rows = self.cursor.fetchall()
+        if not rows:
+            self.connection.commit()
+            return 0
+
+        for user_id, digest, token in rows:
+            rotated = self.encryptor.rotate(token)
+            if rotated == token:
+                continue
+            self.cursor.execute(
+                "UPDATE snippet_contents SET content = %s "
+                "WHERE user_id = %s AND digest = %s AND content = %s",
+                (rotated, user_id, digest, token),
+            )
+            if self.cursor.rowcount:
+                self.progress["rotated"] += 1
+            else:
+                self.progress["skipped"] += 1
+
+        self.connection.commit()
+        self.progress["scanned"] += len(rows)
+        last_user_id, last_digest, _ = rows[-1]
+        self.progress["content_key"] = [last_user_id, bytes(last_digest).hex()]
+        self.save_checkpoint()
+        return len(rows)
+
+    def run(self):
+        """
+        Rotate both tables, sleeping between batches to stay under rows_per_second.
+
+        Returns:
+            dict: Final progress counters. Once both tables are done the checkpoint is
+            removed, so a later rotation starts over.
+        """
+        self.load_checkpoint()
+        remaining = self.remaining_rows()
+        started = time.monotonic()
+        scanned_at_start = self.progress["scanned"]
+        self.running = True
+        finished = False
+        print(f"Rotating {remaining} rows after snippet id {self.progress['last_id']}")
+
+        try:
+            while self.running:
+                batch_started = time.monotonic()
+                # Snippet rows first, then the deduplicated bodies they point at
+                scanned = self.rotate_batch() or self.rotate_contents_batch()
+                if not scanned:
+                    finished = True
+                    break
+
+                # Throttle so the worker never takes more than its share of the database
+                budget = scanned / self.rows_per_second
+                elapsed = time.monotonic() - batch_started
+                if elapsed < budget:
+                    time.sleep(budget - elapsed)
+
+                done = self.progress["scanned"] - scanned_at_start
+                throughput = done / (time.monotonic() - started)
+                percent = done / remaining * 100 if remaining else 100.0
+                print(
+                    f"{percent:5.1f}% | scanned {self.progress['scanned']} | "
+                    f"rotated {self.progress['rotated']} | "
+                    f"skipped {self.progress['skipped']} | {throughput:.0f} rows/s"
+                )
+        finally:
+            self.running = False
+            if finished:
+                self.clear_checkpoint()
+            else:
+                self.save_checkpoint()
+            self.close()
+
+        return self.progress
+
+    def stop(self):
+        """Finish the current batch and stop; the checkpoint allows resuming later."""
+        self.running = False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--rows-per-second", type=float, default=500)
+    parser.add_argument("--checkpoint", default="rotate_keys.json")
+    args = parser.parse_args()
+
+    worker = KeyRotationWorker(args.batch_size, args.rows_per_second, args.checkpoint)
+    try:
+        progress = worker.run()
+    except KeyboardInterrupt:
+        progress = worker.progress
+        print("Interrupted, run again to resume from the checkpoint.")
+    print(
+        f"Rotated {progress['rotated']} of {progress['scanned']} rows "
+        f"({progress['retried']} changed concurrently and were rotated on a second read, "
+        f"{progress['skipped']} deleted concurrently)."
+    )
@@ -0,0 +1,236 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+
+from responses import ORJSONResponse
+
+# Requests that are never queued or shed: probes, metrics and the profiling endpoints
+EXEMPT_PREFIXES = ("/healthz", "/readyz", "/metrics", "/debug")
+
+# Route classes by path prefix; anything else is "read" for GET and "write" otherwise
+ROUTE_CLASSES = {
+    "/create_snippet": "create",
+    "/get_snippets": "bulk_read",
+    "/snippets/changes": "bulk_read",
+    "/snippets/batch": "write",
+    "/login": "auth",
+    "/create_user": "auth",
+    "/change_password": "auth",
+}
+
+# (latency floor in seconds, initial, minimum and maximum concurrency) per route class. A
+# class never backs off while its recent latency is under the floor, so jitter on very fast
+# routes is not mistaken for queueing. Logins and password changes wait on scrypt, so they
+# get few slots and a higher floor.
+LIMITS = {
+    "read": (0.02, 64, 4, 256),
+    "bulk_read": (0.05, 16, 2, 64),
+    "create": (0.05, 16, 2, 64),
+    "write": (0.05, 32, 2, 128),
+    "auth": (0.1, 8, 1, 32),
+}
+
+# How long a request may wait for a slot before it is shed
+QUEUE_TIMEOUT = float(os.getenv("admission_queue_timeout_ms", "1000")) / 1000
+
+
+def route_class(method, path):
+    for prefix, name in ROUTE_CLASSES.items():
+        if path.startswith(prefix):
+            return name
+    return "read" if method in ("GET", "HEAD") else "write"
+
+
+class AdaptiveLimit:
+    """
+    A concurrency limit for one route class, adjusted by AIMD from observed latency.
+
+    Latency is judged against the class's own baseline rather than a fixed target, so the
+    limit fits whatever hardware and data it runs on: `recent` is a fast moving average of
+    successful response times and `baseline` a slow one that falls quickly and rises
+    slowly, approximating the latency without queueing. While recent latency stays within
+    `tolerance` times the baseline (or under the floor), every response adds about one slot
+    per limit's worth of requests. Once queueing pushes it beyond, or a request fails, the
+    limit is cut by `backoff`, at most once per recent latency interval so a single burst
+    is not punished repeatedly.
+
+    Requests over the limit wait in a FIFO queue for up to queue_timeout seconds and are
+    refused when the queue is full or the wait runs out. Only used from the event loop, so
+    it needs no locking.
+    """
+
+    def __init__(
+        self,
+        floor,
+        initial,
+        minimum,
+        maximum,
+        queue_timeout=1.0,
+        backoff=0.9,
+        tolerance=1.5,
+    ):
+        self.floor = floor
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.queue_timeout = queue_timeout
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.recent = None  # Fast moving average of successful response times
+        self.baseline = None  # Slow one, the latency without queueing
+        self.in_flight = 0
+        self.waiters = deque()
+        self.last_decrease = 0.0
+        self.admitted = 0
+        self.rejected = 0
+
+    async def acquire(self):
+        """
+        Returns:
+            bool: True once the request may run (call release() afterwards), False if it
+            should be shed.
+        """
+        if self.in_flight < int(self.limit) and not self.waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+        if len(self.waiters) >= int(self.limit):
+            self.rejected += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done():  # Granted just as the wait ran out
+                self.admitted += 1
+                return True
+            waiter.cancel()
+            self.waiters.remove(waiter)
+            self.rejected += 1
+            return False
+        except asyncio.CancelledError:  # The client went away while queued
+            if waiter.done():
+                self.in_flight -= 1
+                self.wake()
+            else:
+                waiter.cancel()
+                self.waiters.remove(waiter)
+            raise
+        self.admitted += 1
+        return True
+
+    def observe(self, seconds):
+        if self.baseline is None:
+            self.recent = self.baseline = seconds
+            return
+        self.recent += (seconds - self.recent) * 0.2
+        # Learn a lower baseline quickly. A higher one is only learned from requests that
+        # ran with the limit at most half used, so queueing never becomes the new normal,
+        # while a route that really got slower is relearned once the limit backs off.
+        if seconds < self.baseline:
+            self.baseline += (seconds - self.baseline) * 0.1
+        elif self.in_flight < self.limit / 2 or self.limit <= self.minimum:
+            self.baseline += (seconds - self.baseline) * 0.01
+
+    def release(self, seconds, ok=True):
+        if ok:
+            self.observe(seconds)
+        self.in_flight -= 1
+        now = time.monotonic()
+        queueing = self.recent is not None and (
+            self.recent > self.floor and self.recent > self.baseline * self.tolerance
+        )
+        if not ok or queueing:
+            if now - self.last_decrease > max(self.recent or 0.0, self.floor):
+                self.limit = max(self.minimum, self.limit * self.backoff)
+                self.last_decrease = now
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self.wake()
+
+    def wake(self):
+        """Hand free slots straight to queued requests, oldest first."""
+        while self.waiters and self.in_flight < int(self.limit):
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(True)
+
+    def stats(self):
+        return {
+            "limit": int(self.limit),
+            "latency": self.recent or 0.0,
+            "baseline_latency": self.baseline or 0.0,
+            "in_flight": self.in_flight,
+            "queued": len(self.waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+class AdmissionMiddleware:
+    """
+    Server-wide admission control: caps in-flight requests per route class (see
+    ROUTE_CLASSES), adapts each cap to the latency it observes, and answers 503 with
+    Retry-After as soon as a request cannot start within queue_timeout. Cheap reads keep
+    their own capacity while bulk reads or creates back up, instead of everything slowing
+    down together.
+
+    Unlike the per-user rate limits, this protects the server's capacity, not fairness.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(EXEMPT_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        limit = limits[route_class(scope["method"], scope["path"])]
+        if not await limit.acquire():
+            retry_after = max(1, math.ceil(QUEUE_TIMEOUT))
+            response = ORJSONResponse(
+                {
+                    "detail": {
+                        "message": "Server busy. Try again shortly.",
+                        "retry_after": retry_after,
+                    }
+                },
+                status_code=503,
+                headers={"Retry-After": str(retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            limit.release(time.perf_counter() - start, ok=status < 500)
+
+
+limits = {
+    name: AdaptiveLimit(*settings, queue_timeout=QUEUE_TIMEOUT)
+    for name, settings in LIMITS.items()
+}
+
+
+def admission_stats():
+    """
+    Returns:
+        dict: AdaptiveLimit.stats() of each route class.
+    """
+    return {name: limit.stats() for name, limit in limits.items()}
@@ -0,0 +1,193 @@
+import asyncio
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+
+from tracing import span
+
+# zstd and brotli are optional, gzip is always available
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+)
+
+
+class GzipStream:
+    def __init__(self):
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31: gzip container
+
+    def compress(self, data):
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data=b""):
+        return self.compressor.compress(data) + self.compressor.flush()
+
+
+class ZstdStream:
+    def __init__(self):
+        self.compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data) + self.compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def finish(self, data=b""):
+        return self.compressor.compress(data) + self.compressor.flush()
+
+
+class BrotliStream:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=4)  # Fast enough for dynamic bodies
+
+    def compress(self, data):
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self, data=b""):
+        return self.compressor.process(data) + self.compressor.finish()
+
+
+# In order of preference when the client accepts several equally
+STREAMS = {}
+if zstandard:
+    STREAMS["zstd"] = ZstdStream
+if brotli:
+    STREAMS["br"] = BrotliStream
+STREAMS["gzip"] = GzipStream
+
+
+def parse_accept_encoding(header):
+    """
+    Returns:
+        dict: Each coding named in an Accept-Encoding header, mapped to its q-value.
+    """
+    accepted = {}
+    for part in header.split(","):
+        coding, *params = part.strip().split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+class CompressionMiddleware:
+    """
+    Compresses response bodies with the best encoding the client accepts: zstd or brotli
+    when their packages are installed, otherwise gzip.
+
+    Bodies smaller than minimum_size are sent as they are. Bodies of offload_size bytes or
+    more are compressed in a worker thread so the event loop keeps serving other requests.
+    Streaming responses are compressed chunk by chunk, with each chunk flushed so clients
+    can start decoding straight away.
+    """
+
+    def __init__(self, app, minimum_size=1024, offload_size=256 * 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+
+    def choose_encoding(self, header):
+        accepted = parse_accept_encoding(header)
+        best, best_quality = None, 0.0
+        for coding in STREAMS:
+            quality = accepted.get(coding, accepted.get("*", 0.0))
+            if quality > best_quality:
+                best, best_quality = coding, quality
+        return best
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = self.choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+    """Holds back a response's start message until its first body chunk shows whether
+    to compress it."""
+
+    def __init__(self, middleware, encoding, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.downstream = send
+        self.start = None
+        self.stream = None
+        self.passthrough = False
+
+    async def compress(self, data, final):
+        stream = self.stream
+        compress = stream.finish if final else stream.compress
+        with span("compress"):
+            if len(data) >= self.middleware.offload_size:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(None, compress, data)
+            return compress(data)
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.stream is None:
+            headers = MutableHeaders(raw=list(self.start["headers"]))
+            self.start["headers"] = headers.raw
+            content_type = headers.get("content-type", "")
+            if "content-encoding" in headers or not content_type.startswith(
+                COMPRESSIBLE_TYPES
+            ):
+                self.passthrough = True
+            else:
+                headers.add_vary_header("Accept-Encoding")
+                if not more_body and len(body) < self.middleware.minimum_size:
+                    self.passthrough = True
+
+            if self.passthrough:
+                await self.downstream(self.start)
+                await self.downstream(message)
+                return
+
+            self.stream = STREAMS[self.encoding]()
+            headers["Content-Encoding"] = self.encoding
+            body = await self.compress(body, final=not more_body)
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(body))
+            await self.downstream(self.start)
+        else:
+            body = await self.compress(body, final=not more_body)
+
+        await self.downstream(
+            {"type": "http.response.body", "body": body, "more_body": more_body}
+        )
@@ -0,0 +1,50 @@
+import time
+from starlette.datastructures import MutableHeaders
+
+import tracing
+
+
+class MetricsMiddleware:
+    """
+    Times each request, records it in its route's latency histogram and adds a
+    Server-Timing header with the time spent in each traced stage (db, crypto, ...).
+
+    Only installed when metrics are enabled. Requests are labelled by route template
+    (/snippets/{snippet_id}), never by raw path, to keep the number of series bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = tracing.start_trace()
+        trace = tracing.current_trace.get()
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing",
+                    tracing.server_timing(trace, time.perf_counter() - start),
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            route = scope.get("route")
+            tracing.record_request(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                status,
+                time.perf_counter() - start,
+            )
+            tracing.end_trace(token)
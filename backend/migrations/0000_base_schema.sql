@@ -0,0 +1,21 @@
+-- Tables the API was originally deployed with. Existing databases already have them, so
+-- every statement is a no-op there; fresh databases are created from scratch.
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL,
+    dark_mode BOOLEAN NOT NULL DEFAULT FALSE,
+    use_ai BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS code_snippets (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users (id),
+    title TEXT,
+    content TEXT,
+    language TEXT,
+    favourite TEXT,
+    tags TEXT,
+    is_public BOOLEAN NOT NULL DEFAULT FALSE,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
@@ -0,0 +1,7 @@
+-- Compact row layout: title, language, favourite and tags in one encrypted envelope.
+-- Rows written in the compact layout leave the per-field columns empty.
+ALTER TABLE code_snippets ADD COLUMN IF NOT EXISTS meta TEXT;
+ALTER TABLE code_snippets ALTER COLUMN title DROP NOT NULL;
+ALTER TABLE code_snippets ALTER COLUMN language DROP NOT NULL;
+ALTER TABLE code_snippets ALTER COLUMN favourite DROP NOT NULL;
+ALTER TABLE code_snippets ALTER COLUMN tags DROP NOT NULL;
@@ -0,0 +1,2 @@
+-- Self-describing scrypt hashes are longer than the legacy 64 character SHA-256 digests.
+ALTER TABLE users ALTER COLUMN password TYPE TEXT;
@@ -0,0 +1,86 @@
+-- migrate: no-transaction
+-- Delta sync: every write stamps a row with a new revision from one shared sequence, and
+-- deletes leave a tombstone carrying their own revision, so a client can ask for
+-- "everything after revision N".
+--
+-- Runs online, with the previous version still serving. A volatile column default would
+-- rewrite code_snippets under an ACCESS EXCLUSIVE lock, so the column is added empty, the
+-- default applies to new rows only, existing rows are numbered in committed batches, and
+-- NOT NULL is proven by a separately validated CHECK (Postgres 12+ then skips the scan).
+-- Every lock taken is either brief or lets reads and writes continue. Apply it before
+-- deploying the version that uses revisions.
+CREATE SEQUENCE IF NOT EXISTS code_snippets_revision_seq;
+
+-- migrate: split
+-- now() is stable, so this default is stored once instead of rewriting the table
+ALTER TABLE code_snippets
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+-- migrate: split
+ALTER TABLE code_snippets ADD COLUMN IF NOT EXISTS revision BIGINT;
+
+-- migrate: split
+-- Rows inserted from here on are numbered by the default
+ALTER TABLE code_snippets
+    ALTER COLUMN revision SET DEFAULT nextval('code_snippets_revision_seq');
+
+-- migrate: split
+-- Number the existing rows in id order, committing every 5000
+DO $$
+DECLARE
+    last_id BIGINT := 0;
+    next_id BIGINT;
+BEGIN
+    LOOP
+        SELECT max(id) INTO next_id FROM (
+            SELECT id FROM code_snippets WHERE id > last_id ORDER BY id LIMIT 5000
+        ) batch;
+        EXIT WHEN next_id IS NULL;
+        UPDATE code_snippets SET revision = nextval('code_snippets_revision_seq')
+        WHERE id > last_id AND id <= next_id AND revision IS NULL;
+        last_id := next_id;
+        COMMIT;
+    END LOOP;
+END
+$$;
+
+-- migrate: split
+-- VALIDATE scans under SHARE UPDATE EXCLUSIVE, which does not block reads or writes; SET
+-- NOT NULL then only needs a brief ACCESS EXCLUSIVE lock
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'code_snippets' AND column_name = 'revision'
+            AND is_nullable = 'YES'
+    ) THEN
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_constraint WHERE conname = 'code_snippets_revision_not_null'
+        ) THEN
+            ALTER TABLE code_snippets ADD CONSTRAINT code_snippets_revision_not_null
+                CHECK (revision IS NOT NULL) NOT VALID;
+        END IF;
+        COMMIT;
+        ALTER TABLE code_snippets VALIDATE CONSTRAINT code_snippets_revision_not_null;
+        COMMIT;
+        ALTER TABLE code_snippets ALTER COLUMN revision SET NOT NULL;
+        ALTER TABLE code_snippets DROP CONSTRAINT code_snippets_revision_not_null;
+    END IF;
+END
+$$;
+
+-- migrate: split
+CREATE TABLE IF NOT EXISTS snippet_tombstones (
+    snippet_id BIGINT PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    revision BIGINT NOT NULL DEFAULT nextval('code_snippets_revision_seq'),
+    deleted_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- migrate: split
+CREATE INDEX CONCURRENTLY IF NOT EXISTS code_snippets_user_revision_idx
+    ON code_snippets (user_id, revision);
+
+-- migrate: split
+CREATE INDEX CONCURRENTLY IF NOT EXISTS snippet_tombstones_user_revision_idx
+    ON snippet_tombstones (user_id, revision);
@@ -0,0 +1,2 @@
+-- Accounts are disabled as soon as deletion is requested and purged in the background.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS disabled_at TIMESTAMPTZ;
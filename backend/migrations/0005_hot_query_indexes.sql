@@ -0,0 +1,19 @@
+-- migrate: no-transaction
+-- Indexes for the access paths in Snippets and LoginSystem. Built concurrently so writes
+-- keep flowing on large tables; each statement commits on its own.
+
+-- get_snippets and account deletion: WHERE user_id = %s ORDER BY created_at, id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS code_snippets_user_created_idx
+    ON code_snippets (user_id, created_at, id);
+
+-- migrate: split
+-- get_public_snippet_by_id: WHERE id = %s AND is_public = TRUE
+CREATE INDEX CONCURRENTLY IF NOT EXISTS code_snippets_public_id_idx
+    ON code_snippets (id) WHERE is_public;
+
+-- migrate: split
+-- resume_account_deletions: WHERE disabled_at IS NOT NULL
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_disabled_idx
+    ON users (id) WHERE disabled_at IS NOT NULL;
+
+-- authenticate: WHERE username = %s is served by the users_username_key unique index.
@@ -0,0 +1,27 @@
+-- Store ciphertext as raw bytes instead of base64 text: about a quarter smaller on disk and
+-- on the wire, and psycopg2 hands bytea to the decrypt path as a memoryview, without copies.
+-- Text tokens are decoded to the raw Fernet token; "zl:"/"zs:" prefixes become the codec
+-- bytes 0x01/0x02.
+--
+-- Needs downtime: the ALTER rewrites code_snippets under an ACCESS EXCLUSIVE lock, blocking
+-- every read and write of snippets for as long as the rewrite takes (roughly the time to copy
+-- the table), and versions before it cannot read the bytea columns. Deploy order: stop every
+-- API instance and maintenance worker, apply this migration, then start the new version.
+CREATE FUNCTION pg_temp.token_to_bytea(token TEXT) RETURNS BYTEA AS $$
+    SELECT CASE
+        WHEN token IS NULL THEN NULL
+        WHEN token LIKE 'zl:%' THEN
+            '\x01'::BYTEA || decode(translate(substr(token, 4), '-_', '+/'), 'base64')
+        WHEN token LIKE 'zs:%' THEN
+            '\x02'::BYTEA || decode(translate(substr(token, 4), '-_', '+/'), 'base64')
+        ELSE decode(translate(token, '-_', '+/'), 'base64')
+    END
+$$ LANGUAGE SQL IMMUTABLE;
+
+ALTER TABLE code_snippets
+    ALTER COLUMN title TYPE BYTEA USING pg_temp.token_to_bytea(title),
+    ALTER COLUMN content TYPE BYTEA USING pg_temp.token_to_bytea(content),
+    ALTER COLUMN language TYPE BYTEA USING pg_temp.token_to_bytea(language),
+    ALTER COLUMN favourite TYPE BYTEA USING pg_temp.token_to_bytea(favourite),
+    ALTER COLUMN tags TYPE BYTEA USING pg_temp.token_to_bytea(tags),
+    ALTER COLUMN meta TYPE BYTEA USING pg_temp.token_to_bytea(meta);
@@ -0,0 +1,28 @@
+-- Content deduplication: snippet bodies live in snippet_contents, keyed by the owner and a
+-- keyed hash of the plaintext, so identical bodies of one user are encrypted and stored once.
+-- Rows written before (or with dedup_snippet_content off) keep their body in `content` and
+-- leave content_digest NULL.
+CREATE TABLE IF NOT EXISTS snippet_contents (
+    user_id INTEGER NOT NULL,
+    digest BYTEA NOT NULL,
+    content BYTEA NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (user_id, digest)
+);
+
+ALTER TABLE code_snippets ADD COLUMN IF NOT EXISTS content_digest BYTEA;
+
+-- A body cannot be removed while a snippet still points at it. NOT VALID skips scanning the
+-- existing rows, which all have a NULL digest; new and updated rows are still checked.
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint WHERE conname = 'code_snippets_content_fkey'
+    ) THEN
+        ALTER TABLE code_snippets
+            ADD CONSTRAINT code_snippets_content_fkey
+            FOREIGN KEY (user_id, content_digest)
+            REFERENCES snippet_contents (user_id, digest) NOT VALID;
+    END IF;
+END
+$$;
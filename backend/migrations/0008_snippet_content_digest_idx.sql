@@ -0,0 +1,5 @@
+-- migrate: no-transaction
+-- Finds the snippets pointing at a stored body: the foreign key check when a body is
+-- deleted, and the unreferenced-body scan of maintenance/dedup_contents.py.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS code_snippets_user_content_digest_idx
+    ON code_snippets (user_id, content_digest) WHERE content_digest IS NOT NULL;
@@ -0,0 +1,12 @@
+-- Tombstones are pruned after a retention period (maintenance/prune_tombstones.py). The
+-- horizon is the highest revision pruned so far: a client whose cursor is below it may
+-- have missed deletes that are no longer recorded, so it is told to resync from scratch.
+CREATE TABLE IF NOT EXISTS snippet_sync_horizon (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    revision BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO snippet_sync_horizon (id) VALUES (TRUE) ON CONFLICT DO NOTHING;
+
+CREATE INDEX IF NOT EXISTS snippet_tombstones_deleted_at_idx
+    ON snippet_tombstones (deleted_at);
@@ -0,0 +1,11 @@
+-- Progress of account deletions, readable from every worker process. A row is added when
+-- an account is disabled and updated by whichever process purges it.
+CREATE TABLE IF NOT EXISTS account_deletions (
+    user_id INTEGER PRIMARY KEY,
+    status TEXT NOT NULL,
+    total_snippets INTEGER,
+    deleted_snippets INTEGER NOT NULL DEFAULT 0,
+    started_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    finished_at TIMESTAMPTZ,
+    error TEXT
+);
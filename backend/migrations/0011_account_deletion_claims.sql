@@ -0,0 +1,6 @@
+-- Deletion jobs are claimed through their account_deletions row rather than a session
+-- advisory lock, which Supabase's transaction pooler (port 6543) does not tie to one server
+-- connection. A job refreshes heartbeat_at with every chunk; a running job whose heartbeat
+-- is older than the claim lease is taken to have died and may be claimed again.
+ALTER TABLE account_deletions ADD COLUMN IF NOT EXISTS claimed_by TEXT;
+ALTER TABLE account_deletions ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMPTZ;
@@ -0,0 +1,192 @@
+import json
+import os
+import re
+import psycopg2
+
+from auth.database import Database
+from queries import QUERIES
+
+MIGRATIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+NO_TRANSACTION = "-- migrate: no-transaction"
+# Separates the statements of a no-transaction script, each of which commits on its own
+STATEMENT_BREAK = "-- migrate: split"
+CONCURRENT_INDEX = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)",
+    re.IGNORECASE,
+)
+
+# The registered queries every request leans on, with representative parameters. Each must
+# be able to run without a sequential scan of the tables it touches.
+HOT_QUERIES = {
+    name: (QUERIES[name], params)
+    for name, params in {
+        "get_snippets": (1,),
+        "get_changed_snippets": (1, 0),
+        "get_deleted_snippets": (1, 0),
+        "get_public_snippet_by_id": (1,),
+        "get_user_snippet_by_id": (1, 1),
+        "get_snippet_by_id": (1, 1, 1),
+        "find_content": (1, b""),
+        "authenticate": ("username",),
+        "get_user": (1,),
+    }.items()
+}
+
+
+class MigrationError(Exception):
+    """A migration ran without a database error but did not leave the expected schema."""
+
+
+class Migrator(Database):
+    """
+    Applies the numbered .sql files in this folder in order and records each one in
+    schema_migrations, so every database can be brought to the same version.
+
+    A file runs in a single transaction unless its first line is
+    "-- migrate: no-transaction" (needed for CREATE INDEX CONCURRENTLY), in which case its
+    statements, separated by "-- migrate: split" lines, each commit on their own. Every
+    migration is written to be safe to re-run.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.cursor.execute(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version TEXT PRIMARY KEY, applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+        )
+        self.connection.commit()
+
+    def available(self):
+        """
+        Returns:
+            list: (version, path) of every migration file, in order.
+        """
+        files = sorted(
+            name for name in os.listdir(MIGRATIONS_DIR) if name.endswith(".sql")
+        )
+        return [(name[:-4], os.path.join(MIGRATIONS_DIR, name)) for name in files]
+
+    def applied(self):
+        self.cursor.execute("SELECT version FROM schema_migrations")
+        versions = {row[0] for row in self.cursor.fetchall()}
+        self.connection.commit()
+        return versions
+
+    def pending(self):
+        applied = self.applied()
+        return [
+            (version, path)
+            for version, path in self.available()
+            if version not in applied
+        ]
+
+    def apply(self, version, path):
+        with open(path) as file:
+            script = file.read()
+
+        if script.startswith(NO_TRANSACTION):
+            self.connection.autocommit = True
+            try:
+                for statement in script.split(STATEMENT_BREAK):
+                    lines = [
+                        line
+                        for line in statement.splitlines()
+                        if not line.startswith("--")
+                    ]
+                    if "".join(lines).strip():
+                        self.run_concurrently(statement)
+            finally:
+                self.connection.autocommit = False
+        else:
+            self.cursor.execute(script)
+
+        self.cursor.execute(
+            "INSERT INTO schema_migrations (version) VALUES (%s)", (version,)
+        )
+        self.connection.commit()
+
+    def invalid_index(self, name):
+        """
+        Returns:
+            bool: Whether the index exists but is marked invalid, as a failed or
+            interrupted CREATE INDEX CONCURRENTLY leaves it.
+        """
+        self.cursor.execute(
+            "SELECT NOT i.indisvalid FROM pg_index i "
+            "JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = %s",
+            (name,),
+        )
+        row = self.cursor.fetchone()
+        return bool(row and row[0])
+
+    def run_concurrently(self, statement):
+        """
+        Run one statement of a no-transaction script. An invalid index left by an earlier
+        failed build would satisfy IF NOT EXISTS, so it is dropped and built again, and the
+        new index must come out valid.
+        """
+        match = CONCURRENT_INDEX.search(statement)
+        if match and self.invalid_index(match.group(1)):
+            self.cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)}")
+        self.cursor.execute(statement)
+        if match and self.invalid_index(match.group(1)):
+            raise MigrationError(f"Index {match.group(1)} was left invalid")
+
+    def migrate(self):
+        """
+        Apply every pending migration, stopping at the first failure.
+
+        Returns:
+            dict: Success status and the versions applied, or the failing version and error.
+        """
+        done = []
+        for version, path in self.pending():
+            try:
+                self.apply(version, path)
+            except (psycopg2.Error, MigrationError) as error:
+                self.connection.rollback()
+                return {
+                    "success": False,
+                    "applied": done,
+                    "failed": version,
+                    "error": str(error),
+                }
+            done.append(version)
+            print(f"Applied {version}")
+        return {"success": True, "applied": done}
+
+    def sequential_scans(self, query, params):
+        """
+        Plan a query with sequential scans priced out, so a Seq Scan in the plan means no
+        index can serve it at all rather than that the table is small.
+
+        Returns:
+            list: Names of the tables the plan still scans sequentially.
+        """
+        self.cursor.execute("SET LOCAL enable_seqscan = off")
+        self.cursor.execute(f"EXPLAIN (FORMAT JSON) {query}", params)
+        plan = self.cursor.fetchone()[0]
+        self.connection.rollback()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        tables = []
+        nodes = [plan[0]["Plan"]]
+        while nodes:
+            node = nodes.pop()
+            if node["Node Type"] == "Seq Scan":
+                tables.append(node["Relation Name"])
+            nodes.extend(node.get("Plans", []))
+        return tables
+
+    def check_query_plans(self, queries=None):
+        """
+        Returns:
+            dict: Hot query name to the tables it scans sequentially, for failing queries only.
+        """
+        failures = {}
+        for name, (query, params) in (queries or HOT_QUERIES).items():
+            tables = self.sequential_scans(query, params)
+            if tables:
+                failures[name] = tables
+        return failures
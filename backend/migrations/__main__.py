@@ -0,0 +1,51 @@
+"""
+Database schema migrations.
+
+Run from the backend folder:
+    python -m migrations apply    # Apply every pending migration
+    python -m migrations status   # List applied and pending migrations
+    python -m migrations check    # Fail if a hot query needs a sequential scan
+"""
+
+import argparse
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from migrations import Migrator
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("command", choices=["apply", "status", "check"])
+    args = parser.parse_args()
+
+    migrator = Migrator()
+    try:
+        if args.command == "apply":
+            result = migrator.migrate()
+            if not result["success"]:
+                print(f"Migration {result['failed']} failed: {result['error']}")
+                return 1
+            print(f"Applied {len(result['applied'])} migration(s).")
+
+        elif args.command == "status":
+            applied = migrator.applied()
+            for version, _ in migrator.available():
+                print(f"{'applied' if version in applied else 'pending'}  {version}")
+
+        elif args.command == "check":
+            failures = migrator.check_query_plans()
+            for name, tables in failures.items():
+                print(f"FAIL  {name}: sequential scan on {', '.join(tables)}")
+            if failures:
+                return 1
+            print("All hot queries are served by indexes.")
+    finally:
+        migrator.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import os
+import sys
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# How sync database, crypto and hashing calls made on the event loop are treated: "off"
+# (the default, no overhead), "warn" (log each call site once) or "raise" (fail the call,
+# for development and tests)
+blocking_check = os.getenv("blocking_call_check", "off").lower()
+
+# get_snippets results with at least this many rows are decrypted on the CPU pool
+CPU_MIN_ROWS = int(os.getenv("offload_cpu_min_rows", "2000"))
+
+reported = set()  # Call sites already warned about
+
+
+class BlockingCallError(RuntimeError):
+    """A blocking call was made on the event loop while blocking_call_check is "raise"."""
+
+
+def on_event_loop():
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+def blocking(kind):
+    """
+    Mark a sync function as blocking (kind is "db", "crypto" or "hash"), so calls made from
+    the event loop thread are reported. Returns the function unchanged when the check is off.
+
+    Usage:
+        @blocking("db")
+        def execute(self, query, params=None):
+            ...
+    """
+
+    def decorate(function):
+        if blocking_check not in ("warn", "raise"):
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if on_event_loop():
+                report(kind, function)
+            return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def report(kind, function):
+    stack = traceback.extract_stack()[:-2]  # Drop report() and the wrapper
+    message = (
+        f"Blocking {kind} call {function.__qualname__} on the event loop; "
+        "run it with offload.run_io instead"
+    )
+    if blocking_check == "raise":
+        raise BlockingCallError(message)
+
+    site = (function.__qualname__, stack[-1].filename, stack[-1].lineno)
+    if site not in reported:
+        reported.add(site)
+        print(f"{message}:\n{''.join(traceback.format_list(stack))}", file=sys.stderr)
+
+
+class OffloadPool:
+    """
+    An executor created on first use, with the number of calls waiting for and holding a
+    worker, so queue depth can be monitored.
+    """
+
+    def __init__(self, name, workers, create):
+        self.name = name
+        self.workers = workers
+        self.create = create
+        self.executor = None
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.completed = 0
+        self.lock = threading.Lock()
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = self.create(self.workers)
+            return self.executor
+
+    def started(self, calls=1):
+        with self.lock:
+            self.in_flight += calls
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def finished(self, calls=1):
+        with self.lock:
+            self.in_flight -= calls
+            self.completed += calls
+
+    async def run(self, function, *args, **kwargs):
+        """Await a call on the pool. Context variables (the request trace) follow it."""
+        call = functools.partial(
+            contextvars.copy_context().run, function, *args, **kwargs
+        )
+        loop = asyncio.get_running_loop()
+        self.started()
+        try:
+            return await loop.run_in_executor(self.get_executor(), call)
+        finally:
+            self.finished()
+
+    def map(self, function, items, *args):
+        """
+        Blocking: call function(item, *args) for every item on the pool and return the
+        results in order. For callers already off the event loop.
+        """
+        items = list(items)
+        executor = self.get_executor()
+        self.started(len(items))
+        try:
+            futures = [executor.submit(function, item, *args) for item in items]
+            return [future.result() for future in futures]
+        finally:
+            self.finished(len(items))
+
+    def stats(self):
+        """
+        Returns:
+            dict: Worker count, calls in flight, how many of them are queued behind busy
+            workers, the most ever in flight and the calls completed.
+        """
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "in_flight": self.in_flight,
+                "queued": max(0, self.in_flight - self.workers),
+                "max_in_flight": self.max_in_flight,
+                "completed": self.completed,
+            }
+
+    def shutdown(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Database round trips, sized by offload_io_workers (default db_pool_max, one thread per
+# pooled connection). Bounded, so a burst of slow queries queues here instead of opening
+# dedicated connections beyond the pool.
+io_pool = OffloadPool(
+    "io",
+    int(os.getenv("offload_io_workers", os.getenv("db_pool_max", "10"))),
+    lambda workers: ThreadPoolExecutor(workers, thread_name_prefix="offload-io"),
+)
+
+# CPU-bound work that holds the GIL, in separate processes sized by offload_cpu_workers
+# (0 disables it, the default on a single core). Spawned rather than forked, as the server
+# process runs threads.
+cpu_pool = OffloadPool(
+    "cpu",
+    int(os.getenv("offload_cpu_workers", str(min(4, (os.cpu_count() or 1) - 1)))),
+    lambda workers: ProcessPoolExecutor(
+        workers, mp_context=multiprocessing.get_context("spawn")
+    ),
+)
+
+
+async def run_io(function, *args, **kwargs):
+    """
+    Run blocking database work on the I/O pool.
+
+    Usage:
+        result = await run_io(snippets.get_snippets, include_content)
+    """
+    return await io_pool.run(function, *args, **kwargs)
+
+
+def pool_stats():
+    """
+    Returns:
+        dict: OffloadPool.stats() of each pool.
+    """
+    return {pool.name: pool.stats() for pool in (io_pool, cpu_pool)}
@@ -0,0 +1,275 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import Counter, OrderedDict, deque
+
+# Off unless profiling_enabled is "true"; the /debug endpoints then also need profiling_token
+enabled = os.getenv("profiling_enabled", "false").lower() == "true"
+
+# Leaf frames of threads that are waiting rather than working, left out of CPU profiles
+IDLE_FRAMES = {
+    ("wait", "threading.py"),
+    ("select", "selectors.py"),
+    ("_worker", "thread.py"),
+}
+MAX_SNAPSHOTS = 5
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+def collapse(frame):
+    """
+    Returns:
+        list: Labels from the outermost frame to the innermost one.
+    """
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler for every thread in the process. Samples are stack traces
+    read with sys._current_frames(), so nothing is instrumented and the overhead is one
+    walk of each thread's stack per interval, paid only while a profile is running.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()  # One profile at a time
+
+    def profile(self, seconds, interval=0.005, include_idle=False):
+        """
+        Sample all threads for a while. Blocks, so call it from a worker thread.
+
+        Requires:
+            seconds (float): How long to sample for.
+            interval (float): Seconds between samples.
+            include_idle (bool): Keep samples of threads blocked waiting for work.
+
+        Returns:
+            str: Collapsed stacks ("thread;outer;...;inner count" per line), the input format
+            of flamegraph.pl, inferno and speedscope. None if a profile is already running.
+        """
+        if not self.lock.acquire(blocking=False):
+            return None
+        try:
+            me = threading.get_ident()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = Counter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    code = frame.f_code
+                    leaf = (code.co_name, os.path.basename(code.co_filename))
+                    if not include_idle and leaf in IDLE_FRAMES:
+                        continue
+                    if ident not in names:
+                        names.update((t.ident, t.name) for t in threading.enumerate())
+                    thread = names.get(ident, str(ident)).replace(" ", "_")
+                    stacks[";".join([thread] + collapse(frame))] += 1
+                time.sleep(interval)
+        finally:
+            self.lock.release()
+
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class MemoryTracker:
+    """
+    tracemalloc snapshots kept by id, so allocations can be compared over time. Tracing
+    starts with the first snapshot and slows allocation down until stop() is called.
+    """
+
+    def __init__(self):
+        self.snapshots = OrderedDict()
+        self.next_id = 1
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def describe(statistic):
+        frame = statistic.traceback[0]
+        return {
+            "location": f"{frame.filename}:{frame.lineno}",
+            "size_kb": round(statistic.size / 1024, 1),
+            "count": statistic.count,
+        }
+
+    def take(self, frames=25, limit=20):
+        """
+        Take a snapshot, starting tracemalloc first if needed. Only allocations made after
+        tracing started are seen, so the first snapshot is a baseline for later diffs.
+
+        Returns:
+            dict: The snapshot's id, traced and peak memory, and its largest allocation sites.
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            )
+        )
+        traced, peak = tracemalloc.get_traced_memory()
+
+        with self.lock:
+            snapshot_id = self.next_id
+            self.next_id += 1
+            self.snapshots[snapshot_id] = snapshot
+            while len(self.snapshots) > MAX_SNAPSHOTS:
+                self.snapshots.popitem(last=False)
+
+        return {
+            "id": snapshot_id,
+            "traced_mb": round(traced / 1024**2, 2),
+            "peak_mb": round(peak / 1024**2, 2),
+            "top": [
+                self.describe(statistic)
+                for statistic in snapshot.statistics("lineno")[:limit]
+            ],
+        }
+
+    def diff(self, first, second, limit=20):
+        """
+        Compare two snapshots by allocation site.
+
+        Returns:
+            dict: Success status and the sites whose memory grew or shrank the most, or an
+            error message if either snapshot is unknown.
+        """
+        with self.lock:
+            old = self.snapshots.get(first)
+            new = self.snapshots.get(second)
+        if old is None or new is None:
+            return {
+                "success": False,
+                "error": f"Unknown snapshot; kept: {list(self.snapshots)}",
+            }
+
+        changes = new.compare_to(old, "lineno")[:limit]
+        return {
+            "success": True,
+            "changes": [
+                dict(
+                    self.describe(change),
+                    size_diff_kb=round(change.size_diff / 1024, 1),
+                    count_diff=change.count_diff,
+                )
+                for change in changes
+            ],
+        }
+
+    def stop(self):
+        with self.lock:
+            self.snapshots.clear()
+        tracemalloc.stop()
+
+
+class LoopLagMonitor:
+    """
+    Measures event loop lag with a heartbeat task, and logs the event loop thread's stack
+    whenever the loop goes without a heartbeat for more than threshold_ms, naming the
+    handler that blocked it (typically sync database, crypto or hashing work).
+
+    The heartbeat runs on the loop; a watchdog thread notices missed heartbeats, since
+    nothing on a blocked loop can.
+    """
+
+    def __init__(self, threshold_ms=100, interval=0.02):
+        self.threshold = threshold_ms / 1000
+        self.interval = min(interval, self.threshold / 4)
+        self.loop_thread = None
+        self.last_tick = time.monotonic()
+        self.stall = None  # The stall being reported, until the loop ticks again
+        self.stalls = deque(maxlen=20)
+        self.samples = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.task = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        """Start monitoring the running event loop. Call from the loop."""
+        self.loop_thread = threading.get_ident()
+        self.last_tick = time.monotonic()
+        self.stopped.clear()
+        self.task = asyncio.create_task(self.heartbeat())
+        threading.Thread(
+            target=self.watch, name="loop-lag-watchdog", daemon=True
+        ).start()
+
+    async def stop(self):
+        self.stopped.set()
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self.last_tick = now
+            self.samples += 1
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+            if self.stall is not None:
+                self.stall["blocked_ms"] = round(lag * 1000, 1)
+                self.stall = None
+
+    def watch(self):
+        while not self.stopped.wait(self.threshold / 2):
+            blocked = time.monotonic() - self.last_tick - self.interval
+            if blocked <= self.threshold or self.stall is not None:
+                continue
+            frame = sys._current_frames().get(self.loop_thread)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            self.stall = {
+                "at": time.time(),
+                "blocked_ms": round(blocked * 1000, 1),  # Updated once the loop resumes
+                "stack": stack,
+            }
+            self.stalls.append(self.stall)
+            print(
+                f"Event loop blocked for over {self.threshold * 1000:.0f} ms in:\n{stack}",
+                file=sys.stderr,
+            )
+
+    def stats(self):
+        """
+        Returns:
+            dict: Average and maximum loop lag, and the most recent stalls with the stack
+            the loop was blocked in.
+        """
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "samples": self.samples,
+            "avg_lag_ms": self.total_lag / self.samples * 1000 if self.samples else 0.0,
+            "max_lag_ms": self.max_lag * 1000,
+            "stalls": list(self.stalls),
+        }
+
+
+profiler = SamplingProfiler()
+memory = MemoryTracker()
+loop_monitor = LoopLagMonitor(float(os.getenv("loop_lag_threshold_ms", "100")))
@@ -0,0 +1,222 @@
+import os
+import re
+import threading
+import time
+from psycopg2 import errors, extensions
+
+from offload import blocking
+from tracing import span
+
+# Deduplicated bodies are read from snippet_contents, inline ones from the row itself
+SNIPPET_COLUMNS = (
+    "id, title, COALESCE(content, (SELECT c.content FROM snippet_contents c "
+    "WHERE c.user_id = code_snippets.user_id "
+    "AND c.digest = code_snippets.content_digest)), "
+    "language, favourite, created_at, tags, is_public, meta, revision"
+)
+
+# The fixed SQL the API runs on every request. Each statement is prepared once per pooled
+# connection and then only executed, so Postgres parses and plans it a single time.
+QUERIES = {
+    "get_snippets": (
+        f"SELECT {SNIPPET_COLUMNS} FROM code_snippets WHERE user_id = %s "
+        "ORDER BY created_at, id"
+    ),
+    "get_changed_snippets": (
+        f"SELECT {SNIPPET_COLUMNS} FROM code_snippets "
+        "WHERE user_id = %s AND revision > %s ORDER BY revision"
+    ),
+    "get_sync_horizon": "SELECT revision FROM snippet_sync_horizon",
+    # Lock class 1: a user's revision lock, see Snippets.lock_revisions
+    "lock_revisions": "SELECT pg_advisory_xact_lock(1, %s)",
+    "get_deleted_snippets": (
+        "SELECT snippet_id, revision FROM snippet_tombstones "
+        "WHERE user_id = %s AND revision > %s ORDER BY revision"
+    ),
+    "get_public_snippet_by_id": (
+        f"SELECT {SNIPPET_COLUMNS} FROM code_snippets WHERE id = %s AND is_public = TRUE"
+    ),
+    "get_user_snippet_by_id": (
+        f"SELECT {SNIPPET_COLUMNS} FROM code_snippets WHERE id = %s AND user_id = %s"
+    ),
+    "get_snippet_by_id": (
+        f"SELECT {SNIPPET_COLUMNS}, user_id = %s FROM code_snippets "
+        "WHERE id = %s AND (is_public = TRUE OR user_id = %s)"
+    ),
+    "get_snippet_meta": (
+        "SELECT title, language, favourite, tags, meta FROM code_snippets "
+        "WHERE id = %s AND user_id = %s"
+    ),
+    # Locks the body until the snippet pointing at it commits, so a concurrent prune of
+    # unreferenced bodies cannot delete it in between
+    "find_content": (
+        "SELECT 1 FROM snippet_contents WHERE user_id = %s AND digest = %s "
+        "FOR KEY SHARE"
+    ),
+    "store_content": (
+        "INSERT INTO snippet_contents (user_id, digest, content) VALUES (%s, %s, %s) "
+        "ON CONFLICT DO NOTHING"
+    ),
+    "delete_snippet": (
+        "WITH deleted AS ("
+        "DELETE FROM code_snippets WHERE id = %s AND user_id = %s "
+        "RETURNING id, user_id) "
+        "INSERT INTO snippet_tombstones (snippet_id, user_id) "
+        "SELECT id, user_id FROM deleted"
+    ),
+    "authenticate": (
+        "SELECT id, password FROM users WHERE username = %s AND disabled_at IS NULL"
+    ),
+    "create_user": "INSERT INTO users (username, password) VALUES (%s, %s)",
+    "get_dark_mode": "SELECT dark_mode FROM users WHERE id = %s",
+    "get_ai_use": "SELECT use_ai FROM users WHERE id = %s",
+    "get_user": "SELECT id, username FROM users WHERE id = %s",
+    "get_user_active": "SELECT disabled_at IS NULL FROM users WHERE id = %s",
+    "get_credentials": "SELECT username, password FROM users WHERE id = %s",
+}
+
+
+class TracingCursor(extensions.cursor):
+    """A cursor that times every statement as a "db" span."""
+
+    @blocking("db")
+    def execute(self, query, params=None):
+        with span("db"):
+            return super().execute(query, params)
+
+    @blocking("db")
+    def executemany(self, query, params_list):
+        with span("db"):
+            return super().executemany(query, params_list)
+
+
+class PreparingConnection(extensions.connection):
+    """
+    A psycopg2 connection that remembers which statements it has prepared and hands out
+    tracing cursors. Commits and rollbacks count as blocking calls for offload.blocking.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.cursor_factory = TracingCursor
+
+    @blocking("db")
+    def commit(self):
+        return super().commit()
+
+    @blocking("db")
+    def rollback(self):
+        return super().rollback()
+
+
+class QueryRegistry:
+    """
+    Runs registered queries by name, as prepared statements where the server allows it,
+    and keeps per-query timings.
+
+    Supabase's transaction pooler (port 6543) hands each transaction to whichever server
+    connection is free, so session-level prepared statements are unusable there. Prepares
+    are skipped when db_prepared_statements is "off", or "auto" (the default) on port 6543,
+    and switched off for the whole process the first time the server rejects one.
+    """
+
+    def __init__(self, queries):
+        self.queries = queries
+        # EXECUTE takes positional $n parameters rather than psycopg2's %s placeholders
+        self.statements = {
+            name: self.to_positional(query) for name, query in queries.items()
+        }
+        self.enabled = None  # Decided on first use, once the environment is loaded
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def to_positional(query):
+        counter = iter(range(1, query.count("%s") + 1))
+        return re.sub(r"%s", lambda _: f"${next(counter)}", query)
+
+    def prepares_enabled(self, connection):
+        if self.enabled is None:
+            setting = os.getenv("db_prepared_statements", "auto").lower()
+            port = connection.info.port
+            self.enabled = setting == "on" or (setting == "auto" and port != 6543)
+        return self.enabled and isinstance(connection, PreparingConnection)
+
+    def record(self, name, mode, seconds, prepare_seconds=0.0):
+        with self.lock:
+            entry = self.stats.setdefault(
+                name,
+                {
+                    "calls": 0,
+                    "prepared_calls": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "prepare_ms": 0.0,
+                },
+            )
+            entry["calls"] += 1
+            entry["prepared_calls"] += mode == "prepared"
+            entry["total_ms"] += seconds * 1000
+            entry["max_ms"] = max(entry["max_ms"], seconds * 1000)
+            entry["prepare_ms"] += prepare_seconds * 1000
+
+    def execute(self, cursor, name, params=()):
+        """
+        Execute a registered query on a cursor.
+
+        Requires:
+            cursor: A psycopg2 cursor; results are fetched from it as usual.
+            name (str): A key of QUERIES.
+            params (tuple): Parameters, in the order of the query's %s placeholders.
+        """
+        connection = cursor.connection
+        start = time.perf_counter()
+
+        if not self.prepares_enabled(connection):
+            cursor.execute(self.queries[name], params)
+            self.record(name, "plain", time.perf_counter() - start)
+            return
+
+        starting_transaction = (
+            connection.info.transaction_status == extensions.TRANSACTION_STATUS_IDLE
+        )
+        prepare_seconds = 0.0
+        try:
+            if name not in connection.prepared:
+                cursor.execute(f"PREPARE {name} AS {self.statements[name]}")
+                connection.prepared.add(name)
+                prepare_seconds = time.perf_counter() - start
+            placeholders = f" ({', '.join(['%s'] * len(params))})" if params else ""
+            cursor.execute(f"EXECUTE {name}{placeholders}", params)
+        except (
+            errors.InvalidSqlStatementName,
+            errors.DuplicatePreparedStatement,
+            errors.FeatureNotSupported,
+        ) as error:
+            # The server (or a pooler in front of it) does not keep prepared statements
+            self.enabled = False
+            print(f"Prepared statements disabled: {error}".strip())
+            if not starting_transaction:
+                raise
+            connection.rollback()  # Nothing else ran in this transaction yet
+            cursor.execute(self.queries[name], params)
+            self.record(name, "plain", time.perf_counter() - start)
+            return
+
+        self.record(name, "prepared", time.perf_counter() - start, prepare_seconds)
+
+    def query_stats(self):
+        """
+        Returns:
+            dict: Per-query call counts and timings in milliseconds, including the one-off
+            time spent preparing each statement.
+        """
+        with self.lock:
+            return {
+                name: dict(entry, avg_ms=entry["total_ms"] / entry["calls"])
+                for name, entry in self.stats.items()
+            }
+
+
+registry = QueryRegistry(QUERIES)
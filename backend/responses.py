@@ -0,0 +1,75 @@
+from datetime import datetime
+from typing_extensions import TypedDict  # Pydantic needs this one before Python 3.12
+import orjson
+from fastapi.responses import JSONResponse
+
+from tracing import span
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    Renders with orjson, which serializes dicts, lists and datetimes in compiled code.
+
+    Used as the app's default response class. Routes that return one directly also skip
+    FastAPI's jsonable_encoder pass, which otherwise walks every value in Python first.
+    """
+
+    def render(self, content) -> bytes:
+        with span("json"):
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+# Response shapes. These are plain TypedDicts: they document the schema in /docs, but the
+# routes return ORJSONResponse directly, so nothing is validated or copied field by field.
+class Snippet(TypedDict, total=False):
+    id: int
+    title: str
+    content: str  # Left out when the request sets include_content=false
+    language: str
+    favourite: bool
+    created_at: datetime
+    tags: list[str]
+    is_public: bool
+    revision: int
+
+
+class SnippetListResponse(TypedDict):
+    success: bool
+    snippets: list[Snippet]
+    cursor: int
+
+
+class SnippetChangesResponse(TypedDict):
+    success: bool
+    snippets: list[Snippet]
+    deleted: list[int]
+    reset: bool
+    cursor: int
+
+
+class SnippetResponse(TypedDict):
+    snippet: Snippet
+
+
+class SnippetViewResponse(TypedDict):
+    snippet: Snippet
+    owned: bool
+
+
+class SnippetWriteResponse(TypedDict):
+    success: bool
+    message: str
+    snippet: Snippet
+
+
+class BatchResult(TypedDict, total=False):
+    id: int
+    op: str
+    success: bool
+    revision: int
+    error: str
+
+
+class BatchResponse(TypedDict):
+    success: bool
+    results: list[BatchResult]
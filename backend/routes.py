@@ -1,14 +1,49 @@
+from dotenv import load_dotenv
+
+load_dotenv()  # The only call: everything imported below reads the environment lazily
+
 from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from middleware.admission import AdmissionMiddleware, admission_stats
+from middleware.compression import CompressionMiddleware
+from middleware.metrics import MetricsMiddleware
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 from snippets import Snippets
 from auth.login import LoginSystem
+from auth.database import Database
+from queries import registry
+import tracing
+import profiling
+import offload
+from offload import run_io
+from singleflight import SingleFlight
 from auth.jwtAuth import jwtAuth
-from auth.ratelimit import rate_limit, cleanup_rate_limiter, rate_limiter, ip_rate_limit
+from auth.account_deletion import active_users, get_deletion_progress
+from responses import (
+    ORJSONResponse,
+    SnippetResponse,
+    SnippetListResponse,
+    SnippetChangesResponse,
+    SnippetViewResponse,
+    SnippetWriteResponse,
+    BatchResponse,
+)
+from auth.ratelimit import (
+    rate_limit,
+    cleanup_rate_limiter,
+    rate_limiter,
+    ip_rate_limit,
+    user_or_ip_rate_limit,
+    rate_limit_exceeded,
+)
+from typing import Literal, Optional
 import asyncio
+import hmac
+import os
+import signal
 from contextlib import asynccontextmanager
-from dotenv import load_dotenv
 
 
 # Models for request bodies
@@ -35,6 +70,16 @@ class EditSnippetData(BaseModel):
     favourite: bool
 
 
+class BatchOperation(BaseModel):
+    op: Literal["delete", "favourite", "visibility"]
+    id: int
+    value: bool = None  # New favourite / is_public value, unused for deletes
+
+
+class BatchData(BaseModel):
+    operations: list[BatchOperation]
+
+
 class ChangePasswordData(BaseModel):
     current_password: str
     new_password: str
@@ -52,21 +97,129 @@ class ChangeAIUseData(BaseModel):
     ai_use: bool
 
 
+ENRICHMENT_DRAIN_TIMEOUT = 30  # Seconds shutdown waits for queued AI enrichment
+
+
+def drain_on_sigterm(loop):
+    """
+    Wrap the server's SIGTERM handler so the worker first reports not ready on /readyz and
+    keeps serving for shutdown_grace_seconds (default 5), giving load balancers time to
+    stop routing to it before uvicorn stops accepting connections. A second SIGTERM shuts
+    down at once.
+
+    Returns:
+        The handler that was replaced, or None when signals cannot be handled here (not
+        the main thread, as under the test client).
+    """
+    grace = float(os.getenv("shutdown_grace_seconds", "5"))
+    try:
+        previous = signal.getsignal(signal.SIGTERM)
+    except ValueError:
+        return None
+    if not callable(previous):
+        return None
+
+    def handle_sigterm(signum, frame):
+        if not app.state.ready:
+            previous(signum, frame)
+            return
+        app.state.ready = False
+        print(f"SIGTERM received, draining for {grace:g}s before shutting down")
+        loop.call_soon_threadsafe(loop.call_later, grace, previous, signum, frame)
+
+    try:
+        signal.signal(signal.SIGTERM, handle_sigterm)
+    except ValueError:
+        return None
+    return previous
+
+
+def call_snippets(user_id, method, *args):
+    """
+    Open a Snippets connection, call one of its methods and close the connection again.
+    Blocking, so routes run it on the I/O pool with run_io.
+    """
+    snippets = Snippets(user_id)
+    try:
+        return getattr(snippets, method)(*args)
+    finally:
+        snippets.close()  # Ensure connection is closed
+
+
+# Identical concurrent reads share one Snippets call, see read_snippets
+reads = SingleFlight()
+
+
+async def read_snippets(user_id, method, *args):
+    """
+    Same as run_io(call_snippets, ...) for read-only Snippets methods, except that identical
+    concurrent reads (same user, method and arguments) share one query and its decrypted
+    result. Writes call reads.forget(user_id) so later reads do not join an older one.
+    """
+    return await reads.run(
+        (user_id, method, *args), run_io, call_snippets, user_id, method, *args
+    )
+
+
+def call_login_system(method, *args, **kwargs):
+    """
+    Same as call_snippets, for the sync LoginSystem methods.
+    """
+    login_system = LoginSystem()
+    try:
+        return getattr(login_system, method)(*args, **kwargs)
+    finally:
+        login_system.close()
+
+
+async def resume_account_deletions():
+    """
+    Restart unfinished account deletions in the background. Startup does not wait for it,
+    so a worker whose database is down still comes up and reports that on /readyz.
+    """
+    try:
+        await asyncio.to_thread(call_login_system, "resume_account_deletions")
+    except Exception as error:
+        print(f"Could not resume account deletions: {error}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     Snippets.event_loop = asyncio.get_running_loop()
+    resume_task = asyncio.create_task(resume_account_deletions())
+    # Warm the pool off the event loop
+    await asyncio.to_thread(Database(connect=False).warm_pool)
     cleanup_task = asyncio.create_task(cleanup_rate_limiter())
+    if profiling.enabled:
+        profiling.loop_monitor.start()
+    app.state.ready = True
+    server_sigterm = drain_on_sigterm(asyncio.get_running_loop())
     yield
-    Snippets.executor.shutdown(wait=False)
+    # Uvicorn has stopped accepting requests and drained in-flight ones by now
+    app.state.ready = False
+    if server_sigterm is not None:
+        signal.signal(signal.SIGTERM, server_sigterm)
+    unfinished = await Snippets.drain_enrichments(timeout=ENRICHMENT_DRAIN_TIMEOUT)
+    if unfinished:
+        print(f"Shutting down with {unfinished} AI enrichment job(s) unfinished")
+    if profiling.enabled:
+        await profiling.loop_monitor.stop()
+    offload.io_pool.shutdown()
+    offload.cpu_pool.shutdown()
     cleanup_task.cancel()
     try:
         await cleanup_task
     except asyncio.CancelledError:
         pass
+    await resume_task
 
 
-load_dotenv()
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+admission_control = os.getenv("admission_control", "true").lower() == "true"
+if admission_control:
+    app.add_middleware(
+        AdmissionMiddleware
+    )  # Inside CORS, so browsers can read its 503s
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "https://codenest-rho.vercel.app"],
@@ -74,17 +227,33 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("response_compression_min_size", "1024")),
+)
+if tracing.enabled:
+    app.add_middleware(MetricsMiddleware)  # Outermost, so it times compression too
 
-# Initialize FastAPI app and login system
-login_system = LoginSystem()
 jwt_auth = jwtAuth()
 auth_scheme = HTTPBearer()  # For extracting token from Authorization header
+optional_auth_scheme = HTTPBearer(auto_error=False)  # Same, for optional auth
 
 print("Running CodeNest API")
 
 
-# Dependency to get user_id from JWT token
-async def get_current_user_id(
+async def is_active_user(user_id):
+    """Whether the user still exists and is not being deleted, see ActiveUsers."""
+    if active_users.cached(user_id):
+        return True
+    if await run_io(call_login_system, "is_active", user_id):
+        active_users.remember(user_id)
+        return True
+    return False
+
+
+# Dependency to get user_id from a JWT token, whether or not the account is still active.
+# Only for /delete_user/status, which a user being deleted must still be able to poll.
+async def get_token_user_id(
     credentials: HTTPAuthorizationCredentials = Depends(auth_scheme),
 ):
     token = credentials.credentials
@@ -94,6 +263,38 @@ async def get_current_user_id(
     return result["user_id"]
 
 
+# Dependency to get user_id from JWT token. Tokens of disabled accounts are refused, so
+# nothing can be written while the account is purged.
+async def get_current_user_id(user_id: int = Depends(get_token_user_id)):
+    if not await is_active_user(user_id):
+        raise HTTPException(status_code=401, detail="Account disabled")
+    return user_id
+
+
+# Dependency for endpoints that also serve anonymous callers. A missing, invalid or
+# expired token is treated as anonymous rather than rejected.
+async def get_optional_user_id(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_auth_scheme),
+):
+    if credentials is None:
+        return None
+    result = jwt_auth.verify_token(credentials.credentials)
+    if not result["success"] or not await is_active_user(result["user_id"]):
+        return None
+    return result["user_id"]
+
+
+# Dependency for the /debug profiling endpoints: hidden unless profiling_enabled is true,
+# and only for callers presenting profiling_token, which must be set.
+async def require_profiling_access(request: Request):
+    if not profiling.enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = os.getenv("profiling_token")
+    sent = request.headers.get("authorization", "")
+    if not token or not hmac.compare_digest(sent, f"Bearer {token}"):
+        raise HTTPException(status_code=401, detail="Invalid profiling token")
+
+
 # Public endpoints
 @app.get("/")
 async def root():
@@ -103,6 +304,142 @@ async def root():
     return {"message": "Welcome to the CodeNest API"}
 
 
+@app.get("/healthz")
+async def liveness():
+    """
+    Liveness probe: the process is up and its event loop is responding.
+    """
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readiness():
+    """
+    Readiness probe: startup has finished, shutdown has not begun and the database
+    answers. Responds 503 otherwise so load balancers stop routing to this worker.
+    """
+    if not getattr(app.state, "ready", False):
+        raise HTTPException(status_code=503, detail="Not ready")
+
+    def database_ready():
+        database = Database()
+        try:
+            return database.ping()
+        finally:
+            database.close()
+
+    if not await asyncio.to_thread(database_ready):
+        raise HTTPException(status_code=503, detail="Database unavailable")
+    return {"status": "ready"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """
+    Prometheus metrics: per-route latency histograms, per-stage timings and query stats.
+    Only served when metrics_enabled is true; if metrics_token is set, scrapers must
+    send it as a bearer token.
+    """
+    if not tracing.enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = os.getenv("metrics_token")
+    sent = request.headers.get("authorization", "")
+    if token and not hmac.compare_digest(sent, f"Bearer {token}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(
+        tracing.render_prometheus(
+            registry.query_stats(),
+            offload.pool_stats(),
+            admission_stats() if admission_control else None,
+            reads.stats(),
+        ),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
+# Admin-only profiling endpoints, see require_profiling_access
+@app.get(
+    "/debug/profile",
+    include_in_schema=False,
+    dependencies=[Depends(require_profiling_access)],
+)
+async def cpu_profile(
+    seconds: float = 10, interval_ms: float = 5, include_idle: bool = False
+):
+    """
+    Sample every thread's stack for a while and return collapsed stacks, ready for
+    flamegraph.pl, inferno or speedscope.
+
+    Requires:
+        seconds (float): Sampling duration, at most 60.
+        interval_ms (float): Time between samples, at least 1.
+        include_idle (bool): Keep samples of threads waiting for work.
+    """
+    stacks = await asyncio.to_thread(
+        profiling.profiler.profile,
+        min(seconds, 60),
+        max(interval_ms, 1) / 1000,
+        include_idle,
+    )
+    if stacks is None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    return PlainTextResponse(stacks)
+
+
+@app.post(
+    "/debug/memory/snapshot",
+    include_in_schema=False,
+    dependencies=[Depends(require_profiling_access)],
+)
+async def memory_snapshot(limit: int = 20):
+    """
+    Take a tracemalloc snapshot (starting tracing on first use) and return its largest
+    allocation sites. The id can be passed to /debug/memory/diff.
+    """
+    return await asyncio.to_thread(profiling.memory.take, limit=limit)
+
+
+@app.get(
+    "/debug/memory/diff",
+    include_in_schema=False,
+    dependencies=[Depends(require_profiling_access)],
+)
+async def memory_diff(first: int, second: int, limit: int = 20):
+    """
+    Compare two tracemalloc snapshots and return the allocation sites that changed most.
+    """
+    result = await asyncio.to_thread(profiling.memory.diff, first, second, limit)
+    if not result["success"]:
+        raise HTTPException(status_code=404, detail=result["error"])
+    return result
+
+
+@app.delete(
+    "/debug/memory",
+    include_in_schema=False,
+    dependencies=[Depends(require_profiling_access)],
+)
+async def memory_stop():
+    """
+    Stop tracemalloc and drop its snapshots, removing its allocation overhead.
+    """
+    profiling.memory.stop()
+    return {"success": True}
+
+
+@app.get(
+    "/debug/loop",
+    include_in_schema=False,
+    dependencies=[Depends(require_profiling_access)],
+)
+async def loop_lag():
+    """
+    Event loop lag statistics and the stacks of recent handlers that blocked the loop
+    for longer than loop_lag_threshold_ms.
+    """
+    return profiling.loop_monitor.stats()
+
+
 @app.post("/login")
 @ip_rate_limit(requests_per_minute=10)  # Strict limit to prevent brute force attacks
 async def login(request: Request, credentials: LoginData):
@@ -115,7 +452,9 @@ async def login(request: Request, credentials: LoginData):
     Returns:
         dict: Authentication result, JWT token, and user ID if successful.
     """
-    result = login_system.authenticate(credentials.username, credentials.password)
+    # Each database step checks out its own connection, none is held while hashing
+    login_system = LoginSystem(connect=False)
+    result = await login_system.authenticate(credentials.username, credentials.password)
     if result.get("success"):
         return result
     else:
@@ -136,7 +475,8 @@ async def create_user(request: Request, credentials: LoginData):
     Returns:
         dict: Success message if user is created, otherwise raises HTTPException.
     """
-    result = login_system.create_user(credentials.username, credentials.password)
+    login_system = LoginSystem(connect=False)
+    result = await login_system.create_user(credentials.username, credentials.password)
     if result.get("success"):
         return {"message": "User created successfully"}
     else:
@@ -147,34 +487,26 @@ async def create_user(request: Request, credentials: LoginData):
 
 @app.get("/get_public_snippet/{snippet_id}")
 @ip_rate_limit(requests_per_minute=30)  # Moderate limit for public snippet access
-async def read_public_snippet(request: Request, snippet_id: int):
-    snippets = Snippets(user_id=0)
-    try:
-        result = snippets.get_public_snippet_by_id(snippet_id)
-        if not result["success"]:
-            raise HTTPException(
-                status_code=404, detail=result.get("error", "Snippet not found")
-            )
-        return {"snippet": result["snippet"]}
-    finally:
-        snippets.close()  # Ensure connection is closed
+async def read_public_snippet(request: Request, snippet_id: int) -> SnippetResponse:
+    result = await read_snippets(0, "get_public_snippet_by_id", snippet_id)
+    if not result["success"]:
+        raise HTTPException(
+            status_code=404, detail=result.get("error", "Snippet not found")
+        )
+    return ORJSONResponse({"snippet": result["snippet"]})
 
 
 @app.get("/get_user_snippet/{snippet_id}")
 @rate_limit(requests_per_minute=50)  # Higher limit for user-specific snippet access
 async def read_user_snippet(
     snippet_id: int, user_id: int = Depends(get_current_user_id)
-):
-    snippets = Snippets(user_id)
-    try:
-        result = snippets.get_user_snippet_by_id(snippet_id)
-        if not result["success"]:
-            raise HTTPException(
-                status_code=404, detail=result.get("error", "Snippet not found")
-            )
-        return {"snippet": result["snippet"]}
-    finally:
-        snippets.close()  # Ensure connection is closed
+) -> SnippetResponse:
+    result = await read_snippets(user_id, "get_user_snippet_by_id", snippet_id)
+    if not result["success"]:
+        raise HTTPException(
+            status_code=404, detail=result.get("error", "Snippet not found")
+        )
+    return ORJSONResponse({"snippet": result["snippet"]})
 
 
 # Protected endpoints - require token
@@ -190,7 +522,7 @@ async def get_dark_mode(user_id: int = Depends(get_current_user_id)):
     Returns:
         bool: Dark mode preference if found.
     """
-    result = login_system.get_dark_mode(user_id)
+    result = await run_io(call_login_system, "get_dark_mode", user_id)
     if result.get("success"):
         return {"dark_mode": result["dark_mode"]}
     else:
@@ -211,7 +543,7 @@ async def get_ai_use(user_id: int = Depends(get_current_user_id)):
     Returns:
         bool: AI usage status if true or false.
     """
-    result = login_system.get_ai_use(user_id)
+    result = await run_io(call_login_system, "get_ai_use", user_id)
     if result.get("success"):
         return {"ai_use": result["ai_use"]}
     else:
@@ -220,28 +552,46 @@ async def get_ai_use(user_id: int = Depends(get_current_user_id)):
         )
 
 
-@app.delete("/delete_user")
+@app.delete("/delete_user", status_code=202)
 @rate_limit(requests_per_minute=5)  # Strict limit for account deletion
 async def delete_user(user_id: int = Depends(get_current_user_id)):
     """
-    Delete a user account by username.
+    Delete the authenticated user's account. The account is disabled straight away and
+    purged in the background; poll /delete_user/status for progress.
 
     Requires:
-        username (str): The username of the user to delete.
         user_id (int): Authenticated user ID.
 
     Returns:
-        dict: Success message if user is deleted, otherwise raises HTTPException.
+        dict: Message and deletion job progress, otherwise raises HTTPException.
     """
-    result = login_system.delete_user(user_id)
+    result = await run_io(call_login_system, "delete_user", user_id)
     if result.get("success"):
-        return {"message": "User deleted successfully"}
+        return {"message": "User deletion started", "job": result["job"]}
     else:
         raise HTTPException(
             status_code=400, detail=result.get("error", "Failed to delete user")
         )
 
 
+@app.get("/delete_user/status")
+@rate_limit(requests_per_minute=30)
+async def delete_user_status(user_id: int = Depends(get_token_user_id)):
+    """
+    Report the progress of the authenticated user's account deletion.
+
+    Requires:
+        user_id (int): Authenticated user ID.
+
+    Returns:
+        dict: Job status and snippet counts, otherwise raises HTTPException.
+    """
+    progress = await run_io(get_deletion_progress, user_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="No deletion in progress")
+    return {"job": progress}
+
+
 @app.put("/change_password")
 @rate_limit(requests_per_minute=10)  # Moderate limit for password changes
 async def change_password(
@@ -257,7 +607,8 @@ async def change_password(
     Returns:
         dict: Success message if password is changed, otherwise raises HTTPException.
     """
-    result = login_system.change_password(
+    login_system = LoginSystem(connect=False)
+    result = await login_system.change_password(
         user_id, data.current_password, data.new_password
     )
     if result.get("success"):
@@ -283,7 +634,9 @@ async def change_username(
     Returns:
         dict: Success message if username is changed, otherwise raises HTTPException.
     """
-    result = login_system.update_user(user_id, username=data.new_username)
+    result = await run_io(
+        call_login_system, "update_user", user_id, username=data.new_username
+    )
     if result.get("success"):
         return {"message": "Username changed successfully"}
     else:
@@ -307,7 +660,9 @@ async def change_dark_mode(
     Returns:
         dict: Success message if dark mode preference is changed, otherwise raises HTTPException.
     """
-    result = login_system.update_user(user_id, dark_mode=data.dark_mode)
+    result = await run_io(
+        call_login_system, "update_user", user_id, dark_mode=data.dark_mode
+    )
     if result.get("success"):
         return {"message": "Dark mode preference changed successfully"}
     else:
@@ -332,7 +687,7 @@ async def change_ai_use(
     Returns:
         dict: Success message if AI usage preference is changed, otherwise raises HTTPException.
     """
-    result = login_system.update_user(user_id, use_ai=data.ai_use)
+    result = await run_io(call_login_system, "update_user", user_id, use_ai=data.ai_use)
     if result.get("success"):
         return {"message": "AI usage preference changed successfully"}
     else:
@@ -344,31 +699,83 @@ async def change_ai_use(
 
 @app.get("/get_snippets")
 @rate_limit(requests_per_minute=80)  # Higher limit for frequently accessed endpoint
-async def get_snippets(user_id: int = Depends(get_current_user_id)):
+async def get_snippets(
+    include_content: bool = True, user_id: int = Depends(get_current_user_id)
+) -> SnippetListResponse:
     """
     Retrieve all code snippets for the authenticated user.
 
     Requires:
+        include_content (bool, optional): Set to false to skip decrypting snippet bodies.
         user_id (int): Obtained from the JWT token.
 
     Returns:
         dict: List of snippets for the user, or raises HTTPException on error.
     """
-    snippets = Snippets(user_id)
     try:
-        result = snippets.get_snippets()
-        return result
+        result = await read_snippets(user_id, "get_snippets", include_content)
+        return ORJSONResponse(result)
     except Exception as error:
         raise HTTPException(status_code=500, detail=str(error))
-    finally:
-        snippets.close()  # Ensure connection is closed
+
+
+@app.get("/snippets/changes")
+@rate_limit(requests_per_minute=120)  # Cheap incremental sync, polled by the UI on focus
+async def get_snippet_changes(
+    since: int = 0,
+    include_content: bool = True,
+    user_id: int = Depends(get_current_user_id),
+) -> SnippetChangesResponse:
+    """
+    Retrieve only the snippets changed or deleted since the client's last sync.
+
+    Requires:
+        since (int, optional): The cursor returned by the previous sync or /get_snippets.
+        include_content (bool, optional): Set to false to skip decrypting snippet bodies.
+        user_id (int): Obtained from the JWT token.
+
+    Returns:
+        dict: Changed snippets, deleted snippet IDs, whether the client must replace its
+        state (reset) and the next cursor, or raises HTTPException on error.
+    """
+    result = await read_snippets(user_id, "get_changes", since, include_content)
+    if not result["success"]:
+        raise HTTPException(status_code=500, detail=result["error"])
+    return ORJSONResponse(result)
+
+
+@app.get("/snippets/{snippet_id}")
+@user_or_ip_rate_limit(user_requests_per_minute=50, ip_requests_per_minute=30)
+async def read_snippet(
+    request: Request,
+    snippet_id: int,
+    user_id: Optional[int] = Depends(get_optional_user_id),
+) -> SnippetViewResponse:
+    """
+    Retrieve a snippet that is public or owned by the caller, in one request.
+    Authenticated callers are limited per user like /get_user_snippet, anonymous callers
+    per IP like /get_public_snippet.
+
+    Requires:
+        snippet_id (int): The ID of the snippet to fetch.
+        user_id (int, optional): Obtained from the JWT token if one is sent.
+
+    Returns:
+        dict: The snippet and whether the caller owns it, otherwise raises HTTPException.
+    """
+    result = await read_snippets(user_id or 0, "get_snippet_by_id", snippet_id)
+    if not result["success"]:
+        raise HTTPException(
+            status_code=404, detail=result.get("error", "Snippet not found")
+        )
+    return ORJSONResponse({"snippet": result["snippet"], "owned": result["owned"]})
 
 
 @app.post("/create_snippet")
 @rate_limit(requests_per_minute=20)  # Moderate limit for create operations
 async def create_snippet(
     data: SnippetData, user_id: int = Depends(get_current_user_id)
-):
+) -> SnippetWriteResponse:
     """
     Create a new code snippet for the authenticated user.
 
@@ -379,31 +786,31 @@ async def create_snippet(
     Returns:
         dict: Success message if snippet is created, otherwise raises HTTPException.
     """
-    snippets = Snippets(user_id)
-    try:
-        ai_usage = (await get_ai_use(user_id))["ai_use"]
-        result = snippets.create_snippet(
-            data.title,
-            data.content,
-            data.language,
-            data.favourite,
-            data.tags,
-            ai_usage,
-            data.is_public,
-        )
-        if result["success"]:
-            return result
-        else:
-            raise HTTPException(status_code=400, detail=result["error"])
-    finally:
-        snippets.close()  # Ensure connection is closed
+    ai_usage = (await get_ai_use(user_id))["ai_use"]
+    result = await run_io(
+        call_snippets,
+        user_id,
+        "create_snippet",
+        data.title,
+        data.content,
+        data.language,
+        data.favourite,
+        data.tags,
+        ai_usage,
+        data.is_public,
+    )
+    reads.forget(user_id)
+    if result["success"]:
+        return ORJSONResponse(result)
+    else:
+        raise HTTPException(status_code=400, detail=result["error"])
 
 
 @app.put("/edit_snippet/{snippet_id}")
 @rate_limit(requests_per_minute=30)  # Moderate limit for edit operations
 async def edit_snippet(
     snippet_id: int, data: EditSnippetData, user_id: int = Depends(get_current_user_id)
-):
+) -> SnippetWriteResponse:
     """
     Edit an existing code snippet for the authenticated user.
 
@@ -415,23 +822,72 @@ async def edit_snippet(
     Returns:
         dict: Success message if snippet is updated, otherwise raises HTTPException.
     """
-    snippets = Snippets(user_id)
-    try:
-        result = snippets.edit_snippet(
-            snippet_id,
-            data.title,
-            data.content,
-            data.language,
-            data.tags,
-            data.is_public,
-            data.favourite,
+    result = await run_io(
+        call_snippets,
+        user_id,
+        "edit_snippet",
+        snippet_id,
+        data.title,
+        data.content,
+        data.language,
+        data.tags,
+        data.is_public,
+        data.favourite,
+    )
+    reads.forget(user_id)
+    if result["success"]:
+        return ORJSONResponse(result)
+    else:
+        raise HTTPException(status_code=400, detail=result["error"])
+
+
+MAX_BATCH_OPERATIONS = 100
+
+
+@app.post("/snippets/batch")
+async def batch_snippets(
+    data: BatchData, user_id: int = Depends(get_current_user_id)
+) -> BatchResponse:
+    """
+    Apply many delete, favourite and visibility changes in a single transaction.
+    The whole batch is one rate-limit charge, weighted by its size.
+
+    Requires:
+        data (BatchData): Up to 100 operations, each with an op, a snippet id and (except for
+            deletes) a boolean value.
+        user_id (int): Obtained from the JWT token.
+
+    Returns:
+        dict: One result per operation, in request order, otherwise raises HTTPException.
+    """
+    operations = [operation.model_dump() for operation in data.operations]
+    if not operations or len(operations) > MAX_BATCH_OPERATIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch must contain 1 to {MAX_BATCH_OPERATIONS} operations",
         )
-        if result["success"]:
-            return result
-        else:
-            raise HTTPException(status_code=400, detail=result["error"])
-    finally:
-        snippets.close()  # Ensure connection is closed
+    if any(item["op"] != "delete" and item["value"] is None for item in operations):
+        raise HTTPException(
+            status_code=400, detail="Favourite and visibility operations need a value"
+        )
+
+    # Every 10 operations cost one more request out of a 30/min budget
+    allowed, info = rate_limiter.is_allowed(
+        user_id=user_id,
+        endpoint="batch_snippets",
+        limit=30,
+        window=60,
+        cost=1 + len(operations) // 10,
+    )
+    if not allowed:
+        raise rate_limit_exceeded(info)
+
+    result = await run_io(call_snippets, user_id, "run_batch", operations)
+    reads.forget(user_id)
+    if result["success"]:
+        return ORJSONResponse(result)
+    else:
+        raise HTTPException(status_code=400, detail=result["error"])
 
 
 @app.put("/toggle_favorite/{snippet_id}")
@@ -448,15 +904,12 @@ async def toggle_favorite(snippet_id: int, user_id: int = Depends(get_current_us
     Returns:
         dict: Success message and new favorite status, otherwise raises HTTPException.
     """
-    snippets = Snippets(user_id)
-    try:
-        result = snippets.toggle_favorite(snippet_id)
-        if result["success"]:
-            return result
-        else:
-            raise HTTPException(status_code=400, detail=result["error"])
-    finally:
-        snippets.close()  # Ensure connection is closed
+    result = await run_io(call_snippets, user_id, "toggle_favorite", snippet_id)
+    reads.forget(user_id)
+    if result["success"]:
+        return result
+    else:
+        raise HTTPException(status_code=400, detail=result["error"])
 
 
 @app.delete("/delete_snippet/{snippet_id}")
@@ -472,12 +925,9 @@ async def delete_snippet(snippet_id: int, user_id: int = Depends(get_current_use
     Returns:
         dict: Success message if snippet is deleted, otherwise raises HTTPException.
     """
-    snippets = Snippets(user_id)
-    try:
-        result = snippets.delete_snippet(snippet_id)
-        if result["success"]:
-            return result
-        else:
-            raise HTTPException(status_code=400, detail=result["error"])
-    finally:
-        snippets.close()  # Ensure connection is closed
+    result = await run_io(call_snippets, user_id, "delete_snippet", snippet_id)
+    reads.forget(user_id)
+    if result["success"]:
+        return result
+    else:
+        raise HTTPException(status_code=400, detail=result["error"])
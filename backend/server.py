@@ -0,0 +1,59 @@
+"""
+Production entry point for the CodeNest API.
+
+Run from the backend folder:
+    python server.py [--workers 4] [--port 8000]
+
+Starts one worker process per CPU (override with --workers or WEB_CONCURRENCY), using
+uvloop and httptools when they are installed. On SIGTERM each worker first fails /readyz
+and keeps serving for shutdown_grace_seconds, so load balancers stop routing to it; it then
+stops accepting connections, lets in-flight requests finish for up to --graceful-timeout
+seconds, and waits for queued AI enrichment before exiting. Ctrl+C skips the grace period.
+
+Every worker has its own database pool and in-memory rate limiter, so per-process limits
+apply once per worker.
+"""
+
+import argparse
+import os
+import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()  # WEB_CONCURRENCY, PORT and the rest may come from .env like the app settings
+
+
+def default_workers():
+    return int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    # Longer than the idle timeout of common load balancers (60s), so the proxy, not the
+    # server, closes idle connections and never reuses one that was just closed
+    parser.add_argument("--keep-alive", type=int, default=75)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--graceful-timeout", type=int, default=30)
+    args = parser.parse_args()
+
+    print(f"Starting CodeNest API with {args.workers} worker(s) on port {args.port}")
+    uvicorn.run(
+        "routes:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop="auto",  # uvloop if installed, else asyncio
+        http="auto",  # httptools if installed, else h11
+        timeout_keep_alive=args.keep_alive,
+        backlog=args.backlog,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        proxy_headers=True,
+        forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        access_log=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
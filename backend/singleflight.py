@@ -0,0 +1,62 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: while a call for a key is running, callers with
+    the same key wait for its result instead of starting their own. Several tabs or a double
+    render asking for the same snippets then cost one query and one round of decryption.
+
+    Keys start with the user id (0 for anonymous callers). The shared result must be treated
+    as read-only. Only used from the event loop, so it needs no locking.
+    """
+
+    def __init__(self):
+        self.flights = {}
+        self.started = 0
+        self.shared = 0
+
+    async def run(self, key, function, *args):
+        """
+        Await function(*args), or the identical call already in flight under key.
+
+        Requires:
+            key (tuple): (user_id, ...) identifying the call and its parameters.
+            function (coroutine function): The call to make if none is in flight.
+        """
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(function(*args))
+            self.flights[key] = flight
+            flight.add_done_callback(lambda done: self.finished(key, done))
+            self.started += 1
+        else:
+            self.shared += 1
+        # A caller that is cancelled must not cancel the call others are waiting for
+        return await asyncio.shield(flight)
+
+    def finished(self, key, flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+        if not flight.cancelled():
+            flight.exception()  # Retrieved, even if every caller went away
+
+    def forget(self, user_id):
+        """
+        Stop sharing the user's in-flight calls, and anonymous ones (which may read the
+        user's public snippets), so reads that start after one of their writes see it.
+        Callers already waiting still get the older result.
+        """
+        for key in [key for key in self.flights if key[0] in (user_id, 0)]:
+            del self.flights[key]
+
+    def stats(self):
+        """
+        Returns:
+            dict: Calls started, calls that shared one already in flight, and calls in flight.
+        """
+        return {
+            "started": self.started,
+            "shared": self.shared,
+            "in_flight": len(self.flights),
+        }
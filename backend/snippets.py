@@ -1,45 +1,291 @@
 import psycopg2
+import psycopg2.extras
+from psycopg2 import sql
 import asyncio
 import json
-import ast
+import os
+import re
 from concurrent.futures import ThreadPoolExecutor
 
 from auth.database import Database
 from auth.jwtAuth import jwtAuth, require_auth
 from code_data_ai import CodeDataAI
 from auth.encryption import Encryption
+import offload
+from tracing import span
+
+# Fallback splitter for legacy tag text that is not a JSON array
+TAG_SPLIT = re.compile(r"\s*,\s*")
+TAG_STRIP = "\"' "
+
+DECODE_CHUNK_ROWS = 500  # Rows per task when decrypting on the CPU pool
+decoder = None  # A CPU pool worker's connectionless Snippets, see decode_rows()
+
+
+def decode_rows(rows, include_content):
+    """
+    Runs in a CPU pool worker process: decrypts rows selected with queries.SNIPPET_COLUMNS.
+    """
+    global decoder
+    if decoder is None:
+        decoder = Snippets.__new__(Snippets)
+        decoder.connection = None
+        decoder.encryptor = Encryption()
+    return [decoder.row_to_snippet(row, include_content) for row in rows]
 
 
 class Snippets(Database):
     executor = ThreadPoolExecutor()  # Shared across instances
     event_loop = None  # Set from FastAPI at app startup
+    pending_enrichments = set()  # Enrichment coroutines still running on event_loop
 
     def __init__(self, user_id):
         super().__init__()
         self.user_id = user_id
         self.jwt_auth = jwtAuth()
         self.encryptor = Encryption()  # Set up the encryptor
+        # Write title, language, favourite and tags as one encrypted envelope in `meta`
+        self.compact_rows = os.getenv("compact_snippet_rows", "false").lower() == "true"
+        # Store bodies once per user in snippet_contents, see write_content()
+        self.dedup_content = (
+            os.getenv("dedup_snippet_content", "false").lower() == "true"
+        )
 
     def __del__(self):
         """Ensure connection is closed when object is destroyed"""
         if hasattr(self, "connection") and self.connection:
             self.close()
 
-    def convert_tags(self, tags: str):
+    @staticmethod
+    def encode_tags(tags):
+        """
+        Encodes a list of tags into the canonical storage format, a compact JSON array.
+        """
+        return json.dumps([str(tag) for tag in tags or []], separators=(",", ":"))
+
+    @staticmethod
+    def convert_tags(tags):
+        """
+        Converts stored tags to a Python list.
+
+        Canonical rows are a JSON array and take the json.loads fast path. Older rows may be
+        double-encoded (a JSON string holding the AI's raw "[...]" text) or plain comma
+        separated text, both of which are unwrapped without evaluating any Python syntax.
         """
-        Converts a JSON string of tags to a Python list.
-        Handles errors and ensures it returns a list.
+        if isinstance(tags, list):
+            return tags
+        if not isinstance(tags, str):
+            return []
+
+        text = tags.strip()
+        for _ in range(2):  # The stored value, then one level of double encoding
+            if not text or text[0] not in '["':
+                break
+            try:
+                value = json.loads(text)
+            except ValueError:
+                break
+            if isinstance(value, list):
+                return [str(tag).strip() for tag in value if str(tag).strip()]
+            if not isinstance(value, str):
+                return []
+            text = value.strip()
+
+        tags = (tag.strip(TAG_STRIP) for tag in TAG_SPLIT.split(text.strip("[]")))
+        return [tag for tag in tags if tag]
+
+    def read_meta(self, title, language, favourite, tags, meta):
+        """
+        Decrypts a row's metadata from either storage layout.
+
+        Compact rows hold everything in a single `meta` envelope and need one decryption;
+        legacy rows keep one Fernet token per column.
         """
+        if meta is not None:
+            decrypted = self.encryptor.decrypt(meta)
+            with span("tags"):
+                envelope = json.loads(decrypted)
+            return {
+                "title": envelope["t"],
+                "language": envelope["l"],
+                "favourite": envelope["f"],
+                "tags": envelope["g"],
+            }
+
         try:
-            if isinstance(tags, str):
-                return ast.literal_eval(
-                    tags
-                )  # Use ast to safely parse Python-like strings
-            elif isinstance(tags, list):
-                return tags
+            decrypted_tags = self.encryptor.decrypt(tags)
+            with span("tags"):
+                parsed_tags = self.convert_tags(decrypted_tags)
         except Exception as e:
-            print("Tag parsing failed:", e)  # Think it fires if empty
-        return []
+            print("Tag parsing failed:", e)
+            parsed_tags = []
+
+        return {
+            "title": self.encryptor.decrypt(title),
+            "language": self.encryptor.decrypt(language),
+            "favourite": self.encryptor.decrypt(favourite) == "true",
+            "tags": parsed_tags,
+        }
+
+    def write_meta(self, title, language, favourite, tags):
+        """
+        Encrypts metadata into column values for the configured storage layout.
+
+        The compact layout clears the legacy columns, so any row written while it is
+        enabled is migrated as a side effect.
+        """
+        if self.compact_rows:
+            envelope = json.dumps(
+                {
+                    "t": title,
+                    "l": language,
+                    "f": bool(favourite),
+                    "g": [str(tag) for tag in tags or []],
+                },
+                separators=(",", ":"),
+            )
+            return {
+                "title": None,
+                "language": None,
+                "favourite": None,
+                "tags": None,
+                "meta": self.encryptor.encrypt(envelope),
+            }
+
+        return {
+            "title": self.encryptor.encrypt(title),
+            "language": self.encryptor.encrypt(language),
+            "favourite": self.encryptor.encrypt(str(favourite).lower()),
+            "tags": self.encryptor.encrypt(self.encode_tags(tags)),
+            "meta": None,
+        }
+
+    def write_content(self, content):
+        """
+        Stores a snippet body for the configured storage layout.
+
+        With deduplication, the body is encrypted into snippet_contents only if the user
+        has no identical one yet; an unchanged body on edit, or boilerplate the user already
+        saved, costs one indexed lookup and no encryption. Otherwise it stays inline.
+
+        Returns:
+            dict: The content and content_digest column values for the snippet's row.
+        """
+        if not self.dedup_content or content is None:
+            return {"content": self.encryptor.encrypt(content), "content_digest": None}
+
+        digest = self.encryptor.content_digest(self.user_id, content)
+        self.execute("find_content", (self.user_id, digest))
+        if self.cursor.fetchone() is None:
+            self.execute(
+                "store_content",
+                (self.user_id, digest, self.encryptor.encrypt(content)),
+            )
+        return {"content": None, "content_digest": digest}
+
+    def row_to_snippet(self, row, include_content=True):
+        """
+        Builds the API representation of a row selected with queries.SNIPPET_COLUMNS.
+        """
+        (
+            id,
+            title,
+            content,
+            language,
+            favourite,
+            created_at,
+            tags,
+            is_public,
+            meta,
+            revision,
+        ) = row
+        metadata = self.read_meta(title, language, favourite, tags, meta)
+
+        snippet = {"id": id, "title": metadata["title"]}
+        if include_content:
+            snippet["content"] = self.encryptor.decrypt(content)
+        snippet.update(
+            {
+                "language": metadata["language"],
+                "favourite": metadata["favourite"],
+                "created_at": created_at,
+                "tags": metadata["tags"],
+                "is_public": is_public if is_public is not None else False,
+                "revision": revision,
+            }
+        )
+        return snippet
+
+    def rows_to_snippets(self, rows, include_content=True):
+        """
+        Builds the API representation of many rows. Large results are decrypted on the
+        CPU pool, so the work runs in parallel and does not hold this process's GIL.
+        """
+        if len(rows) < offload.CPU_MIN_ROWS or not offload.cpu_pool.workers:
+            return [self.row_to_snippet(row, include_content) for row in rows]
+
+        # bytea columns arrive as memoryviews, which cannot be sent to another process
+        rows = [
+            tuple(
+                bytes(value) if isinstance(value, memoryview) else value
+                for value in row
+            )
+            for row in rows
+        ]
+        chunks = [
+            rows[start : start + DECODE_CHUNK_ROWS]
+            for start in range(0, len(rows), DECODE_CHUNK_ROWS)
+        ]
+        decoded = offload.cpu_pool.map(decode_rows, chunks, include_content)
+        return [snippet for chunk in decoded for snippet in chunk]
+
+    def written_snippet(
+        self, returned, title, content, language, favourite, tags, is_public
+    ):
+        """
+        Builds the API representation of a snippet that was just written, from the
+        plaintext that was encrypted and the (id, created_at, revision) the write returned.
+        """
+        id, created_at, revision = returned
+        return {
+            "id": id,
+            "title": title,
+            "content": content,
+            "language": language,
+            "favourite": bool(favourite),
+            "created_at": created_at,
+            "tags": [str(tag) for tag in tags or []],
+            "is_public": is_public,
+            "revision": revision,
+        }
+
+    def lock_revisions(self):
+        """
+        Take the user's revision lock until the transaction ends. Every write that draws a
+        revision takes it first, so a user's revisions commit in the order they are drawn:
+        a client that synced up to revision N can never later miss a commit below N.
+        """
+        self.execute("lock_revisions", (self.user_id,))
+
+    def update_columns(self, snippet_id, columns, returning=None):
+        """
+        Updates the given columns of one of the current user's snippets and stamps it with
+        a new revision so delta sync picks it up.
+
+        Returns:
+            tuple: The `returning` columns of the updated row, or None if it was not found
+            or nothing was requested.
+        """
+        assignments = ", ".join(f"{column} = %s" for column in columns)
+        assignments += (
+            ", revision = nextval('code_snippets_revision_seq'), updated_at = now()"
+        )
+        query = f"UPDATE code_snippets SET {assignments} WHERE id = %s AND user_id = %s"
+        if returning:
+            query += f" RETURNING {returning}"
+        self.lock_revisions()
+        self.cursor.execute(query, (*columns.values(), snippet_id, self.user_id))
+        return self.cursor.fetchone() if returning else None
 
     def authenticate(self, token):
         token_result = self.jwt_auth.verify_token(token)
@@ -65,39 +311,75 @@ class Snippets(Database):
         if tags == []:
             tags = await ai.get_tags(content)
 
+        # Gemini answers with the list as text, so store it as a real list
+        if isinstance(tags, str):
+            tags = self.convert_tags(tags)
+        elif not isinstance(tags, list):
+            tags = []
+
         return {
             "title": title or "Untitled Snippet",
             "language": language or "",
             "tags": tags or [],
         }
 
+    def store_enrichment(self, snippet_id, enriched):
+        """
+        Writes AI enrichment over a snippet's metadata, keeping its current favourite flag.
+        Uses a new connection, as it runs after the request's one was returned.
+        """
+        snippets_bg = Snippets(self.user_id)
+        try:
+            snippets_bg.execute("get_snippet_meta", (snippet_id, self.user_id))
+            row = snippets_bg.cursor.fetchone()
+            if row is not None:
+                current = snippets_bg.read_meta(*row)
+                snippets_bg.update_columns(
+                    snippet_id,
+                    snippets_bg.write_meta(
+                        enriched["title"],
+                        enriched["language"],
+                        current["favourite"],
+                        enriched["tags"],
+                    ),
+                )
+            snippets_bg.connection.commit()
+        except Exception:
+            snippets_bg.connection.rollback()
+        finally:
+            snippets_bg.close()
+
     def run_ai_enrichment_and_update(self, snippet_id, content, title, language, tags):
         async def inner():
             try:
                 enriched = await self.run_ai_enrichment(content, title, language, tags)
-
-                # Create a new connection for thread safety
-                snippets_bg = Snippets(self.user_id)
-                snippets_bg.cursor.execute(
-                    "UPDATE code_snippets SET title = %s, language = %s, tags = %s WHERE id = %s AND user_id = %s",
-                    (
-                        snippets_bg.encryptor.encrypt(enriched["title"]),
-                        snippets_bg.encryptor.encrypt(enriched["language"]),
-                        snippets_bg.encryptor.encrypt(json.dumps(enriched["tags"])),
-                        snippet_id,
-                        self.user_id,
-                    ),
-                )
-                snippets_bg.connection.commit()
-                snippets_bg.close()
-
+                await offload.run_io(self.store_enrichment, snippet_id, enriched)
             except Exception:
-                if "snippets_bg" in locals():
-                    snippets_bg.connection.rollback()
-                    snippets_bg.close()
+                pass
 
         if Snippets.event_loop:
-            asyncio.run_coroutine_threadsafe(inner(), Snippets.event_loop)
+            future = asyncio.run_coroutine_threadsafe(inner(), Snippets.event_loop)
+            Snippets.pending_enrichments.add(future)
+            future.add_done_callback(Snippets.pending_enrichments.discard)
+
+    @classmethod
+    async def drain_enrichments(cls, timeout=30):
+        """
+        Stop accepting enrichment jobs and wait for queued and running ones to finish.
+
+        Requires:
+            timeout (float): Seconds to wait before abandoning unfinished jobs.
+
+        Returns:
+            int: Number of jobs still unfinished when the timeout expired.
+        """
+        # Jobs waiting in the executor schedule their coroutine when they run
+        await asyncio.to_thread(cls.executor.shutdown, wait=True)
+        pending = [asyncio.wrap_future(future) for future in cls.pending_enrichments]
+        if not pending:
+            return 0
+        _, unfinished = await asyncio.wait(pending, timeout=timeout)
+        return len(unfinished)
 
     def get_public_snippet_by_id(self, snippet_id: int):
         """
@@ -110,31 +392,41 @@ class Snippets(Database):
             dict: Success status and snippet data or error message.
         """
         try:
-            self.cursor.execute(
-                "SELECT id, title, content, language, favourite, created_at, tags "
-                "FROM code_snippets WHERE id = %s AND is_public = TRUE",
-                (snippet_id,),
-            )
+            self.execute("get_public_snippet_by_id", (snippet_id,))
             row = self.cursor.fetchone()
             if row is None:
                 return {"success": False, "error": "Snippet not found or not public"}
 
-            id, title, content, language, favourite, created_at, tags = row
+            return {"success": True, "snippet": self.row_to_snippet(row)}
 
-            decrypted_tags = self.encryptor.decrypt(tags)
-            parsed_tags = self.convert_tags(decrypted_tags)
-
-            snippet = {
-                "id": id,
-                "title": self.encryptor.decrypt(title),
-                "content": self.encryptor.decrypt(content),
-                "language": self.encryptor.decrypt(language),
-                "favourite": self.encryptor.decrypt(favourite) == "true",
-                "created_at": created_at,
-                "tags": parsed_tags,
-                "is_public": True,  # Public snippets are always public
+        except psycopg2.Error as error:
+            return {
+                "success": False,
+                "error": f"Error fetching snippet: {str(error)}",
+            }
+
+    def get_snippet_by_id(self, snippet_id: int):
+        """
+        Fetch a snippet the caller may see, public or owned, in a single query.
+        Anonymous callers use user_id 0, which only matches public snippets.
+
+        Args:
+            snippet_id (int): The ID of the snippet to fetch.
+
+        Returns:
+            dict: Success status, snippet data and whether the caller owns it, or error message.
+        """
+        try:
+            self.execute("get_snippet_by_id", (self.user_id, snippet_id, self.user_id))
+            row = self.cursor.fetchone()
+            if row is None:
+                return {"success": False, "error": "Snippet not found"}
+
+            return {
+                "success": True,
+                "snippet": self.row_to_snippet(row[:-1]),
+                "owned": row[-1],
             }
-            return {"success": True, "snippet": snippet}
 
         except psycopg2.Error as error:
             return {
@@ -154,11 +446,7 @@ class Snippets(Database):
         """
         try:
             # First check if the snippet belongs to this user
-            self.cursor.execute(
-                "SELECT id, title, content, language, favourite, created_at, tags, is_public "
-                "FROM code_snippets WHERE id = %s AND user_id = %s",
-                (snippet_id, self.user_id),
-            )
+            self.execute("get_user_snippet_by_id", (snippet_id, self.user_id))
             row = self.cursor.fetchone()
             if row is None:
                 return {
@@ -166,22 +454,7 @@ class Snippets(Database):
                     "error": "Snippet not found or not owned by user",
                 }
 
-            id, title, content, language, favourite, created_at, tags, is_public = row
-
-            decrypted_tags = self.encryptor.decrypt(tags)
-            parsed_tags = self.convert_tags(decrypted_tags)
-
-            snippet = {
-                "id": id,
-                "title": self.encryptor.decrypt(title),
-                "content": self.encryptor.decrypt(content),
-                "language": self.encryptor.decrypt(language),
-                "favourite": self.encryptor.decrypt(favourite) == "true",
-                "created_at": created_at,
-                "tags": parsed_tags,
-                "is_public": is_public,
-            }
-            return {"success": True, "snippet": snippet}
+            return {"success": True, "snippet": self.row_to_snippet(row)}
 
         except psycopg2.Error as error:
             return {
@@ -202,23 +475,19 @@ class Snippets(Database):
     ):
         new_title = title if title else "Untitled Snippet"
         try:
-            json_tags = json.dumps(tags or [])
-            encrypted_tags = self.encryptor.encrypt(json_tags)
+            columns = self.write_meta(new_title, language, favourite, tags)
+            columns.update(self.write_content(content))
+            columns.update({"user_id": self.user_id, "is_public": is_public})
 
+            self.lock_revisions()
             self.cursor.execute(
-                "INSERT INTO code_snippets (title, content, language, user_id, favourite, tags, is_public) "
-                "VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id",
-                (
-                    self.encryptor.encrypt(new_title),
-                    self.encryptor.encrypt(content),
-                    self.encryptor.encrypt(language),
-                    self.user_id,
-                    self.encryptor.encrypt(str(favourite).lower()),
-                    encrypted_tags,
-                    is_public,
-                ),
+                f"INSERT INTO code_snippets ({', '.join(columns)}) "
+                f"VALUES ({', '.join(['%s'] * len(columns))}) "
+                "RETURNING id, created_at, revision",
+                tuple(columns.values()),
             )
-            snippet_id = self.cursor.fetchone()[0]
+            returned = self.cursor.fetchone()
+            snippet_id = returned[0]
             self.connection.commit()
 
             if ai_usage:
@@ -231,56 +500,100 @@ class Snippets(Database):
                     tags,
                 )
 
-            return {"success": True, "message": "Snippet created successfully!"}
+            return {
+                "success": True,
+                "message": "Snippet created successfully!",
+                "snippet": self.written_snippet(
+                    returned, new_title, content, language, favourite, tags, is_public
+                ),
+            }
         except psycopg2.IntegrityError as error:
             self.connection.rollback()
             return {"success": False, "error": str(error)}
 
     @require_auth
-    def get_snippets(self):
+    def get_snippets(self, include_content=True):
+        """
+        Fetch all of the current user's snippets.
+
+        Args:
+            include_content (bool): Decrypt and return each snippet's content. List views
+                that only need metadata can skip it.
+
+        Returns:
+            dict: Success status and list of snippets or error message.
+        """
         try:
-            self.cursor.execute(
-                "SELECT id, title, content, language, favourite, created_at, tags, is_public FROM code_snippets WHERE user_id = %s",
-                (self.user_id,),
-            )
+            self.execute("get_snippets", (self.user_id,))
             data = self.cursor.fetchall()
-            snippets = []
-            for row in data:
-                id, title, content, language, favourite, created_at, tags, is_public = (
-                    row
-                )
-
-                try:
-                    decrypted_tags = self.encryptor.decrypt(tags)
-                    parsed_tags = self.convert_tags(decrypted_tags)
-                except Exception as e:
-                    print("Tag parsing failed:", e)
-                    parsed_tags = []
-
-                snippet = {
-                    "id": id,
-                    "title": self.encryptor.decrypt(title),
-                    "content": self.encryptor.decrypt(content),
-                    "language": self.encryptor.decrypt(language),
-                    "favourite": self.encryptor.decrypt(favourite) == "true",
-                    "created_at": created_at,
-                    "tags": parsed_tags,
-                    "is_public": is_public if is_public is not None else False,
-                }
-                snippets.append(snippet)
-            return {"success": True, "snippets": snippets}
+            snippets = self.rows_to_snippets(data, include_content)
+            cursor = max((snippet["revision"] for snippet in snippets), default=0)
+            return {"success": True, "snippets": snippets, "cursor": cursor}
         except psycopg2.Error as error:
             self.connection.rollback()
             print("Error fetching snippets:", error)
             return {"success": False, "error": f"Error fetching snippets: {str(error)}"}
 
     @require_auth
-    def delete_snippet(self, snippet_id):
+    def get_changes(self, since=0, include_content=True):
+        """
+        Fetch the current user's snippets written, and the ids deleted, after a revision.
+
+        A cursor from before the tombstone horizon (see maintenance/prune_tombstones.py)
+        may have missed deletes that are no longer recorded, so the client gets every
+        snippet instead, with reset set, and must replace its local state.
+
+        Args:
+            since (int): The cursor returned by the client's previous sync (0 for everything).
+            include_content (bool): Decrypt and return each changed snippet's content.
+
+        Returns:
+            dict: Success status, changed snippets, deleted ids, whether the client must
+            reset, and the cursor for the next sync, or error message.
+        """
         try:
+            # The horizon, changed rows and tombstones must come from one snapshot: read
+            # one by one, writes committed in between could advance the cursor past a
+            # change the client never received
             self.cursor.execute(
-                "DELETE FROM code_snippets WHERE id = %s AND user_id = %s",
-                (snippet_id, self.user_id),
+                "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY"
             )
+            reset = False
+            if since:
+                self.execute("get_sync_horizon")
+                horizon = self.cursor.fetchone()
+                if horizon is not None and since < horizon[0]:
+                    since, reset = 0, True
+
+            self.execute("get_changed_snippets", (self.user_id, since))
+            snippets = self.rows_to_snippets(self.cursor.fetchall(), include_content)
+
+            self.execute("get_deleted_snippets", (self.user_id, since))
+            tombstones = self.cursor.fetchall()
+            self.connection.commit()  # End the snapshot
+
+            cursor = max(
+                [since]
+                + [snippet["revision"] for snippet in snippets]
+                + [revision for _, revision in tombstones]
+            )
+            return {
+                "success": True,
+                "snippets": snippets,
+                "deleted": [snippet_id for snippet_id, _ in tombstones],
+                "reset": reset,
+                "cursor": cursor,
+            }
+        except psycopg2.Error as error:
+            self.connection.rollback()
+            return {"success": False, "error": f"Error fetching changes: {str(error)}"}
+
+    @require_auth
+    def delete_snippet(self, snippet_id):
+        try:
+            # Delete and leave a tombstone for delta sync in the same statement
+            self.lock_revisions()
+            self.execute("delete_snippet", (snippet_id, self.user_id))
 
             if self.cursor.rowcount > 0:
                 self.connection.commit()
@@ -307,51 +620,173 @@ class Snippets(Database):
         favourite=False,
     ):
         try:
-            self.cursor.execute(
-                "SELECT id FROM code_snippets WHERE id = %s AND user_id = %s",
-                (snippet_id, self.user_id),
+            new_title = title if title else "Untitled Snippet"
+
+            columns = self.write_meta(new_title, language, favourite, tags)
+            columns.update(self.write_content(content))
+            columns["is_public"] = is_public
+            returned = self.update_columns(
+                snippet_id, columns, returning="id, created_at, revision"
             )
-            if not self.cursor.fetchone():
+            if returned is None:
+                self.connection.rollback()
                 return {
                     "success": False,
                     "error": "Snippet not found or not owned by user",
                 }
 
-            new_title = title if title else "Untitled Snippet"
+            self.connection.commit()
+            return {
+                "success": True,
+                "message": "Snippet updated successfully!",
+                "snippet": self.written_snippet(
+                    returned, new_title, content, language, favourite, tags, is_public
+                ),
+            }
 
-            json_tags = json.dumps(tags or [])
-            encrypted_tags = self.encryptor.encrypt(json_tags)
+        except psycopg2.Error as error:
+            self.connection.rollback()
+            return {"success": False, "error": str(error)}
 
-            self.cursor.execute(
-                "UPDATE code_snippets SET title = %s, content = %s, language = %s, tags = %s, is_public = %s, favourite = %s "
-                "WHERE id = %s AND user_id = %s",
-                (
-                    self.encryptor.encrypt(new_title),
-                    self.encryptor.encrypt(content),
-                    self.encryptor.encrypt(language),
-                    encrypted_tags,
-                    is_public,
-                    self.encryptor.encrypt(str(favourite).lower()),
-                    snippet_id,
-                    self.user_id,
-                ),
-            )
+    @require_auth
+    def run_batch(self, operations):
+        """
+        Apply many delete, favourite and visibility operations in one transaction, with one
+        set-based statement per kind of operation.
 
-            self.connection.commit()
-            return {"success": True, "message": "Snippet updated successfully!"}
+        Args:
+            operations (list): Dicts with "op" ("delete", "favourite" or "visibility"), "id"
+                and, except for deletes, a boolean "value".
+
+        Returns:
+            dict: Success status and one result per operation, in request order, or error
+            message if the transaction was rolled back.
+        """
+        deletes = {item["id"] for item in operations if item["op"] == "delete"}
+        favourites = {
+            item["id"]: item["value"]
+            for item in operations
+            if item["op"] == "favourite" and item["id"] not in deletes
+        }
+        visibility = {
+            item["id"]: item["value"]
+            for item in operations
+            if item["op"] == "visibility" and item["id"] not in deletes
+        }
+        revisions = {}
+
+        try:
+            self.lock_revisions()
+            if deletes:
+                # Delete and leave tombstones for delta sync in the same statement
+                self.cursor.execute(
+                    "WITH deleted AS ("
+                    "DELETE FROM code_snippets WHERE id = ANY(%s) AND user_id = %s "
+                    "RETURNING id, user_id) "
+                    "INSERT INTO snippet_tombstones (snippet_id, user_id) "
+                    "SELECT id, user_id FROM deleted RETURNING snippet_id, revision",
+                    (list(deletes), self.user_id),
+                )
+                revisions.update({("delete", id): rev for id, rev in self.cursor})
+
+            for value in (True, False):
+                ids = [id for id, is_public in visibility.items() if is_public == value]
+                if ids:
+                    self.cursor.execute(
+                        "UPDATE code_snippets SET is_public = %s, "
+                        "revision = nextval('code_snippets_revision_seq'), "
+                        "updated_at = now() "
+                        "WHERE id = ANY(%s) AND user_id = %s RETURNING id, revision",
+                        (value, ids, self.user_id),
+                    )
+                    revisions.update(
+                        {("visibility", id): rev for id, rev in self.cursor}
+                    )
+
+            if favourites:
+                revisions.update(
+                    {
+                        ("favourite", id): rev
+                        for id, rev in self.set_favourites(favourites)
+                    }
+                )
 
+            self.connection.commit()
         except psycopg2.Error as error:
             self.connection.rollback()
             return {"success": False, "error": str(error)}
 
+        results = []
+        for item in operations:
+            op = item["op"]
+            if op != "delete" and item["id"] in deletes:
+                op = "delete"  # Superseded by a delete of the same snippet
+            result = {"id": item["id"], "op": item["op"]}
+            if (op, item["id"]) in revisions:
+                result.update(success=True, revision=revisions[(op, item["id"])])
+            else:
+                result.update(
+                    success=False, error="Snippet not found or not owned by user"
+                )
+            results.append(result)
+        return {"success": True, "results": results}
+
+    def set_favourites(self, favourites):
+        """
+        Set the favourite flag of several snippets with a single UPDATE. Each row still gets
+        its own ciphertext; legacy rows only have their favourite token replaced.
+
+        Args:
+            favourites (dict): Snippet ID to new favourite value.
+
+        Returns:
+            list: (id, revision) for each snippet that was updated.
+        """
+        self.cursor.execute(
+            "SELECT id, title, language, favourite, tags, meta FROM code_snippets "
+            "WHERE id = ANY(%s) AND user_id = %s FOR UPDATE",
+            (list(favourites), self.user_id),
+        )
+        values = []
+        for id, title, language, favourite, tags, meta in self.cursor.fetchall():
+            if meta is None and not self.compact_rows:
+                columns = {
+                    "title": title,
+                    "language": language,
+                    "favourite": self.encryptor.encrypt(str(favourites[id]).lower()),
+                    "tags": tags,
+                    "meta": None,
+                }
+            else:
+                current = self.read_meta(title, language, favourite, tags, meta)
+                columns = self.write_meta(
+                    current["title"],
+                    current["language"],
+                    favourites[id],
+                    current["tags"],
+                )
+            values.append((id, *columns.values()))
+
+        if not values:
+            return []
+        query = sql.SQL(
+            "UPDATE code_snippets AS s SET title = v.title, language = v.language, "
+            "favourite = v.favourite, tags = v.tags, meta = v.meta, "
+            "revision = nextval('code_snippets_revision_seq'), updated_at = now() "
+            "FROM (VALUES %s) AS v (id, title, language, favourite, tags, meta) "
+            "WHERE s.id = v.id AND s.user_id = {} RETURNING s.id, s.revision"
+        ).format(sql.Literal(self.user_id))
+        # Cast explicitly: a VALUES column that is all NULL would otherwise be text
+        template = "(%s, %s::bytea, %s::bytea, %s::bytea, %s::bytea, %s::bytea)"
+        return psycopg2.extras.execute_values(
+            self.cursor, query, values, template=template, fetch=True
+        )
+
     @require_auth
     def toggle_favorite(self, snippet_id):
         try:
             # First, get the current favorite status
-            self.cursor.execute(
-                "SELECT favourite FROM code_snippets WHERE id = %s AND user_id = %s",
-                (snippet_id, self.user_id),
-            )
+            self.execute("get_snippet_meta", (snippet_id, self.user_id))
             row = self.cursor.fetchone()
             if not row:
                 return {
@@ -359,18 +794,24 @@ class Snippets(Database):
                     "error": "Snippet not found or not owned by user",
                 }
 
-            current_favourite = self.encryptor.decrypt(row[0]) == "true"
-            new_favourite = not current_favourite
+            title, language, favourite, tags, meta = row
+            if meta is None and not self.compact_rows:
+                # Legacy row: update only the favourite field
+                new_favourite = self.encryptor.decrypt(favourite) != "true"
+                columns = {
+                    "favourite": self.encryptor.encrypt(str(new_favourite).lower())
+                }
+            else:
+                current = self.read_meta(title, language, favourite, tags, meta)
+                new_favourite = not current["favourite"]
+                columns = self.write_meta(
+                    current["title"],
+                    current["language"],
+                    new_favourite,
+                    current["tags"],
+                )
 
-            # Update only the favourite field
-            self.cursor.execute(
-                "UPDATE code_snippets SET favourite = %s WHERE id = %s AND user_id = %s",
-                (
-                    self.encryptor.encrypt(str(new_favourite).lower()),
-                    snippet_id,
-                    self.user_id,
-                ),
-            )
+            self.update_columns(snippet_id, columns)
 
             self.connection.commit()
             return {
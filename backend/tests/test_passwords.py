@@ -0,0 +1,52 @@
+import hashlib
+
+import pytest
+
+from auth.passwords import PasswordHasher
+
+
+@pytest.fixture
+def hasher(monkeypatch):
+    """A cheap PasswordHasher that counts its KDF runs."""
+    hasher = PasswordHasher(log_n=4)
+    hasher.kdf_calls = 0
+    derive = hasher.derive
+
+    def counting_derive(*args):
+        hasher.kdf_calls += 1
+        return derive(*args)
+
+    monkeypatch.setattr(hasher, "derive", counting_derive)
+    return hasher
+
+
+def test_legacy_mismatch_runs_the_kdf(hasher):
+    legacy = hashlib.sha256(b"correct").hexdigest()
+
+    assert hasher.verify("wrong", legacy) == (False, True)
+    assert hasher.kdf_calls == 1
+
+
+def test_scrypt_mismatch_runs_the_kdf(hasher):
+    stored = hasher.hash("correct")
+    hasher.kdf_calls = 0
+
+    assert hasher.verify("wrong", stored) == (False, False)
+    assert hasher.kdf_calls == 1
+
+
+def test_unknown_user_dummy_hash_runs_the_kdf(hasher):
+    assert hasher.verify("anything", hasher.dummy_hash()) == (False, False)
+    assert hasher.kdf_calls == 1
+
+
+@pytest.mark.parametrize("stored", [None, "scrypt$broken", "bcrypt$ln=4,r=8,p=1$AA$AA"])
+def test_unusable_hash_runs_the_kdf(hasher, stored):
+    assert hasher.verify("anything", stored) == (False, False)
+    assert hasher.kdf_calls == 1
+
+
+def test_legacy_match_needs_rehash(hasher):
+    legacy = hashlib.sha256(b"correct").hexdigest()
+
+    assert hasher.verify("correct", legacy) == (True, True)
@@ -0,0 +1,239 @@
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+
+# Off unless metrics_enabled is "true"; span() is then a shared no-op context manager
+enabled = os.getenv("metrics_enabled", "false").lower() == "true"
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+NOOP = nullcontext()
+
+# Stage timings of the request being handled: {stage: [seconds, calls]}
+current_trace = contextvars.ContextVar("current_trace", default=None)
+lock = threading.Lock()
+
+
+class Histogram:
+    """Cumulative latency histogram in Prometheus' bucket layout."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # The last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        with lock:
+            self.counts[bisect_left(BUCKETS, seconds)] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ("+Inf",), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+request_histograms = {}  # (method, route) -> Histogram
+request_counts = {}  # (method, route, status) -> int
+stage_histograms = {}  # stage -> Histogram
+
+
+def histogram(table, key):
+    found = table.get(key)
+    if found is None:
+        with lock:
+            found = table.setdefault(key, Histogram())
+    return found
+
+
+class Span:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        histogram(stage_histograms, self.stage).observe(elapsed)
+        trace = current_trace.get()
+        if trace is not None:
+            with lock:
+                totals = trace.setdefault(self.stage, [0.0, 0])
+                totals[0] += elapsed
+                totals[1] += 1
+        return False
+
+
+def span(stage):
+    """
+    Time a block as one call of a stage (db, crypto, ai, ratelimit, ...). The time counts
+    towards the current request's Server-Timing header and the stage's histogram.
+
+    Usage:
+        with span("crypto"):
+            ...
+    """
+    if not enabled:
+        return NOOP
+    return Span(stage)
+
+
+def start_trace():
+    """
+    Begin collecting stage timings for the current request.
+
+    Returns:
+        The context token to pass to end_trace().
+    """
+    return current_trace.set({})
+
+
+def end_trace(token):
+    current_trace.reset(token)
+
+
+def server_timing(trace, total):
+    """
+    Returns:
+        str: A Server-Timing header value with each stage's total and the request total.
+    """
+    entries = [
+        f'{stage};dur={seconds * 1000:.2f};desc="{calls} calls"'
+        for stage, (seconds, calls) in trace.items()
+    ]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+def record_request(method, route, status, seconds):
+    histogram(request_histograms, (method, route)).observe(seconds)
+    key = (method, route, status)
+    with lock:
+        request_counts[key] = request_counts.get(key, 0) + 1
+
+
+def render_prometheus(
+    query_stats=None, pool_stats=None, admission_stats=None, singleflight_stats=None
+):
+    """
+    Returns:
+        str: Every metric in the Prometheus text exposition format.
+    """
+    lines = [
+        "# HELP codenest_request_duration_seconds Request latency by route.",
+        "# TYPE codenest_request_duration_seconds histogram",
+    ]
+    for (method, route), found in sorted(request_histograms.items()):
+        labels = f'method="{method}",route="{route}"'
+        lines += found.render("codenest_request_duration_seconds", labels)
+
+    lines += [
+        "# HELP codenest_requests_total Requests by route and status code.",
+        "# TYPE codenest_requests_total counter",
+    ]
+    for (method, route, status), count in sorted(request_counts.items()):
+        lines.append(
+            f'codenest_requests_total{{method="{method}",route="{route}",'
+            f'status="{status}"}} {count}'
+        )
+
+    lines += [
+        "# HELP codenest_stage_duration_seconds Time spent per call in each stage.",
+        "# TYPE codenest_stage_duration_seconds histogram",
+    ]
+    for stage, found in sorted(stage_histograms.items()):
+        lines += found.render("codenest_stage_duration_seconds", f'stage="{stage}"')
+
+    if query_stats:
+        lines += [
+            "# HELP codenest_query_calls_total Executions of each registered query.",
+            "# TYPE codenest_query_calls_total counter",
+            "# HELP codenest_query_seconds_total Time spent executing each query.",
+            "# TYPE codenest_query_seconds_total counter",
+            "# HELP codenest_query_prepare_seconds_total Time spent preparing each query.",
+            "# TYPE codenest_query_prepare_seconds_total counter",
+        ]
+        for name, stats in sorted(query_stats.items()):
+            labels = f'query="{name}"'
+            lines.append(f"codenest_query_calls_total{{{labels}}} {stats['calls']}")
+            lines.append(
+                f"codenest_query_seconds_total{{{labels}}} {stats['total_ms'] / 1000:.6f}"
+            )
+            lines.append(
+                f"codenest_query_prepare_seconds_total{{{labels}}} "
+                f"{stats['prepare_ms'] / 1000:.6f}"
+            )
+
+    if pool_stats:
+        lines += [
+            "# HELP codenest_offload_workers Workers in each offload pool.",
+            "# TYPE codenest_offload_workers gauge",
+            "# HELP codenest_offload_in_flight Calls running or queued on each pool.",
+            "# TYPE codenest_offload_in_flight gauge",
+            "# HELP codenest_offload_queued Calls waiting for a free worker.",
+            "# TYPE codenest_offload_queued gauge",
+            "# HELP codenest_offload_completed_total Calls each pool has finished.",
+            "# TYPE codenest_offload_completed_total counter",
+        ]
+        for name, stats in sorted(pool_stats.items()):
+            labels = f'pool="{name}"'
+            lines.append(f"codenest_offload_workers{{{labels}}} {stats['workers']}")
+            lines.append(f"codenest_offload_in_flight{{{labels}}} {stats['in_flight']}")
+            lines.append(f"codenest_offload_queued{{{labels}}} {stats['queued']}")
+            lines.append(
+                f"codenest_offload_completed_total{{{labels}}} {stats['completed']}"
+            )
+
+    if admission_stats:
+        lines += [
+            "# HELP codenest_admission_limit Current concurrency limit per route class.",
+            "# TYPE codenest_admission_limit gauge",
+            "# HELP codenest_admission_in_flight Requests running per route class.",
+            "# TYPE codenest_admission_in_flight gauge",
+            "# HELP codenest_admission_queued Requests waiting for a slot.",
+            "# TYPE codenest_admission_queued gauge",
+            "# HELP codenest_admission_rejected_total Requests shed with a 503.",
+            "# TYPE codenest_admission_rejected_total counter",
+            "# HELP codenest_admission_latency_seconds Recent and baseline response "
+            "time per route class.",
+            "# TYPE codenest_admission_latency_seconds gauge",
+        ]
+        for name, stats in sorted(admission_stats.items()):
+            labels = f'route_class="{name}"'
+            lines.append(f"codenest_admission_limit{{{labels}}} {stats['limit']}")
+            lines.append(
+                f"codenest_admission_in_flight{{{labels}}} {stats['in_flight']}"
+            )
+            lines.append(f"codenest_admission_queued{{{labels}}} {stats['queued']}")
+            lines.append(
+                f"codenest_admission_rejected_total{{{labels}}} {stats['rejected']}"
+            )
+            for kind, key in (("recent", "latency"), ("baseline", "baseline_latency")):
+                lines.append(
+                    f'codenest_admission_latency_seconds{{{labels},kind="{kind}"}} '
+                    f"{stats[key]:.6f}"
+                )
+
+    if singleflight_stats:
+        lines += [
+            "# HELP codenest_singleflight_calls_total Coalesced reads that ran or shared a call.",
+            "# TYPE codenest_singleflight_calls_total counter",
+            "# HELP codenest_singleflight_in_flight Reads running that others can join.",
+            "# TYPE codenest_singleflight_in_flight gauge",
+            f'codenest_singleflight_calls_total{{result="started"}} {singleflight_stats["started"]}',
+            f'codenest_singleflight_calls_total{{result="shared"}} {singleflight_stats["shared"]}',
+            f"codenest_singleflight_in_flight {singleflight_stats['in_flight']}",
+        ]
+    return "\n".join(lines) + "\n"
@@ -27,15 +27,10 @@ function SnippetView() {
     
     const fetchSnippet = async () => {
       try {
-        // First, try the public endpoint
-        let response = await fetch(`${API_URL}/get_public_snippet/${snippetId}`);
-        
-        // If public route fails and user is logged in, try user endpoint
-        if (!response.ok && token) {
-          response = await fetch(`${API_URL}/get_user_snippet/${snippetId}`, {
-            headers: { Authorization: `Bearer ${token}` }
-          });
-        }
+        // One request resolves both public snippets and the user's own private ones
+        const response = await fetch(`${API_URL}/snippets/${snippetId}`, {
+          headers: token ? { Authorization: `Bearer ${token}` } : {}
+        });
         
         if (response.status === 429) {
           const data = await response.json();
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { Navigate, Link } from 'react-router-dom';
 import { FaUserCircle } from "react-icons/fa";
 import { Prism as SyntaxHighlighter } from 'react-syntax-highlighter';
@@ -28,7 +28,59 @@ export default function Snippets() {
   const [showFavoritesOnly, setShowFavoritesOnly] = useState(false);
   const [sortOrder, setSortOrder] = useState('desc'); 
   const API_URL = import.meta.env.VITE_API_URL;
+  const syncCursor = useRef(0); // Revision of the newest change already in state
+  const syncing = useRef(false);
+  const syncChangesRef = useRef(null); // Latest syncChanges, for the focus and interval listeners
+  const SYNC_INTERVAL_MS = 60000;
+
+  // Fetch only what changed since the last sync and merge it into local state
+  const syncChanges = async () => {
+    if (syncing.current) return;
+    syncing.current = true;
+    try {
+      await fetchChanges();
+    } catch (error) {
+      console.error("Error syncing snippets:", error);
+    } finally {
+      syncing.current = false;
+    }
+  };
+  syncChangesRef.current = syncChanges;
+
+  const fetchChanges = async () => {
+    const resp = await fetch(`${API_URL}/snippets/changes?since=${syncCursor.current}`, {
+      headers: { Authorization: `Bearer ${token}` }
+    });
+
+    // Check for token expiry
+    if (resp.status === 401) {
+      handleTokenExpiry();
+      return;
+    }
+
+    if (resp.ok) {
+      const changes = await resp.json();
+      if (changes.success && Array.isArray(changes.snippets)) {
+        const changedIds = new Set(changes.snippets.map(s => s.id));
+        const deletedIds = new Set(changes.deleted);
+        // reset: the cursor predates pruned deletes, so the server sent everything
+        setSnippets(snippets => sortSnippets([
+          ...(changes.reset ? [] : snippets.filter(s => !changedIds.has(s.id) && !deletedIds.has(s.id))),
+          ...changes.snippets
+        ]));
+        syncCursor.current = changes.cursor;
+      }
+    }
+  };
   
+  // Put a snippet returned by a create or edit straight into local state
+  const upsertSnippet = (snippet) => {
+    setSnippets(snippets => sortSnippets([
+      ...snippets.filter(s => s.id !== snippet.id),
+      snippet
+    ]));
+  };
+
   const snippetSubmit = async (snippetData) => {
     try {
       const response = await fetch(`${API_URL}/create_snippet`, {
@@ -64,21 +116,10 @@ export default function Snippets() {
       
       if (data.success) {
         setAlertMessage("Snippet created successfully!");
-        const resp = await fetch(`${API_URL}/get_snippets`, {
-          headers: { Authorization: `Bearer ${token}` }
-        });
-        
-        // Check for token expiry
-        if (resp.status === 401) {
-          handleTokenExpiry();
-          return;
-        }
-        
-        if (resp.ok) {
-          const refreshData = await resp.json();
-          if (refreshData.success && Array.isArray(refreshData.snippets)) {
-            setSnippets(sortSnippets(refreshData.snippets));
-          }
+        if (data.snippet) {
+          upsertSnippet(data.snippet);
+        } else {
+          await syncChanges();
         }
       } else {
         setAlertMessage(data.error || data.detail || "Failed to create snippet.");
@@ -131,21 +172,10 @@ export default function Snippets() {
       
       if (data.success) {
         setAlertMessage("Snippet updated successfully!");
-        const resp = await fetch(`${API_URL}/get_snippets`, {
-          headers: { Authorization: `Bearer ${token}` }
-        });
-        
-        // Check for token expiry
-        if (resp.status === 401) {
-          handleTokenExpiry();
-          return;
-        }
-        
-        if (resp.ok) {
-          const refreshData = await resp.json();
-          if (refreshData.success && Array.isArray(refreshData.snippets)) {
-            setSnippets(sortSnippets(refreshData.snippets));
-          }
+        if (data.snippet) {
+          upsertSnippet(data.snippet);
+        } else {
+          await syncChanges();
         }
       } else {
 
@@ -356,6 +386,7 @@ export default function Snippets() {
         if (data.success && Array.isArray(data.snippets)) {
           // Sort snippets after fetching
           setSnippets(sortSnippets(data.snippets));
+          syncCursor.current = data.cursor || 0;
         } else {
           console.warn("Unexpected payload shape:", data);
           setSnippets([]);
@@ -377,6 +408,24 @@ export default function Snippets() {
     })();
   }, [token]);
 
+  // Pick up changes made in other tabs and on other devices when the page regains focus,
+  // and periodically while it is visible
+  useEffect(() => {
+    if (!token || loading) return;
+
+    const syncIfVisible = () => {
+      if (document.visibilityState === 'visible') syncChangesRef.current();
+    };
+    const interval = setInterval(syncIfVisible, SYNC_INTERVAL_MS);
+    window.addEventListener('focus', syncIfVisible);
+    document.addEventListener('visibilitychange', syncIfVisible);
+    return () => {
+      clearInterval(interval);
+      window.removeEventListener('focus', syncIfVisible);
+      document.removeEventListener('visibilitychange', syncIfVisible);
+    };
+  }, [token, loading]);
+
   if (!token) {
     return <Navigate to="/" replace />;
   }